@@ -1,7 +1,20 @@
+import hashlib
 from flask_admin import AdminIndexView
 from flask_admin.contrib.sqla import ModelView
-from flask import session, redirect, url_for
+from flask_admin.contrib.sqla.filters import BooleanEqualFilter, DateTimeBetweenFilter, DateTimeGreaterFilter, DateTimeSmallerFilter, FilterEqual, IntEqualFilter
+from flask import current_app, flash, g, session, redirect, url_for
+from sqlalchemy import and_, func, literal_column, or_, text
+from sqlalchemy.orm import Query, joinedload
 from models.models import *
+from services.allocation import allocator
+from services.availability import publish_lot
+from services.bookings import booking_index
+from services.cache import ADMIN, ANALYTICS, LOTS, RESERVATIONS, cache
+from services.occupancy import reset_occupancy
+from services.provisioning import provision_spots, resize_lot
+from services.rollups import record_releases
+from services.settlement import notify_settlement, release_reservation
+from services.user_cache import user_cache
 
 
 
@@ -16,12 +29,123 @@ class MyAdminIndexView(AdminIndexView):
         return redirect(url_for('routes_bp.login'))
 
 class SecureModelView(ModelView):
+    # Cache namespaces dropped whenever a row is changed or deleted here
+    cache_namespaces  =  ()
+
     def is_accessible(self):
         return session.get('is_admin', False)
 
     def inaccessible_callback(self, name):
         return redirect(url_for('routes_bp.login'))
 
+    def after_model_change(self, form, model, is_created):
+        cache.invalidate(ADMIN, *self.cache_namespaces)
+
+    def after_model_delete(self, model):
+        cache.invalidate(ADMIN, *self.cache_namespaces)
+
+
+class CachedCountQuery(Query):
+    # Flask-Admin only adds search/filter joins and criteria to the count
+    # query and then calls scalar(), so that is where the count is capped
+    # and cached.
+    admin_view  =  None
+
+    def scalar(self):
+        compiled  =  self.statement.compile()
+        digest  =  hashlib.sha1(f"{compiled}{sorted(compiled.params.items())!r}".encode()).hexdigest()
+        return cache.get_or_set(
+            ADMIN, f"count:{self.admin_view.endpoint}:{digest}",
+            lambda: self.admin_view.count_rows(self),
+            current_app.config['ADMIN_COUNT_TTL']
+        )
+
+
+class LargeTableView(SecureModelView):
+    """List view for tables too big to COUNT and OFFSET through on every page.
+
+    Row counts stop at ADMIN_COUNT_LIMIT (PostgreSQL uses the planner's
+    estimate for the unfiltered table) and are cached for ADMIN_COUNT_TTL
+    seconds. When the list is ordered by a NOT NULL column of the model,
+    the last row of each page is remembered and the next page starts
+    after it (keyset paging) instead of skipping OFFSET rows; pages
+    reached any other way fall back to OFFSET. ``list_loader_options``
+    eager-loads the relationships shown in the list.
+    """
+    list_loader_options  =  ()
+    column_default_sort  =  ('id', True)
+
+    def get_query(self):
+        return super().get_query().options(*self.list_loader_options)
+
+    def get_count_query(self):
+        query  =  CachedCountQuery([literal_column('1')], self.session()).select_from(self.model)
+        query.admin_view  =  self
+        return query
+
+    def count_rows(self, query):
+        limit  =  current_app.config['ADMIN_COUNT_LIMIT']
+        if query.whereclause is None and db.engine.dialect.name == 'postgresql':
+            estimate  =  self.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+                {'name': self.model.__table__.name}
+            ).scalar()
+            if estimate and estimate > limit:
+                return estimate
+        return self.session.query(func.count()).select_from(query.limit(limit).subquery()).scalar()
+
+    def _keyset_column(self, sort_column, sort_desc):
+        if sort_column is None:
+            order  =  list(self._get_default_order())
+            if len(order) != 1:
+                return None
+            field, joins, sort_desc  =  order[0]
+        else:
+            field  =  self._sortable_columns.get(sort_column)
+            joins  =  self._sortable_joins.get(sort_column)
+        if joins or getattr(field, 'class_', None) is not self.model:
+            return None
+        column  =  field.expression
+        if column.nullable and not column.primary_key:
+            return None
+        return field, sort_desc
+
+    def _apply_pagination(self, query, page, page_size):
+        keyset  =  g.pop('admin_keyset', None)
+        if keyset is None:
+            return super()._apply_pagination(query, page, page_size)
+        field, descending, boundary  =  keyset
+        primary_key  =  getattr(self.model, self._primary_key)
+        if field is not primary_key:
+            # Break ties on the primary key so a page boundary is exact
+            query  =  query.order_by(primary_key.desc() if descending else primary_key)
+        if boundary is None:
+            return super()._apply_pagination(query, page, page_size)
+        value, last_key  =  boundary
+        if field is primary_key:
+            after  =  field < last_key if descending else field > last_key
+        elif descending:
+            after  =  or_(field < value, and_(field == value, primary_key < last_key))
+        else:
+            after  =  or_(field > value, and_(field == value, primary_key > last_key))
+        return query.filter(after).limit(page_size or self.page_size)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute = True, page_size = None):
+        keyset  =  self._keyset_column(sort_column, sort_desc) if execute else None
+        if keyset is None:
+            return super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+
+        field, descending  =  keyset
+        position  =  f"page:{self.endpoint}:{sort_column}:{sort_desc}:{search}:{filters!r}:{page_size or self.page_size}"
+        boundary  =  cache.get(ADMIN, f"{position}:{page - 1}") if page else None
+        g.admin_keyset  =  (field, descending, boundary)
+        count, data  =  super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+        if data:
+            last  =  data[-1]
+            cache.set(ADMIN, f"{position}:{page}", (getattr(last, field.key), getattr(last, self._primary_key)),
+                      current_app.config['ADMIN_COUNT_TTL'])
+        return count, data
+
 class UserAdmin(SecureModelView):
     column_list  =  ['id', 'email', 'name', 'is_admin']
     form_columns  =  ['email', 'name', 'phone', 'address', 'pincode', 'is_admin']
@@ -32,55 +156,59 @@ class UserAdmin(SecureModelView):
     column_searchable_list  =  ['id', 'email', 'name', 'phone', 'address', 'pincode']
     column_default_sort  =  'id'
 
+    def after_model_change(self, form, model, is_created):
+        super().after_model_change(form, model, is_created)
+        user_cache.invalidate(model.id)
+
+    def after_model_delete(self, model):
+        super().after_model_delete(model)
+        user_cache.invalidate(model.id)
+
 class ParkingLotAdmin(SecureModelView):
-    column_list  =  ['id', 'prime_location_name', 'max_spots', 'price_per_hour', 'address', 'pincode', 'is_active']
+    column_list  =  ['id', 'prime_location_name', 'max_spots', 'available_spots', 'price_per_hour', 'address', 'pincode', 'is_active']
+    form_excluded_columns  =  ['available_spots', 'reserved_spots']
     column_searchable_list = ['prime_location_name', 'address', 'pincode']
     column_sortable_list = ['id', 'prime_location_name', 'address', 'price_per_hour', 'is_active']
+    cache_namespaces  =  (LOTS, ANALYTICS)
     def on_model_change(self, form, model, is_created):
         db.session.flush()
 
         if is_created:
-            for i in range(1, model.max_spots + 1):
-                spot = ParkingSpot(id = f"L{model.id}_S{i}", lot_id = model.id)
-                db.session.add(spot)
+            provision_spots(model.id, range(1, model.max_spots + 1))
+            reset_occupancy(model)
 
         else:
-            old_spots = ParkingSpot.query.filter_by(lot_id = model.id).all()
-            old_spots_count = len(old_spots)
-            if old_spots_count != model.max_spots:
-                all_unreserved = True
-                for spot in old_spots:
-                    if spot.is_reserved:
-                        all_unreserved = False
-                        break
-                if not all_unreserved:
-                    raise ValueError("Cannot change max spots: some spots are currently reserved.")
-                
-                if all_unreserved:
-                    for spot in old_spots:
-                        db.session.delete(spot)
-                    db.session.flush()
-                    for i in range(1, model.max_spots + 1):
-                        new_spot = ParkingSpot(id = f"L{model.id}_S{i}", lot_id = model.id)
-                        db.session.add(new_spot)
+            resize_lot(model, model.max_spots)
             if model.is_active == False:
-                old_spots = ParkingSpot.query.filter_by(lot_id = model.id).all()
-                for spot in old_spots:
-                    if spot.is_reserved:
-                        all_unreserved = False
-                        break
-                if not all_unreserved:
-                    raise ValueError("Cannot change status: some spots are currently reserved.")
+                if Reservation.query.join(ParkingSpot).filter(ParkingSpot.lot_id == model.id).first():
+                    raise ValueError("Cannot change status: some spots are reserved or booked ahead.")
 
+    def after_model_change(self, form, model, is_created):
+        super().after_model_change(form, model, is_created)
+        allocator.reset(model.id)
+        booking_index.reset(model.id)
+        publish_lot(model)
 
+    def after_model_delete(self, model):
+        super().after_model_delete(model)
+        publish_lot(model, removed = True)
 
 
 
 
-class ParkingSpotAdmin(SecureModelView):
-    column_list  =  ['id', 'lot', 'is_reserved']
-    column_sortable_list = ['id', 'is_reserved']
-    column_searchable_list = ['lot.prime_location_name', 'id']
+
+
+class ParkingSpotAdmin(LargeTableView):
+    column_list  =  ['id', 'lot', 'spot_number', 'is_reserved']
+    column_sortable_list = ['id', 'spot_number']
+    column_filters  =  [
+        IntEqualFilter(ParkingSpot.lot_id, 'Lot id'),
+        IntEqualFilter(ParkingSpot.spot_number, 'Spot number'),
+        BooleanEqualFilter(ParkingSpot.is_reserved, 'Reserved'),
+    ]
+    column_default_sort  =  'id'
+    list_loader_options  =  (joinedload(ParkingSpot.lot),)
+    cache_namespaces  =  (LOTS,)
     can_edit = False
     can_create = False
     can_delete = False
@@ -94,14 +222,23 @@ class ParkingSpotAdmin(SecureModelView):
         }
     }
 
-class ReservationAdmin(SecureModelView):
+class ReservationAdmin(LargeTableView):
 
-    column_list  =  ['id', 'spot', 'user', 'parking_timestamp']
+    column_list  =  ['id', 'spot', 'spot.lot', 'user', 'vehicle_number', 'parking_timestamp']
+    column_labels  =  {'spot.lot': 'Lot'}
     # form_columns  =  ['spot', 'user', 'parking_timestamp']
     can_create  =  False
     can_edit  =  False
     can_delete  =  True
-    column_searchable_list = ['spot.lot.prime_location_name', 'id', 'user.name', 'user.email']
+    # Exact matches on indexed columns instead of a LIKE across three tables
+    column_sortable_list  =  ['id']
+    column_filters  =  [
+        FilterEqual(User.email, 'User email'),
+        IntEqualFilter(ParkingSpot.lot_id, 'Lot id'),
+        FilterEqual(Reservation.vehicle_number, 'Vehicle number'),
+    ]
+    list_loader_options  =  (joinedload(Reservation.spot).joinedload(ParkingSpot.lot), joinedload(Reservation.user))
+    cache_namespaces  =  (LOTS, RESERVATIONS)
     form_ajax_refs  =  {
         'spot': {
             'fields': ['lot_id'],
@@ -112,14 +249,40 @@ class ReservationAdmin(SecureModelView):
             'page_size': 10
         }
     }
-class PastReservationsAdmin(SecureModelView):
+
+    def delete_model(self, model):
+        # Deleting releases the reservation like the driver would: the spot
+        # is freed, the lot counters move and the stay is queued for billing
+        lot_id, spot_id, reservation_id  =  model.spot.lot_id, model.spot_id, model.id
+        if not release_reservation(model, model.user.email):
+            flash('This reservation was already released.', 'error')
+            return False
+        allocator.release(lot_id, spot_id)
+        booking_index.remove(lot_id, reservation_id)
+        notify_settlement(current_app)
+        self.after_model_delete(model)
+        return True
+
+class PastReservationsAdmin(LargeTableView):
     column_list = ['id', 'user_email', 'lot_prime_location', 'address', 'pincode', 'parking_timestamp', 'leaving_timestamp', 'vehicle_number']
-    column_sortable_list = ['id', 'user_email', 'lot_prime_location', 'address', 'parking_timestamp', 'leaving_timestamp', 'total_cost']
-    column_searchable_list = ['user_email', 'lot_prime_location', 'address', 'pincode']
+    # Only indexed columns are sortable and filterable
+    column_sortable_list = ['id', 'user_email', 'leaving_timestamp']
+    column_filters  =  [
+        FilterEqual(PastReservations.user_email, 'User email'),
+        IntEqualFilter(PastReservations.lot_id, 'Lot id'),
+        DateTimeBetweenFilter(PastReservations.leaving_timestamp, 'Left'),
+        DateTimeGreaterFilter(PastReservations.leaving_timestamp, 'Left'),
+        DateTimeSmallerFilter(PastReservations.leaving_timestamp, 'Left'),
+    ]
+    cache_namespaces  =  (RESERVATIONS, ANALYTICS)
     can_create  =  False
     can_edit  =  False
     can_delete  =  True
 
+    def on_model_delete(self, model):
+        # Take the row back out of the daily rollups, in the same commit
+        record_releases([model], sign = -1)
+
 
 
 
@@ -1,17 +1,38 @@
 from flask import Flask
 from flask_admin import Admin
+from werkzeug.middleware.proxy_fix import ProxyFix
 from admin.views import *
-from config import Config
-from routes import register_routes
+from config import get_config
+from routes import register_routes, routes_bp
+from commands import register_commands
 from models.models import *
+from services.availability import init_availability, start_availability_hub
+from services.bookings import booking_index
+from services.cache import cache
+from services.database import configure_engine
+from services.migrations import run_migrations
+from services.settlement import init_settlement
 
 
 
-def create_app():
+def create_app(config_name = None, **overrides):
     app  =  Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(get_config(config_name))
+    app.config.update(overrides)
+    if not app.config.get('SECRET_KEY'):
+        raise RuntimeError("SECRET_KEY is not set; export SECRET_KEY before starting the production server")
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app  =  ProxyFix(app.wsgi_app, x_for = app.config['PROXY_FIX_X_FOR'])
     db.init_app(app) 
+    configure_engine(app)
+    cache.init_app(app)
+    init_settlement(app)
+    init_availability(app)
     register_routes(app)
+    register_commands(app)
+    if app.config['INSTRUMENTATION_ENABLED']:
+        from services.instrumentation import init_instrumentation
+        init_instrumentation(app, routes_bp)
 
     # admin functionality
     admin  =  Admin(app, name = 'Admin Panel', template_mode = 'bootstrap3', index_view = MyAdminIndexView())
@@ -37,12 +58,20 @@ def create_admin_user():
         db.session.commit()
 
 
+# Schema migrations and seed data; run once per start, before serving.
+# The booking index loaded here is inherited by forked workers.
+def init_database(app):
+    with app.app_context():
+        run_migrations()
+        create_admin_user()
+        booking_index.rebuild()
+
+
 
 app = create_app()
 
 
 if __name__  ==  '__main__':
-    with app.app_context():
-        db.create_all() 
-        create_admin_user()
-    app.run(debug = True)
\ No newline at end of file
+    init_database(app)
+    start_availability_hub(app)
+    app.run(debug = app.config['DEBUG'])
\ No newline at end of file
@@ -0,0 +1,124 @@
+# Per-lot analytics over a large parking history: vectorized NumPy passes
+# vs. the same computation done row by row in Python
+#
+#   python -m benchmarks.analytics_benchmark --rows 10000000 --lots 200
+#   python -m benchmarks.analytics_benchmark --rows 1000000 --python-rows 200000
+#
+# Seeds --rows past reservations spread over a year, then times
+# lot_analytics for every summary range. The row-by-row baseline runs on the
+# first --python-rows rows of the 365 day window and is extrapolated.
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import insert
+from app import create_app
+from models.models import db, ParkingLot
+from services.analytics import _history_sources, _window, lot_analytics
+from services.migrations import run_migrations
+from services.rollups import SUMMARY_RANGES
+
+
+def seed(rows, lots, spots, chunk = 500000):
+    db.session.execute(insert(ParkingLot), [{
+        'id': n, 'prime_location_name': f"Bench Lot {n}", 'address': f"{n} Main Road", 'pincode': f"560{n % 1000:03d}",
+        'max_spots': spots, 'price_per_hour': 20 + n % 80, 'available_spots': spots, 'reserved_spots': 0,
+    } for n in range(1, lots + 1)])
+    db.session.commit()
+
+    # Rows go in through the DBAPI cursor: building 10M parameter dicts
+    # for a Core insert would take longer than the benchmark itself
+    generator = np.random.default_rng(42)
+    now = np.datetime64(datetime.now().replace(microsecond = 0), 's')
+    connection = db.session.connection()
+    for offset in range(0, rows, chunk):
+        size = min(chunk, rows - offset)
+        leaving = now - generator.integers(0, 365 * 24 * 3600, size).astype('timedelta64[s]')
+        parked = leaving - generator.integers(600, 12 * 3600, size).astype('timedelta64[s]')
+        lot_ids = generator.integers(1, lots + 1, size)
+        cost = (20 + lot_ids % 80) * (leaving - parked).astype(np.float64) / 3600
+        as_text = lambda values: np.char.replace(values.astype('U19'), 'T', ' ')
+        connection.exec_driver_sql(
+            "INSERT INTO past_reservations (user_email, lot_id, lot_prime_location, address, pincode, "
+            "parking_timestamp, leaving_timestamp, vehicle_number, total_cost) "
+            "VALUES ('bench@bench.local', ?, 'Bench Lot', 'Main Road', '560000', ?, ?, 'KA00', ?)",
+            list(zip(lot_ids.tolist(), as_text(parked).tolist(), as_text(leaving).tolist(), cost.tolist()))
+        )
+    db.session.commit()
+
+
+def python_analytics(days, limit):
+    # The per-row way: walk every interval hour by hour in Python
+    start, end = _window(days, date.today())
+    offset = (start - datetime(1970, 1, 1)).total_seconds() / 3600
+    hours = days * 24
+    occupied = defaultdict(lambda: [0.0] * hours)
+    releases, dwell, revenue = defaultdict(int), defaultdict(float), defaultdict(float)
+    count = 0
+    for query in _history_sources(start, end, None):
+        for lot_id, started, ended, cost in db.session.execute(query.limit(limit - count)):
+            count += 1
+            started, ended = started - offset, ended - offset
+            if 0 <= ended < hours:
+                releases[lot_id] += 1
+                dwell[lot_id] += ended - started
+                revenue[lot_id] += cost
+            hour, stop = max(started, 0), min(ended, hours)
+            while hour < stop:
+                bin_end = min(int(hour) + 1, stop)
+                occupied[lot_id][int(hour)] += bin_end - hour
+                hour = bin_end
+        if count >= limit:
+            break
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 1000000)
+    parser.add_argument('--lots', type = int, default = 200)
+    parser.add_argument('--spots', type = int, default = 100)
+    parser.add_argument('--python-rows', type = int, default = 100000, help = 'rows for the row-by-row baseline, 0 to skip')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app(SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database, DEBUG = False, CACHE_BACKEND = 'none')
+    with app.app_context():
+        run_migrations()
+        start = time.perf_counter()
+        seed(args.rows, args.lots, args.spots)
+        print(f"seeded {args.rows} past reservations over {args.lots} lots in {time.perf_counter() - start:.1f}s")
+
+        # Untimed pass so the first window is not charged for a cold page cache
+        lot_analytics(SUMMARY_RANGES[0])
+        for days in SUMMARY_RANGES:
+            start = time.perf_counter()
+            result = lot_analytics(days)
+            seconds = time.perf_counter() - start
+            rows = sum(lot['releases'] for lot in result['lots'])
+            print(f"{days:>4} days: {seconds:7.2f}s  {rows:>9} releases  {rows / seconds / 1e6:6.2f}M rows/s")
+
+        start = time.perf_counter()
+        lot_analytics(365, [1], series = True)
+        print(f"one lot, 365 days with hourly series: {time.perf_counter() - start:.2f}s")
+
+        if args.python_rows:
+            start = time.perf_counter()
+            count = python_analytics(365, args.python_rows)
+            seconds = time.perf_counter() - start
+            print(f"row-by-row Python baseline: {count} rows in {seconds:.2f}s ({count / seconds / 1e6:.2f}M rows/s, "
+                  f"~{seconds * args.rows / count:.0f}s for all rows)")
+
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# Booking lifecycle load test against the real app and test client
+#
+#   python -m benchmarks.lifecycle_benchmark --lots 200 --spots 50 --users 500 --history 50000
+#   python -m benchmarks.lifecycle_benchmark --save-baseline baseline.json
+#   python -m benchmarks.lifecycle_benchmark --baseline baseline.json --tolerance 0.25
+#
+# Each virtual driver walks register -> login -> search -> booking-confirmation
+# -> bookspot -> releasing-confirmation -> release -> summary, then fetches
+# the chart data and fetches it again with its ETag. Per endpoint the
+# report shows latency percentiles, throughput and SQL statements per request;
+# with --baseline a slower p95 or a higher query count fails the run.
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+from werkzeug.security import generate_password_hash
+from app import create_app
+from models.models import db, ParkingLot, PastReservations, Reservation, User
+from services.migrations import run_migrations
+from services.provisioning import provision_spots
+from services.rollups import backfill_rollups
+
+
+AREAS = ['Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Hebbal', 'Marathahalli']
+PASSWORD = 'bench-password'
+
+_counter = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _counter.queries = getattr(_counter, 'queries', 0) + 1
+
+
+def seed(lots, spots, users, history):
+    lot_rows = [{
+        'prime_location_name': f"{AREAS[n % len(AREAS)]} Bench Lot {n}",
+        'address': f"{n} Main Road, {AREAS[n % len(AREAS)]}",
+        'pincode': f"560{n % 1000:03d}",
+        'max_spots': spots,
+        'price_per_hour': random.randint(10, 100),
+        'available_spots': spots,
+        'reserved_spots': 0,
+    } for n in range(1, lots + 1)]
+    lot_ids = db.session.scalars(insert(ParkingLot).returning(ParkingLot.id, sort_by_parameter_order = True), lot_rows).all()
+    for lot_id in lot_ids:
+        provision_spots(lot_id, range(1, spots + 1))
+
+    # One hash shared by every seeded account keeps seeding fast
+    password = generate_password_hash(PASSWORD)
+    emails = [f"seed{n}@bench.local" for n in range(users)]
+    if emails:
+        db.session.execute(insert(User), [{'email': email, 'password': password, 'name': email} for email in emails])
+
+    now = datetime.now()
+    batch = []
+    for n in range(history):
+        lot = lot_rows[n % lots]
+        leaving = now - timedelta(minutes = random.randint(0, 60 * 24 * 365))
+        parked = leaving - timedelta(minutes = random.randint(10, 600))
+        batch.append({
+            'user_email': emails[n % users] if emails else 'nobody@bench.local',
+            'lot_id': lot_ids[n % lots],
+            'lot_prime_location': lot['prime_location_name'],
+            'address': lot['address'],
+            'pincode': lot['pincode'],
+            'parking_timestamp': parked,
+            'leaving_timestamp': leaving,
+            'vehicle_number': f"KA{n:06d}",
+            'total_cost': lot['price_per_hour'] * (leaving - parked).total_seconds() / 3600,
+        })
+        if len(batch) == 5000:
+            db.session.execute(insert(PastReservations), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(PastReservations), batch)
+    db.session.commit()
+    backfill_rollups()
+    return lot_rows, lot_ids
+
+
+def timed_call(samples, endpoint, call, expected_status = None):
+    _counter.queries = 0
+    start = time.perf_counter()
+    response = call()
+    elapsed = (time.perf_counter() - start) * 1000
+    ok = response.status_code == expected_status if expected_status else response.status_code < 400
+    samples.append((endpoint, elapsed, _counter.queries, ok))
+    return response
+
+
+def drive(app, driver, lot_rows, lot_ids):
+    samples = []
+    client = app.test_client()
+    email = f"driver{driver}-{random.getrandbits(32)}@bench.local"
+    pick = random.randrange(len(lot_ids))
+    lot_id = lot_ids[pick]
+
+    timed_call(samples, 'register', lambda: client.post('/register', data = {
+        'email': email, 'password': PASSWORD, 'name': 'Bench', 'phone': '9999999999', 'address': 'Bench', 'pincode': '560001'
+    }))
+    timed_call(samples, 'login', lambda: client.post('/login', data = {'email': email, 'password': PASSWORD}))
+    timed_call(samples, 'search', lambda: client.get('/search', query_string = {'query': lot_rows[pick]['prime_location_name']}))
+    timed_call(samples, 'booking-confirmation', lambda: client.post('/booking-confirmation', data = {'lot_id': lot_id}))
+    timed_call(samples, 'bookspot', lambda: client.post('/bookspot', data = {'lot_id': lot_id, 'vehicle_number': f"BN{driver:05d}"}))
+
+    with app.app_context():
+        reservation = Reservation.query.join(User).filter(User.email == email).first()
+        reservation_id = reservation.id if reservation else None
+    if reservation_id is not None:
+        timed_call(samples, 'releasing-confirmation', lambda: client.post('/releasing-confirmation', data = {'reservation_id': reservation_id}))
+        timed_call(samples, 'release', lambda: client.post('/release', data = {'reservation_id': reservation_id}))
+    timed_call(samples, 'summary', lambda: client.get('/summary'))
+    # The summary page is only a shell; its charts load /summary/data, and
+    # a revisit with unchanged data should cost a 304
+    data = timed_call(samples, 'summary-data', lambda: client.get('/summary/data'))
+    etag = data.headers.get('ETag', '')
+    timed_call(samples, 'summary-data-304', lambda: client.get('/summary/data', headers = {'If-None-Match': etag}), expected_status = 304)
+    return samples
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, wall_seconds):
+    report = {}
+    for endpoint in dict.fromkeys(sample[0] for sample in samples):
+        rows = [sample for sample in samples if sample[0] == endpoint]
+        latencies = sorted(row[1] for row in rows)
+        report[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if not row[3]),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'req_per_s': round(len(rows) / (sum(latencies) / 1000), 1) if sum(latencies) else 0,
+            'queries_per_request': round(sum(row[2] for row in rows) / len(rows), 2),
+        }
+    report['_total'] = {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if not sample[3]),
+        'req_per_s': round(len(samples) / wall_seconds, 1) if wall_seconds else 0,
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'endpoint':<24}{'reqs':>6}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'queries':>9}")
+    for endpoint, row in report.items():
+        if endpoint.startswith('_'):
+            continue
+        print(f"{endpoint:<24}{row['requests']:>6}{row['errors']:>6}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['req_per_s']:>9.1f}{row['queries_per_request']:>9.2f}")
+    total = report['_total']
+    print(f"total: {total['requests']} requests, {total['errors']} errors, {total['req_per_s']} req/s")
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for endpoint, row in report.items():
+        before = baseline.get(endpoint)
+        if endpoint.startswith('_') or before is None:
+            continue
+        if row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            found.append(f"{endpoint}: p95 {row['p95_ms']:.2f} ms vs baseline {before['p95_ms']:.2f} ms")
+        if row['queries_per_request'] > before['queries_per_request']:
+            found.append(f"{endpoint}: {row['queries_per_request']} queries/request vs baseline {before['queries_per_request']}")
+        if row['errors'] > before['errors']:
+            found.append(f"{endpoint}: {row['errors']} errors vs baseline {before['errors']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lots', type = int, default = 100)
+    parser.add_argument('--spots', type = int, default = 50)
+    parser.add_argument('--users', type = int, default = 200)
+    parser.add_argument('--history', type = int, default = 20000)
+    parser.add_argument('--drivers', type = int, default = 200, help = 'virtual drivers, one lifecycle each')
+    parser.add_argument('--concurrency', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--baseline', help = 'compare against this saved report and fail on regressions')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'allowed p95 slowdown vs baseline')
+    parser.add_argument('--save-baseline', help = 'write this run\'s report to a JSON file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Every virtual driver comes from the test client's one address
+    unlimited = (sys.maxsize, 1)
+    app = create_app(SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database, DEBUG = False,
+                     LOGIN_IP_LIMIT = unlimited, REGISTER_IP_LIMIT = unlimited)
+    with app.app_context():
+        run_migrations()
+        start = time.perf_counter()
+        lot_rows, lot_ids = seed(args.lots, args.spots, args.users, args.history)
+        print(f"seeded {args.lots} lots x {args.spots} spots, {args.users} users, {args.history} past reservations "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        runs = list(pool.map(lambda driver: drive(app, driver, lot_rows, lot_ids), range(args.drivers)))
+    wall_seconds = time.perf_counter() - start
+
+    report = summarize([sample for run in runs for sample in run], wall_seconds)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as handle:
+            json.dump(report, handle, indent = 2)
+        print(f"baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            found = regressions(report, json.load(handle), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print('no regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
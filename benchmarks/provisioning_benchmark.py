@@ -0,0 +1,81 @@
+# Lot provisioning: per-object ORM adds (old admin path) vs. bulk inserts
+#
+#   python -m benchmarks.provisioning_benchmark --spots 5000
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models.models import db, ParkingLot, ParkingSpot
+from services.provisioning import provision_spots, resize_lot
+
+
+def new_lot(spots):
+    lot = ParkingLot(prime_location_name = 'Bench Multi-storey', address = 'Bench Road', pincode = '560001', max_spots = spots)
+    db.session.add(lot)
+    db.session.flush()
+    return lot
+
+
+def per_object_create(spots):
+    lot = new_lot(spots)
+    for i in range(1, spots + 1):
+        db.session.add(ParkingSpot(lot_id = lot.id, spot_number = i))
+    db.session.commit()
+    return lot.id
+
+
+def per_object_resize(lot_id, spots):
+    # What ParkingLotAdmin.on_model_change used to do on any max_spots change
+    for spot in ParkingSpot.query.filter_by(lot_id = lot_id).all():
+        db.session.delete(spot)
+    db.session.flush()
+    for i in range(1, spots + 1):
+        db.session.add(ParkingSpot(lot_id = lot_id, spot_number = i))
+    db.session.commit()
+
+
+def bulk_create(spots):
+    lot = new_lot(spots)
+    provision_spots(lot.id, range(1, spots + 1))
+    db.session.commit()
+    return lot.id
+
+
+def bulk_resize(lot_id, spots):
+    resize_lot(db.session.get(ParkingLot, lot_id), spots)
+    db.session.commit()
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<34} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spots', type = int, default = 5000)
+    parser.add_argument('--grow', type = int, default = 100)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        lot_id = timed(f"per-object create {args.spots}", per_object_create, args.spots)
+        timed(f"per-object resize +{args.grow}", per_object_resize, lot_id, args.spots + args.grow)
+        lot_id = timed(f"bulk create {args.spots}", bulk_create, args.spots)
+        timed(f"bulk resize +{args.grow}", bulk_resize, lot_id, args.spots + args.grow)
+        timed(f"bulk resize -{args.grow}", bulk_resize, lot_id, args.spots)
+
+
+if __name__ == '__main__':
+    main()
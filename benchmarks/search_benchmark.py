@@ -0,0 +1,109 @@
+# Lot search latency: legacy ILIKE join + DISTINCT vs. FTS5 + free-spot counter
+#
+#   python -m benchmarks.search_benchmark --lots 10000 --spots 100
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import and_, insert, or_, update
+from models.models import db, ParkingLot, ParkingSpot
+from services.lot_search import create_search_index, search_lots
+
+
+AREAS = ['Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Hebbal', 'Marathahalli', 'Yelahanka', 'Banashankari']
+KINDS = ['Mall', 'Metro', 'Tech Park', 'Hospital', 'Stadium', 'Market']
+
+
+def seed(lots, spots, reserved_ratio):
+    lot_rows = []
+    for lot_id in range(1, lots + 1):
+        area = random.choice(AREAS)
+        lot_rows.append({
+            'id': lot_id,
+            'prime_location_name': f"{area} {random.choice(KINDS)} {lot_id}",
+            'address': f"{random.randint(1, 999)} Main Road, {area}",
+            'pincode': f"56{random.randint(0, 9999):04d}",
+            'max_spots': spots,
+            'price_per_hour': random.randint(10, 100),
+        })
+    db.session.execute(insert(ParkingLot), lot_rows)
+    for lot_id in range(1, lots + 1):
+        spot_rows = [
+            {'lot_id': lot_id, 'spot_number': n, 'is_reserved': random.random() < reserved_ratio}
+            for n in range(1, spots + 1)
+        ]
+        db.session.execute(insert(ParkingSpot), spot_rows)
+        reserved = sum(row['is_reserved'] for row in spot_rows)
+        db.session.execute(
+            update(ParkingLot).where(ParkingLot.id == lot_id)
+            .values(available_spots = spots - reserved, reserved_spots = reserved)
+        )
+    db.session.commit()
+
+
+def legacy_search(q):
+    return (
+        db.session.query(ParkingLot)
+        .join(ParkingSpot)
+        .filter(
+            and_(
+                or_(
+                    ParkingLot.prime_location_name.ilike(f"%{q}%"),
+                    ParkingLot.pincode.ilike(f"%{q}%"),
+                    ParkingLot.address.ilike(f"%{q}%")
+                ),
+                ParkingSpot.is_reserved == False
+            )
+        )
+        .distinct()
+        .all()
+    )
+
+
+def measure(search, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            search(q)
+            timings.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lots', type = int, default = 10000)
+    parser.add_argument('--spots', type = int, default = 100)
+    parser.add_argument('--reserved', type = float, default = 0.9)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.init_app(app)
+    queries = ['Koramangala', 'kora', 'Tech Park', '5601', '560123', 'Main Road Hebbal']
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed(args.lots, args.spots, args.reserved)
+        create_search_index()
+        print(f"seeded {args.lots} lots x {args.spots} spots in {time.perf_counter() - start:.1f}s")
+
+        for name, search in [('legacy ilike + distinct', legacy_search), ('fts5 + counter', search_lots)]:
+            p50, p95 = measure(search, queries, args.repeat)
+            print(f"{name:<26} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+from .commands import db_cli, lots_cli, occupancy_cli, rollups_cli, settlement_cli, history_cli, availability_cli
+
+def register_commands(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(lots_cli)
+    app.cli.add_command(occupancy_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(settlement_cli)
+    app.cli.add_command(history_cli)
+    app.cli.add_command(availability_cli)
@@ -0,0 +1,93 @@
+# CLI commands (flask --app app <group> <command>)
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from services.archive import archive_history
+from services.availability import run_availability_hub
+from services.cache import LOTS, cache
+from services.migrations import run_migrations
+from services.occupancy import occupancy_drift, repair_occupancy
+from services.provisioning import import_lots_csv
+from services.rollups import backfill_rollups
+from services.settlement import SettlementWorker, queue_status, settle_due
+
+
+occupancy_cli = AppGroup('occupancy', help = 'Per-lot occupancy counters.')
+db_cli = AppGroup('db', help = 'Database schema.')
+lots_cli = AppGroup('lots', help = 'Bulk parking lot provisioning.')
+rollups_cli = AppGroup('rollups', help = 'Daily usage rollups behind the summary pages.')
+settlement_cli = AppGroup('settlement', help = 'Queue of releases waiting for cost settlement.')
+history_cli = AppGroup('history', help = 'Archiving of old past reservations.')
+availability_cli = AppGroup('availability', help = 'Live lot availability pushed to search results.')
+
+
+@occupancy_cli.command('check')
+@click.option('--repair', is_flag = True, help = 'Rewrite drifted counters from the spot rows.')
+def check_occupancy(repair):
+    drift = repair_occupancy() if repair else occupancy_drift()
+    if not drift:
+        click.echo('Occupancy counters are consistent.')
+        return
+    for lot in drift:
+        click.echo(
+            f"Lot {lot['lot_id']}: stored {lot['available_spots']} free / {lot['reserved_spots']} reserved, "
+            f"actual {lot['actual_available']} free / {lot['actual_reserved']} reserved"
+        )
+    click.echo(f"{len(drift)} lot(s) {'repaired' if repair else 'drifted'}.")
+    if not repair:
+        raise SystemExit(1)
+
+
+@rollups_cli.command('backfill')
+def backfill():
+    rows = backfill_rollups()
+    click.echo(f"Rebuilt {rows} daily rollup row(s) from past reservations.")
+
+
+@db_cli.command('upgrade')
+def upgrade():
+    ran = run_migrations()
+    click.echo(f"Applied: {', '.join(ran)}" if ran else 'Database is up to date.')
+
+
+@lots_cli.command('import')
+@click.argument('csv_file', type = click.File('r', encoding = 'utf-8'))
+def import_lots(csv_file):
+    try:
+        lot_ids = import_lots_csv(csv_file)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    cache.invalidate(LOTS)
+    click.echo(f"Imported {len(lot_ids)} lot(s).")
+
+
+@settlement_cli.command('status')
+def settlement_status():
+    pending, oldest = queue_status()
+    click.echo(f"{pending} release(s) waiting for settlement" + (f", oldest released at {oldest}." if oldest else '.'))
+
+
+@settlement_cli.command('run')
+@click.option('--follow', is_flag = True, help = 'Keep polling the queue instead of exiting once it is empty.')
+def settlement_run(follow):
+    if follow:
+        SettlementWorker(current_app._get_current_object()).run_forever()
+    settled = settle_due()
+    click.echo(f"Settled {settled} release(s).")
+
+
+@history_cli.command('archive')
+@click.option('--horizon-days', type = int, help = 'Keep this many days of history in the live table (default ARCHIVE_HORIZON_DAYS).')
+def archive(horizon_days):
+    moved = archive_history(horizon_days if horizon_days is not None else current_app.config['ARCHIVE_HORIZON_DAYS'])
+    for month, rows in moved.items():
+        click.echo(f"{month:%Y-%m}: archived {rows} row(s).")
+    click.echo(f"Archived {sum(moved.values())} row(s) from {len(moved)} month(s).")
+
+
+@availability_cli.command('serve', help = "Run this host's availability hub in the foreground.")
+def availability_serve():
+    if not current_app.config['AVAILABILITY_PUSH']:
+        raise click.ClickException('AVAILABILITY_PUSH is off.')
+    if not run_availability_hub(current_app._get_current_object()):
+        raise click.ClickException(f"Port {current_app.config['AVAILABILITY_PORT']} is already in use.")
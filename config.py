@@ -1,6 +1,132 @@
+import os
+
 
 class Config:
     SECRET_KEY = 'your_security_key'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///data.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     FLASK_ADMIN_SWATCH = 'cosmo'
+    DEBUG = True
+    ENFORCE_QUERY_BUDGETS = False
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60
+    # PRAGMAs run on every new SQLite connection
+    SQLITE_PRAGMAS = {}
+    # Request timing, SQL stats, /metrics and the slow-request log
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+    SLOW_REQUEST_MS = 500
+    SLOW_REQUEST_LOG = None
+    PROFILE_SAMPLE_INTERVAL_MS = 5
+    PROFILE_TOP_STACKS = 10
+    # Besides admin sessions, /metrics answers requests bearing
+    # "Authorization: Bearer <METRICS_TOKEN>" and clients in METRICS_ALLOWED_IPS
+    METRICS_TOKEN = None
+    METRICS_ALLOWED_IPS = ()
+    # Query/fragment cache: 'memory' (per process), 'sqlite' (shared by the
+    # workers on one host, stored under the instance folder) or 'none'
+    CACHE_BACKEND = 'memory'
+    CACHE_DEFAULT_TTL = 30
+    CACHE_MAX_ENTRIES = 2048
+    CACHE_SQLITE_PATH = 'cache.db'
+    # Releases are settled (cost, history, rollups) in batches by a worker
+    # thread in each app process; turn off to run `flask settlement run
+    # --follow` as a separate process instead
+    SETTLEMENT_WORKER = True
+    SETTLEMENT_BATCH_SIZE = 200
+    SETTLEMENT_POLL_SECONDS = 2
+    SETTLEMENT_LEASE_SECONDS = 60
+    # Most vehicles one fleet booking or release request may carry
+    FLEET_BATCH_LIMIT = 500
+    # Advance bookings: how far ahead a window may start, how long it may
+    # last, and the seconds a worker trusts its per-lot interval trees
+    # before reloading them to pick up other workers' bookings
+    BOOKING_HORIZON_DAYS = 30
+    BOOKING_MAX_HOURS = 72
+    BOOKING_INDEX_TTL = 300
+    # Admin list views stop counting rows here and cache counts and page
+    # positions for this many seconds
+    ADMIN_COUNT_LIMIT = 10000
+    ADMIN_COUNT_TTL = 60
+    # `flask history archive` moves past reservations that left before the
+    # month this many days back into monthly archive tables
+    ARCHIVE_HORIZON_DAYS = 180
+    # Live availability: booking, release and lot edits are pushed to the
+    # search results over server-sent events from a hub on this port.
+    # AVAILABILITY_URL overrides the address browsers connect to (e.g. when
+    # a proxy serves the hub under the site's own host). Pages from the
+    # AVAILABILITY_CORS_ORIGINS may subscribe from another origin; the
+    # defaults are the dev server's, whose pages are on another port.
+    AVAILABILITY_PUSH = True
+    AVAILABILITY_HOST = '127.0.0.1'
+    AVAILABILITY_PORT = 8765
+    AVAILABILITY_URL = None
+    AVAILABILITY_CORS_ORIGINS = ('http://127.0.0.1:5000', 'http://localhost:5000')
+    # Seconds the per-lot analytics (which need NumPy) stay cached; they
+    # cover complete days, so only lot and history edits change them sooner
+    ANALYTICS_CACHE_TTL = 3600
+    # Password hashing: any Werkzeug method string. Hashes stored with other
+    # parameters still verify and are replaced at the user's next login.
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    PASSWORD_SALT_LENGTH = 16
+    # Processes computing hashes off the request threads (0 hashes inline,
+    # as the development server does), logins allowed to wait for one, and
+    # the longest a login waits
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_QUEUE = 32
+    PASSWORD_HASH_TIMEOUT = 10
+    # (attempts, seconds) per window, counted in each worker process. Users
+    # behind one NAT share an IP, so the per-IP login limit is generous;
+    # repeated failures for one account are what it is strict about.
+    LOGIN_IP_LIMIT = (60, 60)
+    LOGIN_EMAIL_FAILURE_LIMIT = (5, 300)
+    REGISTER_IP_LIMIT = (10, 3600)
+    # Number of proxies in front of the app whose X-Forwarded-For is
+    # trusted for the client IP; 0 uses the connecting address
+    PROXY_FIX_X_FOR = 0
+
+
+class ProductionConfig(Config):
+    # No fallback: the session cookie carries is_admin, so a key from the
+    # source would let anyone sign an admin session
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Set DATABASE_URL to a postgresql:// URI to move off SQLite
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', Config.SQLALCHEMY_DATABASE_URI)
+    DEBUG = False
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 4))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 8))
+    # One pooled connection per request thread, plus headroom
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': SERVER_THREADS,
+        'max_overflow': SERVER_THREADS,
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+    }
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = tuple(filter(None, os.environ.get('METRICS_ALLOWED_IPS', '').split(',')))
+    # The hub listens on localhost only; the reverse proxy in front of the
+    # app forwards the site's /events to it, so pages subscribe same-origin
+    AVAILABILITY_PORT = int(os.environ.get('AVAILABILITY_PORT', 8765))
+    AVAILABILITY_URL = os.environ.get('AVAILABILITY_URL', '/events')
+    AVAILABILITY_CORS_ORIGINS = ()
+    # Share cached fragments between the gunicorn workers
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+    # WAL lets readers run alongside the single writer; busy_timeout makes a
+    # writer wait for the lock instead of failing with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+    }
+
+
+configs = {
+    'development': Config,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name = None):
+    return configs[name or os.environ.get('APP_CONFIG', 'development')]
@@ -0,0 +1,41 @@
+# Production server: APP_CONFIG=production gunicorn -c gunicorn.conf.py app:app
+import os
+import subprocess
+import sys
+
+os.environ.setdefault('APP_CONFIG', 'production')
+
+from config import get_config
+
+_config = get_config()
+
+bind = _config.SERVER_BIND
+workers = _config.SERVER_WORKERS
+threads = _config.SERVER_THREADS
+worker_class = 'gthread'
+
+_hub = None
+
+
+def on_starting(server):
+    # Migrate once in the master process, before any worker is forked
+    from app import app, init_database
+    from models.models import db
+
+    init_database(app)
+    with app.app_context():
+        db.engine.dispose()
+    # The availability hub runs as a process of its own: the master forks
+    # the workers, so it must not run threads itself
+    global _hub
+    if _config.AVAILABILITY_PUSH:
+        _hub = subprocess.Popen(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'availability', 'serve'],
+            cwd = os.path.dirname(os.path.abspath(__file__))
+        )
+
+
+def on_exit(server):
+    if _hub is not None:
+        _hub.terminate()
+        _hub.wait()
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from services.passwords import hasher
 from sqlalchemy_utils import EmailType
 
 
@@ -22,11 +22,16 @@ class User(db.Model):
     pincode  =  db.Column(db.String(10))
     is_admin  =  db.Column(db.Boolean, default = False)
     reservations  =  db.relationship('Reservation', back_populates  =  'user')
+    # Declared as an index rather than unique = True so Flask-Admin does not
+    # attach its Unique form validator, which breaks under WTForms 3.
+    __table_args__  =  (
+        db.Index('ix_user_email', 'email', unique = True),
+    )
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return hasher.verify(self.password, password)
     
     def __repr__(self):
         return f"{self.email} (id: {self.id})"
@@ -40,34 +45,56 @@ class ParkingLot(db.Model):
     max_spots  =  db.Column(db.Integer, default  =  1)
     price_per_hour  =  db.Column(db.Integer, nullable = False, default = 0)
     is_active  =  db.Column(db.Boolean, default = True)
+    available_spots  =  db.Column(db.Integer, nullable = False, default = 0)
+    reserved_spots  =  db.Column(db.Integer, nullable = False, default = 0)
     spots  =  db.relationship('ParkingSpot', back_populates = 'lot')
     def __repr__(self):
         return f"{self.prime_location_name} (Lot id: {self.id})"
 
 class ParkingSpot(db.Model):
-    id  =  db.Column(db.String(10), primary_key = True)
+    id  =  db.Column(db.Integer, primary_key = True, autoincrement  =  True)
     lot_id  =  db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable = False)
+    # Number of the spot within its lot, as shown to drivers
+    spot_number  =  db.Column(db.Integer, nullable = False)
+    # True while a reservation holds the spot now; bookings ahead only set it
+    # once their window begins (services.bookings.start_bookings)
     is_reserved  =  db.Column(db.Boolean, default = False)
     lot  =  db.relationship('ParkingLot', back_populates = 'spots')
     reservations  =  db.relationship('Reservation', back_populates  =  'spot')
+    __table_args__  =  (
+        db.Index('ix_parking_spot_lot_number', 'lot_id', 'spot_number', unique = True),
+        # Only free spots, which is all allocation ever looks up. is_reserved
+        # is indexed too so the index covers allocation's queries and SQLite
+        # prefers it to the unique index without ANALYZE statistics.
+        db.Index('ix_parking_spot_free', 'lot_id', 'is_reserved', sqlite_where = is_reserved == False, postgresql_where = is_reserved == False),
+    )
     def __repr__(self):
-        return f"Spot id: {self.id}"
+        return f"Lot {self.lot_id} spot {self.spot_number}"
 
     
 class Reservation(db.Model):
+    # Holds its spot from parking_timestamp until booked_until, or until it
+    # is released when booked_until is NULL. A spot's reservations never
+    # overlap; services.bookings checks that on every advance booking.
     id  =  db.Column(db.Integer, primary_key = True, autoincrement  =  True)
-    spot_id  =  db.Column(db.String(10), db.ForeignKey('parking_spot.id'), nullable = False, unique = True)
+    spot_id  =  db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable = False)
     user_id  =  db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
     parking_timestamp  =  db.Column(db.DateTime, nullable = False)
+    booked_until  =  db.Column(db.DateTime)
     vehicle_number  =  db.Column(db.String(20))
     spot  =  db.relationship('ParkingSpot', back_populates  =  'reservations', uselist = False)
     user  =  db.relationship('User', back_populates  =  'reservations')
+    __table_args__  =  (
+        db.Index('ix_reservation_user_vehicle', 'user_id', 'vehicle_number'),
+        db.Index('ix_reservation_spot_start', 'spot_id', 'parking_timestamp'),
+    )
     def __repr__(self):
         return f"User: {self.user.email} Spot: {self.spot_id} (Res. id: {self.id})"
     
 class PastReservations(db.Model):
     id  =  db.Column(db.Integer, primary_key = True, autoincrement  =  True)
     user_email  =  db.Column(EmailType)
+    lot_id  =  db.Column(db.Integer)
     lot_prime_location  =  db.Column(db.String(100))
     address  =  db.Column(db.String(255), nullable = False)
     pincode  =  db.Column(db.String(10), nullable = False)
@@ -75,6 +102,69 @@ class PastReservations(db.Model):
     leaving_timestamp  =  db.Column(db.DateTime)
     vehicle_number  =  db.Column(db.String(20))
     total_cost  =  db.Column(db.Float)
+    # Id of the PendingRelease this row settled; unique so a release is never billed twice
+    release_id  =  db.Column(db.Integer)
+    __table_args__  =  (
+        db.Index('ix_past_reservations_user_leaving', 'user_email', 'leaving_timestamp'),
+        db.Index('ix_past_reservations_release_id', 'release_id', unique = True),
+        db.Index('ix_past_reservations_lot_leaving', 'lot_id', 'leaving_timestamp'),
+        db.Index('ix_past_reservations_leaving', 'leaving_timestamp'),
+    )
     def __repr__(self):
         return f"User: {self.user_email} (id: {self.id})"
-    
\ No newline at end of file
+
+class PendingRelease(db.Model):
+    # Durable queue of releases waiting for settlement by services.settlement.
+    # AUTOINCREMENT keeps ids from being reused, since they are the settlement key.
+    id  =  db.Column(db.Integer, primary_key = True, autoincrement  =  True)
+    user_email  =  db.Column(EmailType, nullable = False)
+    lot_id  =  db.Column(db.Integer, nullable = False)
+    lot_prime_location  =  db.Column(db.String(100))
+    address  =  db.Column(db.String(255), nullable = False)
+    pincode  =  db.Column(db.String(10), nullable = False)
+    price_per_hour  =  db.Column(db.Integer, nullable = False)
+    parking_timestamp  =  db.Column(db.DateTime, nullable = False)
+    leaving_timestamp  =  db.Column(db.DateTime, nullable = False)
+    vehicle_number  =  db.Column(db.String(20))
+    claimed_by  =  db.Column(db.String(64))
+    claimed_at  =  db.Column(db.DateTime)
+    __table_args__  =  (
+        db.Index('ix_pending_release_claimed_at', 'claimed_at'),
+        {'sqlite_autoincrement': True},
+    )
+    def __repr__(self):
+        return f"Release {self.id} User: {self.user_email}"
+
+class HistoryArchive(db.Model):
+    # One row per month of PastReservations moved into its own partition table by services.archive
+    month  =  db.Column(db.Date, primary_key = True)
+    table_name  =  db.Column(db.String(50), nullable = False)
+    rows  =  db.Column(db.Integer, nullable = False, default = 0)
+    archived_at  =  db.Column(db.DateTime, nullable = False)
+    def __repr__(self):
+        return f"Archive {self.table_name} ({self.rows} rows)"
+
+class DailyUsage(db.Model):
+    # One row per day, lot and user; maintained on release, rebuilt by `flask rollups backfill`
+    day  =  db.Column(db.Date, primary_key = True)
+    lot_id  =  db.Column(db.Integer, primary_key = True)
+    user_email  =  db.Column(EmailType, primary_key = True)
+    parkings  =  db.Column(db.Integer, nullable = False, default = 0)
+    releases  =  db.Column(db.Integer, nullable = False, default = 0)
+    revenue  =  db.Column(db.Float, nullable = False, default = 0)
+    parked_hours  =  db.Column(db.Float, nullable = False, default = 0)
+    __table_args__  =  (
+        db.Index('ix_daily_usage_user_day', 'user_email', 'day'),
+    )
+    def __repr__(self):
+        return f"{self.day} Lot: {self.lot_id} User: {self.user_email}"
+    
+class DailyTotal(db.Model):
+    # DailyUsage summed over lots and users, one row per day, for the admin summary
+    day  =  db.Column(db.Date, primary_key = True)
+    parkings  =  db.Column(db.Integer, nullable = False, default = 0)
+    releases  =  db.Column(db.Integer, nullable = False, default = 0)
+    revenue  =  db.Column(db.Float, nullable = False, default = 0)
+    parked_hours  =  db.Column(db.Float, nullable = False, default = 0)
+    def __repr__(self):
+        return f"{self.day} Total"
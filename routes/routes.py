@@ -1,13 +1,34 @@
 # Routes
-from flask import session, redirect, url_for, request, render_template, Blueprint
-from models.models import db, User, ParkingLot, ParkingSpot, Reservation, PastReservations
-from datetime import datetime, timedelta
-from sqlalchemy import or_, and_, func
+from flask import session, redirect, url_for, request, render_template, Blueprint, Response, stream_with_context, jsonify, g, current_app
+from models.models import db, User, ParkingLot
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime
+from markupsafe import Markup
+from sqlalchemy import func
+from services.allocation import allocator
+from services.analytics import analytics_available, lot_analytics
+from services.cache import ANALYTICS, LOTS, RESERVATIONS, cache
+from services.bookings import book_spot, booking_index, booking_window
+from services.history import history_page, stream_csv, stream_json
+from services.lot_search import search_lots
+from services.occupancy import lot_availability
+from services.passwords import HashingBusy, hasher
+from services.rate_limit import auth_throttle
+from services.rollups import SUMMARY_RANGES, daily_series, summary_range
+from services.settlement import notify_settlement, release_reservation, release_reservations
+from services.queries import current_reservations, fleet_lots, reservation_with_lot
+from services.user_cache import load_current_user, login_user, logout_user, user_cache
+from services.query_budget import query_budget
 
 
 routes_bp = Blueprint('routes_bp', __name__)
 
 
+@routes_bp.before_request
+def load_user():
+    g.current_user  =  load_current_user()
+
+
 @routes_bp.route('/')
 def home():
     if "email" in session:
@@ -16,19 +37,39 @@ def home():
         return redirect(url_for('routes_bp.dashboard'))
     return render_template('index.html')
 
+def _turned_away(template, seconds, status):
+    # Refused by a rate limit (429) or a full hashing queue (503)
+    message  =  f"Too many attempts, please try again in {seconds} seconds" if status == 429 else "Too many sign-ins right now, please try again shortly"
+    return render_template(template, error = message), status, {'Retry-After': str(seconds)}
+
 @routes_bp.route('/login', methods = ['GET', 'POST'])
 def login():
     if request.method  ==  'POST':
         email  =  request.form['email']
         password  =  request.form['password']
+        wait  =  auth_throttle.login_attempt(request.remote_addr, email)
+        if wait:
+            return _turned_away('security/ulogin.html', wait, 429)
         user  =  User.query.filter_by(email = email).first()
         
-        if user and user.check_password(password):
-            session['email']  =  email
-            session['is_admin']  =  user.is_admin
+        try:
+            verified  =  user is not None and user.check_password(password)
+        except HashingBusy:
+            return _turned_away('security/ulogin.html', 5, 503)
+        if verified:
+            auth_throttle.login_succeeded(email)
+            if hasher.needs_rehash(user.password):
+                # Hashed under an older policy; the plain password is at hand now
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
+            login_user(user)
             next_page  =  request.args.get('next')
             return redirect(next_page or (url_for('routes_bp.dashboard') if not user.is_admin else url_for('admin.index')))
         else:
+            auth_throttle.login_failed(email)
             return render_template('security/ulogin.html', error = "Invalid credentials")
 
     return render_template('security/ulogin.html')
@@ -38,6 +79,9 @@ def login():
 @routes_bp.route('/register', methods  =  ['GET', 'POST'])  
 def register():
     if request.method  ==  'POST':
+        wait  =  auth_throttle.registration_attempt(request.remote_addr)
+        if wait:
+            return _turned_away('security/uregist.html', wait, 429)
         email  =  request.form['email']
         password  =  request.form['password']
         user  =  User.query.filter_by(email  =  email).first()
@@ -50,35 +94,60 @@ def register():
             return render_template("security/uregist.html", error  =  "User already exists")
         else:
             new_user  =  User(email = email, name = name, phone = phone, address = address, pincode = pincode, is_admin  =  False)
-            new_user.set_password(password)
+            try:
+                new_user.set_password(password)
+            except HashingBusy:
+                return _turned_away('security/uregist.html', 5, 503)
             db.session.add(new_user)
-            db.session.commit()
-            session['email']  =  email
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another registration for the same email won the race
+                db.session.rollback()
+                return render_template("security/uregist.html", error  =  "User already exists")
+            login_user(new_user)
             return redirect(url_for('routes_bp.dashboard'))
     return render_template('security/uregist.html')
 
 @routes_bp.route('/logout')
 def logout():
-    session.pop('email', None)
-    session.pop('is_admin', None)
+    logout_user()
     return redirect(url_for('routes_bp.home'))
 
 @routes_bp.route('/dashboard')
+@query_budget(3)
 def dashboard():
     if 'email' not in session:
         return redirect(url_for('routes_bp.login'))
     
-    user  =  User.query.filter_by(email = session['email']).first()
-    cur_reservations  =  Reservation.query.join(User).filter(User.email  ==  session['email']).all()
+    user  =  g.current_user
+    cur_reservations  =  current_reservations(user.id)
+
+    history_cursor  =  request.args.get('before')
+    past_reservations, next_cursor  =  history_page(session['email'], history_cursor)
+    return render_template('dashboard.html', user = user, cur_reservations  =  cur_reservations, past_reservations = past_reservations,
+                           history_cursor = history_cursor, next_cursor = next_cursor)
+
+@routes_bp.route('/history/export')
+def export_history():
+    if 'email' not in session:
+        return redirect(url_for('routes_bp.login'))
 
-    past_reservations = PastReservations.query.filter_by(user_email = session['email']).order_by(PastReservations.leaving_timestamp.desc()).all()
-    return render_template('dashboard.html', user = user, cur_reservations  =  cur_reservations, past_reservations = past_reservations)
+    if request.args.get('format') == 'json':
+        stream, mimetype, extension  =  stream_json, 'application/json', 'json'
+    else:
+        stream, mimetype, extension  =  stream_csv, 'text/csv', 'csv'
+    return Response(
+        stream_with_context(stream(session['email'])),
+        mimetype = mimetype,
+        headers = {'Content-Disposition': f'attachment; filename=parking_history.{extension}'}
+    )
 
 @routes_bp.route('/profile', methods  =  ['GET', 'POST'])
 def profile():
     if 'email' not in session:
         return redirect(url_for('routes_bp.login'))
-    user  =  User.query.filter_by(email  =  session['email']).first()
+    user  =  g.current_user
     if user.is_admin is True:
         return render_template('admin/profile.html', user  =  user)
     return render_template('profile.html', user  =  user)
@@ -88,11 +157,12 @@ def updateprofile():
     if 'email' not in session:
         return redirect(url_for('routes_bp.login'))
     if request.method  ==  'POST':
-        user  =  User.query.filter_by(email  =  session['email']).first()
+        user  =  g.current_user
         if user.is_admin is True:
             name  =  request.form['name']
             user.name  =  name
             db.session.commit()
+            user_cache.invalidate(user.id)
             return redirect(url_for('admin.index'))
         phone  =   request.form['phone']
         name  =  request.form['name']
@@ -105,171 +175,289 @@ def updateprofile():
         user.pincode  =  pincode
 
         db.session.commit()
+        user_cache.invalidate(user.id)
         return redirect(url_for('routes_bp.dashboard'))
 
 
 @routes_bp.route('/search', methods  =  ['GET','POST'])
+@query_budget(4)
 def search():
     if request.method  ==  'GET':
-        user  =  User.query.filter_by(email = session['email']).first()
+        user  =  g.current_user
         q  =  request.args.get('query')
-        results =[]
         if q:
-            results = (
-                db.session.query(ParkingLot)
-                .join(ParkingSpot)
-                .filter(
-                    and_(
-                        or_(
-                            ParkingLot.prime_location_name.ilike(f"%{q}%"),
-                            ParkingLot.pincode.ilike(f"%{q}%"),
-                            ParkingLot.address.ilike(f"%{q}%")
-                        ),
-                        ParkingSpot.is_reserved == False
-                    )
-                )
-                .distinct()
-                .all()
-
+            # The results table only depends on the query and lot availability,
+            # so it is cached as rendered HTML until the next lot/spot write.
+            results_html  =  cache.get_or_set(
+                LOTS, f"search:{q.strip().lower()}",
+                lambda: render_template('_search_results.html', results = search_lots(q))
             )
 
-            cur_reservations  =  Reservation.query.join(User).filter(User.email  ==  session['email']).all()
+            cur_reservations  =  current_reservations(user.id)
             
-            past_reservations = PastReservations.query.filter_by(user_email = session['email']).order_by(PastReservations.leaving_timestamp.desc()).all()
-            return render_template('dashboard.html', user = user, results = results, cur_reservations = cur_reservations, past_reservations = past_reservations)
+            past_reservations, next_cursor  =  history_page(session['email'])
+            return render_template('dashboard.html', user = user, results_html = Markup(results_html), cur_reservations = cur_reservations, past_reservations = past_reservations,
+                                   next_cursor = next_cursor)
         
 @routes_bp.route('/booking-confirmation', methods  =  ['POST', 'GET'])
 def booking_confirmation():
     if request.method  ==  'POST':
         lot_id  =  request.form.get('lot_id')
-        spot  =  ParkingSpot.query.filter_by(lot_id = lot_id, is_reserved = False).first()
-        user  =  User.query.filter_by(email = session['email']).first()
-        if spot and user:
-            return render_template('booking.html', spot = spot, user=user)
+        lot  =  ParkingLot.query.filter_by(id = lot_id).first()
+        user  =  g.current_user
+        # A full lot can still be booked for a later window
+        if lot and user:
+            return render_template('booking.html', lot = lot, user = user)
+        return redirect(url_for('routes_bp.dashboard'))
+
+def _form_datetime(name):
+    value  =  request.form.get(name)
+    if not value:
+        raise ValueError("Give both the start and the end of the booking")
+    return datetime.fromisoformat(value)
 
 @routes_bp.route('/bookspot', methods = ['POST'])
 def bookspot():
     if 'email' not in session:
         return redirect(url_for('routes_bp.login'))
 
-    spot_id  =  request.form.get('spot_id')
+    lot_id  =  request.form.get('lot_id', type = int)
     vehicle_number = request.form.get('vehicle_number')
-    user  =  User.query.filter_by(email = session['email']).first()
-    spot  =  ParkingSpot.query.filter_by(id = spot_id).first()
-    parking_timestamp  =  datetime.now()
-
-    if spot and user:
-        reservation  =  Reservation(
-            spot_id = spot.id,
-            user_id = user.id,
-            parking_timestamp = parking_timestamp,
-            vehicle_number = vehicle_number
-        )
-        spot.is_reserved  =  True
-        db.session.add(reservation)
-        db.session.commit()
-        return redirect(url_for('routes_bp.dashboard'))
+    user  =  g.current_user
+    lot  =  ParkingLot.query.filter_by(id = lot_id).first()
+
+    if lot and user:
+        if request.form.get('start') or request.form.get('end'):
+            # Booking ahead for a window instead of parking now
+            try:
+                start, end  =  booking_window(_form_datetime('start'), _form_datetime('end'))
+            except ValueError as error:
+                return render_template('booking.html', lot = lot, user = user, error = str(error))
+            reservation  =  book_spot(lot.id, user.id, vehicle_number, start, end)
+            if reservation is None:
+                return render_template('booking.html', lot = lot, user = user, error = "No spot in this lot is free for that whole window")
+        else:
+            reservation  =  allocator.claim(lot.id, user.id, vehicle_number)
+            if reservation is None:
+                return render_template('booking.html', lot = lot, user = user, error = "No free spots left in this lot")
+        cache.invalidate(LOTS)
+    return redirect(url_for('routes_bp.dashboard'))
 
 @routes_bp.route('/releasing-confirmation', methods = ['POST'])
+@query_budget(2)
 def releasing_confirmation():
     if request.method == 'POST':
         res_id = request.form.get('reservation_id')
-        res = Reservation.query.filter_by(id = res_id).first()
+        res = reservation_with_lot(res_id)
         parking_timestamp  =  res.parking_timestamp
-        user  =  User.query.filter_by(email = session['email']).first()
+        user  =  g.current_user
 
         cur_time = datetime.now()
-        es_cost = ((cur_time - parking_timestamp).total_seconds() / 3600) * res.spot.lot.price_per_hour
+        # Nothing to pay for a booking whose window has not begun
+        es_cost = max((cur_time - parking_timestamp).total_seconds() / 3600, 0) * res.spot.lot.price_per_hour
         if res and user:
             return render_template('releasespot.html', user = user, res = res, cur_time = cur_time, es_cost = es_cost)
         
 @routes_bp.route('/release', methods  =  ['POST'])
+@query_budget(5)
 def releasespot():
     if 'email' not in session:
         return redirect(url_for('routes_bp.login'))
     
     reservation_id  =  request.form.get('reservation_id')
-    reservation  =  Reservation.query.filter(Reservation.id  ==  reservation_id).first()
-    spot  =  ParkingSpot.query.filter(ParkingSpot.id  ==  reservation.spot_id).first()
-    user  =  User.query.filter_by(email = session['email']).first()
-    parking_timestamp  =  reservation.parking_timestamp
-    leaving_timestamp  =  datetime.now()
-    hours_parked  =  (leaving_timestamp - parking_timestamp).total_seconds() / 3600
-
-    if user and reservation:
-        spot.is_reserved  =  False
-        record = PastReservations(user_email = user.email, 
-                                  lot_prime_location = spot.lot.prime_location_name, 
-                                  address = spot.lot.address, 
-                                  pincode = spot.lot.pincode, 
-                                  parking_timestamp = parking_timestamp,
-                                  leaving_timestamp = leaving_timestamp,
-                                  vehicle_number = reservation.vehicle_number,
-                                  total_cost = spot.lot.price_per_hour * hours_parked)
-        db.session.add(record)
-        db.session.delete(reservation)
-        db.session.commit()
-        return redirect(url_for('routes_bp.dashboard'))
+    reservation  =  reservation_with_lot(reservation_id)
+    user  =  g.current_user
+
+    if user and reservation and reservation.user_id == user.id:
+        # Cost, history and rollups are settled by services.settlement
+        lot_id, spot_id, reservation_id  =  reservation.spot.lot_id, reservation.spot_id, reservation.id
+        if release_reservation(reservation, user.email):
+            allocator.release(lot_id, spot_id)
+            booking_index.remove(lot_id, reservation_id)
+            cache.invalidate(LOTS)
+            notify_settlement(current_app)
+    return redirect(url_for('routes_bp.dashboard'))
         
+def _json_object():
+    # None unless the body is a JSON object
+    payload  =  request.get_json(silent = True)
+    return payload if isinstance(payload, dict) else None
+
+def _is_id(value):
+    # JSON true/false load as bool, which is an int subclass
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _vehicle_numbers(payload):
+    numbers  =  payload.get('vehicle_numbers') or []
+    if not isinstance(numbers, list):
+        return None
+    # Drop blanks and repeats, keeping the caller's order
+    return list(dict.fromkeys(str(number).strip() for number in numbers if str(number).strip()))
+
+@routes_bp.route('/api/reservations/bulk', methods = ['POST'])
+def bulk_book():
+    user  =  g.current_user
+    if user is None:
+        return jsonify(error = "Login required"), 401
+    payload  =  _json_object()
+    if payload is None:
+        return jsonify(error = "Send a JSON object"), 400
+    vehicle_numbers  =  _vehicle_numbers(payload)
+    if not vehicle_numbers:
+        return jsonify(error = "vehicle_numbers must be a non-empty list"), 400
+    if len(vehicle_numbers) > current_app.config['FLEET_BATCH_LIMIT']:
+        return jsonify(error = f"At most {current_app.config['FLEET_BATCH_LIMIT']} vehicles per request"), 400
+    lot_id  =  payload.get('lot_id')
+    pincode  =  payload.get('pincode')
+    if lot_id is None and not pincode:
+        return jsonify(error = "Give a lot_id or a pincode"), 400
+    if lot_id is not None and not _is_id(lot_id):
+        return jsonify(error = "lot_id must be an integer"), 400
+
+    lots  =  fleet_lots(lot_id = lot_id, pincode = None if lot_id is not None else str(pincode))
+    reserved, unplaced  =  allocator.claim_many([lot.id for lot in lots], user.id, vehicle_numbers)
+    if reserved:
+        cache.invalidate(LOTS)
+    # 201 when every vehicle got a spot, 200 for a partial fleet, 409 for none
+    status  =  201 if not unplaced else 200 if reserved else 409
+    return jsonify(requested = len(vehicle_numbers), reserved = reserved, unplaced = unplaced), status
+
+@routes_bp.route('/api/reservations/bulk-release', methods = ['POST'])
+def bulk_release():
+    user  =  g.current_user
+    if user is None:
+        return jsonify(error = "Login required"), 401
+    payload  =  _json_object()
+    if payload is None:
+        return jsonify(error = "Send a JSON object"), 400
+    vehicle_numbers  =  _vehicle_numbers(payload)
+    reservation_ids  =  payload.get('reservation_ids') or []
+    if vehicle_numbers is None or not isinstance(reservation_ids, list) \
+            or not all(_is_id(reservation_id) for reservation_id in reservation_ids):
+        return jsonify(error = "reservation_ids must be a list of ids and vehicle_numbers a list"), 400
+    if not reservation_ids and not vehicle_numbers:
+        return jsonify(error = "Give reservation_ids or vehicle_numbers"), 400
+    if len(reservation_ids) + len(vehicle_numbers) > current_app.config['FLEET_BATCH_LIMIT']:
+        return jsonify(error = f"At most {current_app.config['FLEET_BATCH_LIMIT']} vehicles per request"), 400
+
+    rows  =  release_reservations(user, reservation_ids, vehicle_numbers)
+    for row in rows:
+        allocator.release(row.lot_id, row.spot_id)
+        booking_index.remove(row.lot_id, row.id)
+    if rows:
+        cache.invalidate(LOTS)
+        notify_settlement(current_app)
+    released_ids  =  {row.id for row in rows}
+    released_vehicles  =  {row.vehicle_number for row in rows}
+    return jsonify(
+        released = [{
+            'reservation_id': row.id,
+            'vehicle_number': row.vehicle_number,
+            'lot_id': row.lot_id,
+            'spot_id': row.spot_id,
+            'spot_number': row.spot_number,
+            'cost': round(row.cost, 2),
+        } for row in rows],
+        total_cost = round(sum(row.cost for row in rows), 2),
+        not_found = [reservation_id for reservation_id in reservation_ids if reservation_id not in released_ids]
+                    + [number for number in vehicle_numbers if number not in released_vehicles]
+    )
+
+@routes_bp.route('/api/lots/<int:lot_id>/free', methods = ['GET'])
+def lot_free_spots(lot_id):
+    # Spots of one lot free for a whole window, from the lot's interval tree
+    try:
+        start  =  datetime.fromisoformat(request.args['start'])
+        end  =  datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify(error = "Give start and end as ISO date-times"), 400
+    if end <= start:
+        return jsonify(error = "end must be after start"), 400
+    if db.session.get(ParkingLot, lot_id) is None:
+        return jsonify(error = "No such lot"), 404
+    free  =  booking_index.free_spots(lot_id, start, end)
+    return jsonify(lot_id = lot_id, start = start.isoformat(), end = end.isoformat(), free_spots = len(free), spot_numbers = list(free.values()))
+
+@routes_bp.route('/api/lots/availability', methods = ['GET'])
+@query_budget(1)
+def lots_availability():
+    pincode  =  request.args.get('pincode')
+    return jsonify(lots = cache.get_or_set(LOTS, f"availability:{pincode}", lambda: lot_availability(pincode)))
+
 @routes_bp.route('/summary', methods = ['GET'])
 def summary():
-    user  =  User.query.filter_by(email = session['email']).first()
-   
-
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days = 6)
-    dates = [start_date + timedelta(days = x) for x in range(7)]
-
-
-    records = PastReservations.query.filter(
-        PastReservations.user_email == user.email,
-        PastReservations.parking_timestamp.between(start_date, end_date + timedelta(days=1))
-    ).all()
-
-    results = PastReservations.query.filter(
-        PastReservations.user_email == user.email,
-        PastReservations.leaving_timestamp.between(start_date, end_date + timedelta(days = 1))
-    ).all()
-
-    res_counts = {date.strftime('%d-%m-%Y'): 0 for date in dates}
-    for record in records:
-        res_counts[record.parking_timestamp.strftime('%d-%m-%Y')] += 1
-    res_counts_sorted = dict(sorted(res_counts.items()))
-
-    cost_counts = {date.strftime('%d-%m-%Y') : 0 for date in dates}
-    for result in results:
-        cost_counts[result.leaving_timestamp.strftime('%d-%m-%Y')] += result.total_cost
-    cost_counts_sorted = dict(sorted(cost_counts.items()))
-
-    labels =[date for date in res_counts_sorted.keys()]
-    res_values = [count for count in res_counts_sorted.values()]
-    cost_values = [cost for cost in cost_counts_sorted.values()]
+    user  =  g.current_user
+    days  =  summary_range(request.args.get('days', type = int))
 
+    return render_template('summary.html', user = user, days = days, ranges = SUMMARY_RANGES)
 
-    return render_template('summary.html', user = user, labels = labels, res_values = res_values, cost_values = cost_values)
+@routes_bp.route('/summary/data', methods = ['GET'])
+def summary_data():
+    if 'email' not in session:
+        return redirect(url_for('routes_bp.login'))
+    user  =  g.current_user
+    days  =  summary_range(request.args.get('days', type = int))
+
+    dates, res_values, cost_values  =  daily_series(days, user_email = user.email)
+    response  =  jsonify(
+        labels = [day.strftime('%d-%m-%Y') for day in dates],
+        res_values = res_values,
+        cost_values = cost_values
+    )
+    # Charts are re-fetched on every visit; an unchanged series costs a 304
+    response.add_etag()
+    response.cache_control.private  =  True
+    response.cache_control.no_cache  =  True
+    return response.make_conditional(request)
+
+def _revenue_series(days):
+    dates, _, rev_values  =  daily_series(days)
+    return [day.strftime('%d-%m-%Y') for day in dates], rev_values
 
 @routes_bp.route('/admin/summary', methods = ['GET', 'POST'])
 def admin_summary():
-    user  =  User.query.filter_by(email = session['email']).first()
+    user  =  g.current_user
     if user.is_admin == True:
-        total_spots = ParkingSpot.query.count()
-        reserved_spots = ParkingSpot.query.filter(ParkingSpot.is_reserved == True).count()
-        unreserved_spots = total_spots - reserved_spots
-
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days = 6)
-    dates = [start_date + timedelta(days = x) for x in range(7)]
-
-    records = PastReservations.query.filter(
-        PastReservations.leaving_timestamp.between(start_date, end_date + timedelta(days=1))
-    ).all()
-
-    rev_counts = {date.strftime('%d-%m-%Y') : 0 for date in dates}
-    for record in records:
-        rev_counts[record.leaving_timestamp.strftime('%d-%m-%Y')] += record.total_cost
-
-    rev_counts_sorted = dict(sorted(rev_counts.items()))
-    labels =[date for date in rev_counts_sorted.keys()]
-    rev_values = [rev for rev in rev_counts_sorted.values()]
-
-    return render_template('admin/summary.html', reserved_spots = reserved_spots, unreserved_spots = unreserved_spots, labels = labels, rev_values = rev_values)
+        reserved_spots, unreserved_spots = cache.get_or_set(LOTS, 'spot_totals', lambda: tuple(db.session.query(
+            func.coalesce(func.sum(ParkingLot.reserved_spots), 0),
+            func.coalesce(func.sum(ParkingLot.available_spots), 0)
+        ).one()))
+
+    days  =  summary_range(request.args.get('days', type = int))
+    labels, rev_values  =  cache.get_or_set(RESERVATIONS, f"revenue:{date.today()}:{days}", lambda: _revenue_series(days))
+
+    return render_template('admin/summary.html', reserved_spots = reserved_spots, unreserved_spots = unreserved_spots, labels = labels, rev_values = rev_values,
+                           days = days, ranges = SUMMARY_RANGES, analytics = analytics_available())
+
+def _analytics_unavailable():
+    user  =  g.current_user
+    if user is None or not user.is_admin:
+        return jsonify(error = "Admin login required"), 403
+    if not analytics_available():
+        return jsonify(error = "Lot analytics need NumPy installed on the server"), 501
+    return None
+
+@routes_bp.route('/admin/summary/analytics', methods = ['GET'])
+def admin_analytics():
+    unavailable  =  _analytics_unavailable()
+    if unavailable:
+        return unavailable
+    days  =  summary_range(request.args.get('days', type = int))
+    return jsonify(cache.get_or_set(
+        ANALYTICS, f"lots:{date.today()}:{days}", lambda: lot_analytics(days),
+        ttl = current_app.config['ANALYTICS_CACHE_TTL']
+    ))
+
+@routes_bp.route('/admin/summary/analytics/<int:lot_id>', methods = ['GET'])
+def admin_lot_analytics(lot_id):
+    unavailable  =  _analytics_unavailable()
+    if unavailable:
+        return unavailable
+    days  =  summary_range(request.args.get('days', type = int))
+    result  =  cache.get_or_set(
+        ANALYTICS, f"lot:{date.today()}:{days}:{lot_id}", lambda: lot_analytics(days, [lot_id], series = True),
+        ttl = current_app.config['ANALYTICS_CACHE_TTL']
+    )
+    if not result['lots']:
+        return jsonify(error = "Lot not found"), 404
+    return jsonify(result)
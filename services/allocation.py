@@ -0,0 +1,196 @@
+# Spot allocation engine
+import random
+from collections import deque
+from datetime import datetime
+from threading import Lock
+from sqlalchemy import exists, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models.models import db, ParkingSpot, Reservation
+from services.bookings import booking_index, spot_is_booked
+from services.occupancy import adjust_occupancy
+
+
+POOL_REFILL_SIZE = 32
+MAX_CLAIM_ATTEMPTS = 8
+
+
+def _booked_ahead(now):
+    # A spot free at ``now`` with a reservation that has not ended is booked ahead
+    return exists().where(
+        Reservation.spot_id == ParkingSpot.id,
+        or_(Reservation.booked_until.is_(None), Reservation.booked_until > now)
+    )
+
+
+class SpotAllocator:
+    """Hands out free spots of a lot without letting two bookings share one.
+
+    A spot is claimed with a single conditional UPDATE (``is_reserved`` goes
+    from False to True only if it is still False), so the database decides
+    who wins a race. The per-lot pool of candidate spot ids is only a hint
+    that saves a SELECT per booking; a stale entry loses the UPDATE and
+    the pool is refilled from the database. A parking has no end, so it only
+    takes a spot with no booking ahead (services.bookings) either; that is
+    checked again under the spot's row lock.
+    """
+
+    def __init__(self, refill_size = POOL_REFILL_SIZE, max_attempts = MAX_CLAIM_ATTEMPTS):
+        self.refill_size  =  refill_size
+        self.max_attempts  =  max_attempts
+        self._pools  =  {}
+        self._lock  =  Lock()
+
+    def _refill(self, lot_id):
+        spot_ids  =  db.session.execute(
+            select(ParkingSpot.id)
+            .where(ParkingSpot.lot_id == lot_id, ParkingSpot.is_reserved == False, ~_booked_ahead(datetime.now()))
+            .limit(self.refill_size)
+        ).scalars().all()
+        # Shuffle so that workers refilling at the same time do not all
+        # fight over the lowest spot ids.
+        random.shuffle(spot_ids)
+        return spot_ids
+
+    def _next_candidate(self, lot_id, fresh = False):
+        with self._lock:
+            if fresh:
+                self._pools.pop(lot_id, None)
+            pool  =  self._pools.get(lot_id)
+            if pool:
+                return pool.popleft()
+
+        spot_ids  =  self._refill(lot_id)
+        with self._lock:
+            pool  =  self._pools.setdefault(lot_id, deque())
+            known  =  set(pool)
+            pool.extend(spot_id for spot_id in spot_ids if spot_id not in known)
+            return pool.popleft() if pool else None
+
+    def claim(self, lot_id, user_id, vehicle_number, parking_timestamp = None):
+        """Reserve any free spot of ``lot_id`` for the user and commit.
+
+        Returns the new ``Reservation``, or None when the lot has no free
+        spot left (or every attempt failed). A candidate another process
+        already took is not an attempt: the lot's pool is stale, so it is
+        dropped and refilled from the database, and the lot only counts as
+        full once a fresh refill comes back empty.
+        """
+        parking_timestamp  =  parking_timestamp or datetime.now()
+        attempts  =  0
+        stale  =  False
+        while attempts < self.max_attempts:
+            spot_id  =  self._next_candidate(lot_id, fresh = stale)
+            if spot_id is None:
+                return None
+
+            try:
+                claimed  =  db.session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id == spot_id, ParkingSpot.is_reserved == False)
+                    .values(is_reserved = True)
+                    .execution_options(synchronize_session = False)
+                ).rowcount
+                stale  =  not claimed
+                if stale:
+                    db.session.rollback()
+                    continue
+                if spot_is_booked(spot_id, parking_timestamp):
+                    db.session.rollback()
+                    attempts += 1
+                    continue
+                adjust_occupancy(lot_id, 1)
+
+                reservation  =  Reservation(
+                    spot_id = spot_id,
+                    user_id = user_id,
+                    parking_timestamp = parking_timestamp,
+                    vehicle_number = vehicle_number
+                )
+                db.session.add(reservation)
+                # Flushed first so the id is known without a reload after commit
+                db.session.flush()
+                interval  =  (reservation.id, spot_id, reservation.parking_timestamp)
+                db.session.commit()
+            except (IntegrityError, OperationalError):
+                db.session.rollback()
+                attempts += 1
+                continue
+            booking_index.add(lot_id, *interval)
+            return reservation
+        return None
+
+    def claim_many(self, lot_ids, user_id, vehicle_numbers, parking_timestamp = None):
+        """Reserve one spot per vehicle, filling ``lot_ids`` in order, and commit.
+
+        Each lot gives up its free spots in one conditional UPDATE, so the
+        batch takes what is free right now instead of locking spots one by
+        one, and all reservations go in with a single multi-row INSERT.
+        Returns ``(reserved, unplaced)``: dicts describing each new
+        reservation, and the vehicle numbers left over when the lots had
+        fewer free spots than vehicles.
+        """
+        parking_timestamp  =  parking_timestamp or datetime.now()
+        claimed  =  []
+        try:
+            for lot_id in lot_ids:
+                wanted  =  len(vehicle_numbers) - len(claimed)
+                if wanted <= 0:
+                    break
+                free  =  (
+                    select(ParkingSpot.id)
+                    .where(ParkingSpot.lot_id == lot_id, ParkingSpot.is_reserved == False, ~_booked_ahead(parking_timestamp))
+                    .limit(wanted)
+                )
+                spots  =  db.session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id.in_(free), ParkingSpot.is_reserved == False)
+                    .values(is_reserved = True)
+                    .returning(ParkingSpot.id, ParkingSpot.spot_number)
+                    .execution_options(synchronize_session = False)
+                ).all()
+                if spots:
+                    adjust_occupancy(lot_id, len(spots))
+                    claimed.extend((lot_id, spot.id, spot.spot_number) for spot in spots)
+
+            if not claimed:
+                db.session.rollback()
+                return [], list(vehicle_numbers)
+            reserved  =  [
+                {'lot_id': lot_id, 'spot_id': spot_id, 'spot_number': spot_number, 'vehicle_number': vehicle_number}
+                for (lot_id, spot_id, spot_number), vehicle_number in zip(claimed, vehicle_numbers)
+            ]
+            reservation_ids  =  db.session.scalars(
+                insert(Reservation).returning(Reservation.id, sort_by_parameter_order = True),
+                [{
+                    'spot_id': row['spot_id'],
+                    'user_id': user_id,
+                    'parking_timestamp': parking_timestamp,
+                    'vehicle_number': row['vehicle_number'],
+                } for row in reserved]
+            ).all()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for row, reservation_id in zip(reserved, reservation_ids):
+            row['reservation_id']  =  reservation_id
+            booking_index.add(row['lot_id'], reservation_id, row['spot_id'], parking_timestamp)
+        return reserved, list(vehicle_numbers[len(reserved):])
+
+    def release(self, lot_id, spot_id):
+        """Put a freed spot back into its lot's pool (call after commit)."""
+        with self._lock:
+            pool  =  self._pools.get(lot_id)
+            if pool is not None and spot_id not in pool:
+                pool.append(spot_id)
+
+    def reset(self, lot_id = None):
+        """Forget cached candidates for one lot, or for every lot."""
+        with self._lock:
+            if lot_id is None:
+                self._pools.clear()
+            else:
+                self._pools.pop(lot_id, None)
+
+
+allocator  =  SpotAllocator()
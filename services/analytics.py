@@ -0,0 +1,227 @@
+# Per-lot occupancy and revenue analytics over the parking history
+#
+# History rows are streamed out of the database in chunks of columnar
+# NumPy arrays (lot, start hour, end hour, cost) and folded into per-lot
+# accumulators with vectorized passes, so memory stays bounded by the chunk
+# size and the lot x hour grid however long the history is. NumPy is an
+# optional dependency: without it the analytics endpoints answer 501.
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+from sqlalchemy import DateTime, func, literal, select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import UnaryExpression
+from models.models import db, ParkingLot, ParkingSpot, Reservation
+from services.archive import archived_months, hot_history, month_start, partition_table
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+ANALYTICS_CHUNK_SIZE = 250000
+# Past this share of the hot table's history, SQLite reads the window
+# faster with a table scan than by walking the leaving_timestamp index
+INDEX_SCAN_SHARE = 0.1
+
+
+def analytics_available():
+    return np is not None
+
+
+def _window(days, today):
+    # The last ``days`` complete days, midnight to midnight
+    end  =  datetime.combine(today or date.today(), time.min)
+    return end - timedelta(days = days), end
+
+
+def _epoch_hours(column):
+    # Hours since 1970 as computed by the database; the window start is
+    # subtracted afterwards in NumPy rather than once per row in SQL
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', column) / 3600
+    return (func.julianday(column) - 2440587.5) * 24
+
+
+def _history_sources(start, end, lot_ids):
+    # Only archive months that can hold rows leaving inside the window
+    months  =  [month for month in archived_months() if month >= month_start(start.date())]
+    oldest  =  db.session.scalar(select(func.min(hot_history.c.leaving_timestamp)))
+    tables  =  [(hot_history, oldest)] + [(partition_table(month), datetime.combine(month, time.min)) for month in months]
+    for table, oldest in tables:
+        history  =  table.c
+        query  =  select(
+            func.coalesce(history.lot_id, -1),
+            _epoch_hours(history.parking_timestamp),
+            _epoch_hours(history.leaving_timestamp),
+            func.coalesce(history.total_cost, 0),
+        ).where(
+            history.parking_timestamp < end,
+            history.parking_timestamp.is_not(None),
+        )
+        if oldest is None or oldest < start:
+            leaving  =  history.leaving_timestamp
+            # An empty hot table (oldest None) has nothing to scan either way
+            if table is hot_history and oldest is not None and db.engine.dialect.name == 'sqlite' \
+                    and (end - start) > (end - oldest) * INDEX_SCAN_SHARE:
+                # A unary + keeps SQLite from using the index for this term
+                leaving  =  UnaryExpression(leaving, operator = operators.custom_op('+'), type_ = leaving.type)
+            query  =  query.where(leaving >= start)
+        # else every row left inside the window: leaving the range out lets
+        # the database scan the table instead of walking the whole index
+        if lot_ids is not None:
+            query  =  query.where(history.lot_id.in_(lot_ids))
+        yield query
+
+
+def _open_reservations(start, end, lot_ids):
+    # Vehicles still parked occupy their spot up to now; they have no cost yet
+    now  =  literal(min(datetime.now(), end), DateTime)
+    query  =  (
+        select(
+            ParkingSpot.lot_id,
+            _epoch_hours(Reservation.parking_timestamp),
+            _epoch_hours(now),
+            literal(None),
+        )
+        .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+        .where(Reservation.parking_timestamp < end)
+    )
+    if lot_ids is not None:
+        query  =  query.where(ParkingSpot.lot_id.in_(lot_ids))
+    return query
+
+
+def _chunks(query, start):
+    offset  =  (start - datetime(1970, 1, 1)).total_seconds() / 3600
+    result  =  db.session.connection().execute(query)
+    try:
+        # Every column is a plain number, so rows come straight off the
+        # DBAPI cursor as tuples without building a Row for each one
+        while True:
+            rows  =  result.cursor.fetchmany(ANALYTICS_CHUNK_SIZE)
+            if not rows:
+                return
+            # Columns: lot id, start and end hour in the window, cost (NaN
+            # for open reservations)
+            chunk  =  np.fromiter(chain.from_iterable(rows), dtype = np.float64, count = len(rows) * 4).reshape(-1, 4)
+            chunk[:, 1:3] -= offset
+            yield chunk
+    finally:
+        result.close()
+
+
+class _Accumulator:
+    """Running per-lot totals over a window of ``hours`` hourly bins."""
+
+    def __init__(self, lot_ids, hours):
+        self.lot_ids  =  lot_ids
+        self.hours  =  hours
+        lots  =  len(lot_ids)
+        # Spot-hours occupied in each hourly bin; whole hours covered by an
+        # interval are added through a difference array and summed at the end
+        self.occupied  =  np.zeros(lots * hours)
+        self.covered  =  np.zeros(lots * (hours + 1))
+        self.releases  =  np.zeros(lots)
+        self.dwell_hours  =  np.zeros(lots)
+        self.revenue  =  np.zeros(lots)
+
+    def add(self, chunk):
+        lots, hours  =  len(self.lot_ids), self.hours
+        position  =  np.searchsorted(self.lot_ids, chunk[:, 0])
+        position  =  np.minimum(position, lots - 1)
+        known  =  self.lot_ids[position] == chunk[:, 0]
+        lot, started, ended, cost  =  position[known], chunk[known, 1], chunk[known, 2], chunk[known, 3]
+
+        # Dwell time and revenue count releases that left inside the window
+        released  =  (ended >= 0) & (ended < hours) & ~np.isnan(cost)
+        self.releases += np.bincount(lot[released], minlength = lots)
+        self.dwell_hours += np.bincount(lot[released], weights = (ended - started)[released], minlength = lots)
+        self.revenue += np.bincount(lot[released], weights = cost[released], minlength = lots)
+
+        start, end  =  np.clip(started, 0, hours), np.clip(ended, 0, hours)
+        inside  =  end > start
+        lot, start, end  =  lot[inside], start[inside], end[inside]
+        first, last  =  np.floor(start).astype(np.int64), np.floor(end).astype(np.int64)
+        same  =  first == last
+        # The partial first hour (or the whole interval when it fits in one hour)
+        self.occupied += np.bincount(
+            lot * hours + first,
+            weights = np.where(same, end - start, first + 1 - start),
+            minlength = lots * hours
+        )
+        # The partial last hour
+        tail  =  ~same & (last < hours)
+        self.occupied += np.bincount(
+            lot[tail] * hours + last[tail], weights = end[tail] - last[tail], minlength = lots * hours
+        )
+        # Every whole hour in between
+        span  =  ~same & (last > first + 1)
+        width  =  hours + 1
+        self.covered += np.bincount(lot[span] * width + first[span] + 1, minlength = lots * width)
+        self.covered -= np.bincount(lot[span] * width + last[span], minlength = lots * width)
+
+    def occupancy(self):
+        """Average number of occupied spots in each hour, one row per lot."""
+        whole  =  np.cumsum(self.covered.reshape(len(self.lot_ids), self.hours + 1), axis = 1)[:, :self.hours]
+        return self.occupied.reshape(len(self.lot_ids), self.hours) + whole
+
+
+def _number(value, digits = 4):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def lot_analytics(days, lot_ids = None, today = None, series = False):
+    """Occupancy, dwell time and revenue per lot over the last ``days`` complete days.
+
+    For each lot: the average utilization in each hour of the day, the mean
+    and peak hourly utilization (and when the peak was), the average dwell
+    time and the revenue, in total and per spot, of the parkings that ended
+    in the window. Utilization is measured against the lot's current
+    number of spots. With ``series`` each lot also carries its hourly
+    utilization for the whole window. Requires NumPy.
+    """
+    if np is None:
+        raise RuntimeError("Lot analytics need NumPy: pip install numpy")
+    start, end  =  _window(days, today)
+    hours  =  days * 24
+
+    lots  =  select(ParkingLot.id, ParkingLot.prime_location_name, ParkingLot.max_spots).order_by(ParkingLot.id)
+    if lot_ids is not None:
+        lots  =  lots.where(ParkingLot.id.in_(lot_ids))
+    lots  =  db.session.execute(lots).all()
+    result  =  {'days': days, 'start': start.isoformat(), 'end': end.isoformat(), 'lots': []}
+    if not lots:
+        return result
+
+    totals  =  _Accumulator(np.array([lot.id for lot in lots], dtype = np.float64), hours)
+    for query in [*_history_sources(start, end, lot_ids), _open_reservations(start, end, lot_ids)]:
+        for chunk in _chunks(query, start):
+            totals.add(chunk)
+
+    capacity  =  np.array([lot.max_spots or np.nan for lot in lots], dtype = np.float64)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        utilization  =  totals.occupancy() / capacity[:, None]
+        by_hour_of_day  =  utilization.reshape(len(lots), days, 24).mean(axis = 1)
+        average_dwell  =  totals.dwell_hours / totals.releases
+        revenue_per_spot  =  totals.revenue / capacity
+    peak_hours  =  np.nan_to_num(utilization).argmax(axis = 1)
+
+    for index, lot in enumerate(lots):
+        entry  =  {
+            'lot_id': lot.id,
+            'prime_location_name': lot.prime_location_name,
+            'max_spots': lot.max_spots,
+            'releases': int(totals.releases[index]),
+            'average_dwell_hours': _number(average_dwell[index]),
+            'revenue': round(float(totals.revenue[index]), 2),
+            'revenue_per_spot': _number(revenue_per_spot[index], 2),
+            'mean_utilization': _number(utilization[index].mean()),
+            'peak_utilization': _number(utilization[index].max()),
+            'peak_hour': (start + timedelta(hours = int(peak_hours[index]))).isoformat() if utilization[index].max() > 0 else None,
+            'hourly_utilization': [_number(value) for value in by_hour_of_day[index]],
+        }
+        if series:
+            entry['utilization']  =  [_number(value) for value in utilization[index]]
+        result['lots'].append(entry)
+    return result
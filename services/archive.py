@@ -0,0 +1,103 @@
+# Monthly archive partitions for PastReservations
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import Column, Index, MetaData, Table, and_, delete, func, insert, select
+from models.models import db, HistoryArchive, PastReservations
+
+
+ARCHIVE_HORIZON_DAYS = 180
+
+# Partition tables are created on demand, so they live outside db.metadata
+# and are never touched by create_all.
+archive_metadata  =  MetaData()
+hot_history  =  PastReservations.__table__
+
+
+def month_start(day):
+    return day.replace(day = 1)
+
+
+def next_month(month):
+    return (month.replace(day = 28) + timedelta(days = 4)).replace(day = 1)
+
+
+def partition_table(month):
+    """The archive table holding history rows that left during ``month``."""
+    name  =  f"past_reservations_{month:%Y_%m}"
+    table  =  archive_metadata.tables.get(name)
+    if table is None:
+        table  =  Table(
+            name, archive_metadata,
+            *[Column(column.name, column.type, primary_key = column.primary_key) for column in hot_history.columns],
+            Index(f"ix_{name}_user_leaving", 'user_email', 'leaving_timestamp'),
+            Index(f"ix_{name}_lot_leaving", 'lot_id', 'leaving_timestamp'),
+        )
+    return table
+
+
+def archived_months(before = None):
+    """Archived months, newest first; only those starting before ``before`` if given."""
+    query  =  select(HistoryArchive.month).order_by(HistoryArchive.month.desc())
+    if before is not None:
+        query  =  query.where(HistoryArchive.month <= before.date())
+    return db.session.scalars(query).all()
+
+
+def history_tables(before = None):
+    """The hot history table, then the archive partitions that can hold rows older than ``before``.
+
+    A generator, so callers that are satisfied by the hot table never look
+    up the archive at all.
+    """
+    yield hot_history
+    for month in archived_months(before):
+        yield partition_table(month)
+
+
+def archive_cutoff(horizon_days = ARCHIVE_HORIZON_DAYS, today = None):
+    # Whole months only: everything before the month the horizon falls in
+    return month_start((today or date.today()) - timedelta(days = horizon_days))
+
+
+def archive_history(horizon_days = ARCHIVE_HORIZON_DAYS):
+    """Move history older than the horizon into monthly partition tables.
+
+    Each month is copied and deleted in its own transaction, so an
+    interrupted run leaves every row in exactly one table and the next run
+    carries on. The daily rollups are not touched, so the summary charts
+    keep showing archived months. Returns ``{month: rows moved}``.
+    """
+    cutoff  =  datetime.combine(archive_cutoff(horizon_days), time.min)
+    oldest  =  db.session.scalar(
+        select(func.min(hot_history.c.leaving_timestamp)).where(hot_history.c.leaving_timestamp < cutoff)
+    )
+    moved  =  {}
+    month  =  month_start(oldest.date()) if oldest else None
+    while month is not None and month < cutoff.date():
+        end  =  next_month(month)
+        in_month  =  and_(
+            hot_history.c.leaving_timestamp >= datetime.combine(month, time.min),
+            hot_history.c.leaving_timestamp < datetime.combine(end, time.min)
+        )
+        if db.session.execute(select(hot_history.c.id).where(in_month).limit(1)).first() is None:
+            month  =  end
+            continue
+        table  =  partition_table(month)
+        try:
+            table.create(db.session.connection(), checkfirst = True)
+            db.session.execute(insert(table).from_select(
+                [column.name for column in hot_history.columns], select(hot_history).where(in_month)
+            ))
+            count  =  db.session.execute(delete(hot_history).where(in_month)).rowcount
+            entry  =  db.session.get(HistoryArchive, month)
+            if entry is None:
+                entry  =  HistoryArchive(month = month, table_name = table.name, rows = 0)
+                db.session.add(entry)
+            entry.rows += count
+            entry.archived_at  =  datetime.now()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved[month]  =  count
+        month  =  end
+    return moved
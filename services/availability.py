@@ -0,0 +1,348 @@
+# Live lot availability pushed to browsers over server-sent events
+#
+# App processes (every gunicorn worker, or the dev server) publish
+# availability changes as small UDP datagrams on localhost; one
+# AvailabilityHub, running an asyncio loop in a single thread of its own
+# process (`flask availability serve`, started by gunicorn), fans them out
+# to every subscribed EventSource connection. Idle subscribers cost a
+# socket each, not a thread.
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+REPLAY_SIZE = 1024
+KEEPALIVE_SECONDS = 15
+MAX_LOTS_PER_SUBSCRIPTION = 200
+MAX_BUFFERED_BYTES = 64 * 1024
+
+hub_log  =  logging.getLogger('availability')
+
+
+# Publishing side: runs in the app processes
+
+_publish_socket  =  None
+
+
+def _send(events):
+    global _publish_socket
+    if not events:
+        return
+    if _publish_socket is None:
+        _publish_socket  =  socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        _publish_socket.sendto(
+            json.dumps(events).encode(),
+            ('127.0.0.1', current_app.config['AVAILABILITY_PORT'])
+        )
+    except OSError:
+        # No hub listening; availability push is best effort
+        pass
+
+
+def _enabled():
+    return has_app_context() and current_app.config.get('AVAILABILITY_PUSH', False)
+
+
+def record_change(lot_id, available, reserved):
+    """Note a change to a lot's counters, published when the current transaction commits."""
+    if not _enabled():
+        return
+    from models.models import db
+    changes  =  db.session.info.setdefault('availability_changes', {})
+    totals  =  changes.setdefault(lot_id, [0, 0])
+    totals[0] += available
+    totals[1] += reserved
+
+
+def publish_lot(lot, removed = False):
+    """Publish a lot's current counters (or its removal) straight away."""
+    if not _enabled():
+        return
+    if removed:
+        _send([{'lot': lot.id, 'removed': True}])
+    else:
+        _send([{
+            'lot': lot.id,
+            'available_spots': lot.available_spots,
+            'reserved_spots': lot.reserved_spots,
+            'is_active': lot.is_active,
+        }])
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    changes  =  session.info.pop('availability_changes', None)
+    if changes and _enabled():
+        _send([
+            {'lot': lot_id, 'available': available, 'reserved': reserved}
+            for lot_id, (available, reserved) in changes.items()
+            if available or reserved
+        ])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back(session):
+    session.info.pop('availability_changes', None)
+
+
+# Fan-out side: one hub per host
+
+class _Subscriber:
+    def __init__(self, writer, lots):
+        self.writer  =  writer
+        self.lots  =  lots
+
+
+class _PublishProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub  =  hub
+
+    def datagram_received(self, data, addr):
+        try:
+            events  =  json.loads(data)
+        except ValueError:
+            return
+        for payload in events if isinstance(events, list) else []:
+            self.hub.broadcast(payload)
+
+
+class AvailabilityHub:
+    """Single-threaded asyncio server for availability events.
+
+    Serves ``GET /events?lots=1,2,3`` as a text/event-stream (all lots when
+    ``lots`` is omitted). Every event carries an id; a reconnecting client
+    sends it back as Last-Event-ID and gets what it missed from a replay
+    buffer of the last ``replay_size`` events, or a ``resync`` event telling
+    it to reload the counts when that is no longer possible. Pages served
+    from another origin may subscribe only if it is in ``cors_origins``.
+    """
+
+    def __init__(self, host, port, replay_size = REPLAY_SIZE, keepalive = KEEPALIVE_SECONDS, cors_origins = ()):
+        self.host  =  host
+        self.port  =  port
+        self.keepalive  =  keepalive
+        self.cors_origins  =  frozenset(cors_origins)
+        # Event ids are "<boot>-<sequence>" so ids from before a restart are recognised
+        self.boot  =  format(int(time.time()), 'x')
+        self.sequence  =  0
+        self.replay  =  deque(maxlen = replay_size)
+        self.by_lot  =  {}
+        self.everything  =  set()
+        self.loop  =  None
+
+    def _open(self):
+        # A new event loop with the hub's sockets bound; False if the port is taken
+        self.loop  =  asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._bind())
+        except OSError as error:
+            hub_log.info('Availability hub not started: %s', error)
+            self.loop.close()
+            return False
+        self.loop.create_task(self._keepalive())
+        hub_log.info('Availability hub serving on %s:%s (pid %s)', self.host, self.port, os.getpid())
+        return True
+
+    def start(self):
+        """Bind and serve from a daemon thread; False if another hub already holds the port."""
+        ready  =  threading.Event()
+        result  =  {}
+
+        def run():
+            result['ok']  =  self._open()
+            ready.set()
+            if result['ok']:
+                self.loop.run_forever()
+
+        threading.Thread(target = run, name = 'availability-hub', daemon = True).start()
+        ready.wait()
+        return result['ok']
+
+    def serve_forever(self):
+        """Bind and serve in the calling thread until interrupted; False if the port is taken."""
+        if not self._open():
+            return False
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.loop.close()
+        return True
+
+    async def _bind(self):
+        await asyncio.start_server(self._serve, self.host, self.port, backlog = 1024)
+        await self.loop.create_datagram_endpoint(lambda: _PublishProtocol(self), local_addr = ('127.0.0.1', self.port))
+
+    def _frame(self, event_id, name, payload):
+        return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload)}\n\n".encode()
+
+    def broadcast(self, payload):
+        lot_id  =  payload.get('lot')
+        self.sequence += 1
+        frame  =  self._frame(f"{self.boot}-{self.sequence}", 'availability', payload)
+        self.replay.append((self.sequence, lot_id, frame))
+        for subscriber in list(self.by_lot.get(lot_id, ())) + list(self.everything):
+            self._write(subscriber, frame)
+
+    def _write(self, subscriber, frame):
+        transport  =  subscriber.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+            # A client that stopped reading is dropped rather than buffered for
+            transport.abort()
+            return
+        subscriber.writer.write(frame)
+
+    def _missed(self, last_event_id, lots):
+        # Frames after ``last_event_id``, or None when they are no longer all known
+        boot, _, sequence  =  (last_event_id or '').partition('-')
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        sequence  =  int(sequence)
+        if sequence > self.sequence or (self.replay and sequence < self.replay[0][0] - 1):
+            return None
+        return [frame for number, lot_id, frame in self.replay
+                if number > sequence and (lots is None or lot_id in lots)]
+
+    async def _read_request(self, reader):
+        head  =  await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout = 10)
+        lines  =  head.decode('latin-1').split('\r\n')
+        method, target, _  =  lines[0].split(' ', 2)
+        headers  =  {}
+        for line in lines[1:]:
+            name, _, value  =  line.partition(':')
+            headers[name.strip().lower()]  =  value.strip()
+        return method, urlsplit(target), headers
+
+    async def _serve(self, reader, writer):
+        try:
+            method, url, headers  =  await self._read_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            writer.close()
+            return
+        if method != 'GET' or url.path.rstrip('/') != '/events':
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+
+        query  =  parse_qs(url.query)
+        lots  =  None
+        if 'lots' in query:
+            lots  =  {int(part) for part in ','.join(query['lots']).split(',') if part.strip().isdigit()}
+            lots  =  set(sorted(lots)[:MAX_LOTS_PER_SUBSCRIPTION])
+        subscriber  =  _Subscriber(writer, lots)
+
+        # Same-origin pages (behind the proxy) need no CORS header at all
+        origin  =  headers.get('origin')
+        cors  =  f"Access-Control-Allow-Origin: {origin}\r\nVary: Origin\r\n".encode() if origin in self.cors_origins else b''
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream\r\n'
+            b'Cache-Control: no-cache\r\n'
+            b'Connection: keep-alive\r\n'
+            + cors +
+            b'X-Accel-Buffering: no\r\n\r\n'
+            b'retry: 3000\n\n'
+        )
+        last_event_id  =  headers.get('last-event-id') or (query.get('lastEventId') or [None])[0]
+        if last_event_id:
+            missed  =  self._missed(last_event_id, lots)
+            if missed is None:
+                writer.write(self._frame(f"{self.boot}-{self.sequence}", 'resync', {}))
+            else:
+                for frame in missed:
+                    writer.write(frame)
+
+        if lots is None:
+            self.everything.add(subscriber)
+        else:
+            for lot_id in lots:
+                self.by_lot.setdefault(lot_id, set()).add(subscriber)
+        try:
+            # Subscribers never send anything; this returns when they hang up
+            while await reader.read(1024):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.everything.discard(subscriber)
+            for lot_id in lots or ():
+                subscribers  =  self.by_lot.get(lot_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self.by_lot[lot_id]
+            writer.close()
+
+    async def _keepalive(self):
+        # Comment lines keep proxies from timing out idle streams
+        while True:
+            await asyncio.sleep(self.keepalive)
+            subscribers  =  set(self.everything)
+            for group in self.by_lot.values():
+                subscribers.update(group)
+            for subscriber in subscribers:
+                self._write(subscriber, b': keepalive\n\n')
+
+    def subscriber_count(self):
+        subscribers  =  set(self.everything)
+        for group in self.by_lot.values():
+            subscribers.update(group)
+        return len(subscribers)
+
+
+def _hub(app):
+    return AvailabilityHub(
+        app.config['AVAILABILITY_HOST'], app.config['AVAILABILITY_PORT'],
+        cors_origins = app.config.get('AVAILABILITY_CORS_ORIGINS', ())
+    )
+
+
+def start_availability_hub(app):
+    """Start a hub in a thread of the dev server, unless push is off or another process runs one.
+
+    Production runs the hub as its own process instead (``run_availability_hub``),
+    so that no process that forks workers has threads. Returns the hub, or None.
+    """
+    if not app.config.get('AVAILABILITY_PUSH', False):
+        return None
+    hub  =  _hub(app)
+    if not hub.start():
+        return None
+    app.extensions['availability_hub']  =  hub
+    return hub
+
+
+def run_availability_hub(app):
+    """Serve this host's hub in the calling process until it is stopped.
+
+    Returns False at once if push is off or the port is already taken.
+    """
+    if not app.config.get('AVAILABILITY_PUSH', False):
+        return False
+    return _hub(app).serve_forever()
+
+
+def init_availability(app):
+    """Give templates ``availability_url``: where browsers subscribe, or None when push is off."""
+    @app.context_processor
+    def availability_url():
+        if not app.config.get('AVAILABILITY_PUSH', False):
+            return {'availability_url': None}
+        url  =  app.config.get('AVAILABILITY_URL')
+        if not url:
+            # Same host as the page, on the hub's own port
+            url  =  f"//{request.host.rsplit(':', 1)[0]}:{app.config['AVAILABILITY_PORT']}/events"
+        return {'availability_url': url}
@@ -0,0 +1,384 @@
+# Advance bookings and the per-lot interval trees behind them
+#
+# A booking holds a spot for a window [start, end) that begins later; a
+# drive-in parking holds its spot from arrival until it is released. The
+# reservations of one spot never overlap. Each lot's reservations are kept
+# in an in-memory interval tree, so the spots of a lot free for a window
+# are found without a query. Like the allocator's spot pools the trees are
+# a per-process hint: every booking is checked again in the database under
+# the spot's row lock, and a lot whose tree turned out stale is reloaded.
+#
+# A spot's is_reserved flag and its lot's counters only count who holds
+# the spot now. A booking leaves them alone until its window begins, when
+# start_bookings marks the spot; services.settlement expires bookings
+# whose window has ended.
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models.models import db, ParkingSpot, Reservation
+from services.occupancy import adjust_occupancy
+
+
+BOOKING_HORIZON_DAYS = 30
+BOOKING_MAX_HOURS = 72
+BOOKING_INDEX_TTL = 300
+MAX_BOOKING_ATTEMPTS = 8
+# End of a reservation that lasts until it is released
+OPEN_END = datetime.max
+
+
+class _Node:
+    __slots__  =  ('start', 'end', 'key', 'value', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, start, end, key, value):
+        self.start  =  start
+        self.end  =  end
+        self.key  =  key
+        self.value  =  value
+        self.priority  =  random.random()
+        self.left  =  None
+        self.right  =  None
+        self.max_end  =  end
+
+
+def _refresh(node):
+    max_end  =  node.end
+    if node.left is not None and node.left.max_end > max_end:
+        max_end  =  node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end  =  node.right.max_end
+    node.max_end  =  max_end
+
+
+def _rotate_right(node):
+    top  =  node.left
+    node.left, top.right  =  top.right, node
+    _refresh(node)
+    _refresh(top)
+    return top
+
+
+def _rotate_left(node):
+    top  =  node.right
+    node.right, top.left  =  top.left, node
+    _refresh(node)
+    _refresh(top)
+    return top
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if (new.start, new.key) < (node.start, node.key):
+        node.left  =  _insert(node.left, new)
+        if node.left.priority > node.priority:
+            return _rotate_right(node)
+    else:
+        node.right  =  _insert(node.right, new)
+        if node.right.priority > node.priority:
+            return _rotate_left(node)
+    _refresh(node)
+    return node
+
+
+def _merge(left, right):
+    # Every key in ``left`` sorts before every key in ``right``
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right  =  _merge(left.right, right)
+        _refresh(left)
+        return left
+    right.left  =  _merge(left, right.left)
+    _refresh(right)
+    return right
+
+
+def _delete(node, target):
+    if node is None:
+        return None
+    here  =  (node.start, node.key)
+    if target == here:
+        return _merge(node.left, node.right)
+    if target < here:
+        node.left  =  _delete(node.left, target)
+    else:
+        node.right  =  _delete(node.right, target)
+    _refresh(node)
+    return node
+
+
+class IntervalTree:
+    """Half-open intervals [start, end), each with a unique key and a value.
+
+    A treap ordered by (start, key) in which every node also records the
+    latest end in its subtree: adding or removing an interval takes
+    O(log n) and finding the k intervals that overlap a window O(log n + k).
+    """
+
+    def __init__(self):
+        self._root  =  None
+        self._starts  =  {}
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, start, end, key, value):
+        if key in self._starts:
+            self.remove(key)
+        self._starts[key]  =  start
+        self._root  =  _insert(self._root, _Node(start, end, key, value))
+
+    def remove(self, key):
+        start  =  self._starts.pop(key, None)
+        if start is not None:
+            self._root  =  _delete(self._root, (start, key))
+
+    def overlapping(self, start, end):
+        """Values of the intervals that overlap [start, end)."""
+        found  =  []
+        stack  =  [self._root]
+        while stack:
+            node  =  stack.pop()
+            # Nothing in this subtree ends after the window starts
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.start < end:
+                if node.end > start:
+                    found.append(node.value)
+                stack.append(node.right)
+        return found
+
+
+class LotSchedule:
+    """One lot's spots (id -> spot number) and the tree of their reservations."""
+
+    def __init__(self, spots, reservations):
+        self.spots  =  spots
+        self.tree  =  IntervalTree()
+        self.loaded_at  =  time.monotonic()
+        for reservation_id, spot_id, start, end in reservations:
+            self.tree.add(start, end or OPEN_END, reservation_id, spot_id)
+
+    def free_spots(self, start, end):
+        taken  =  set(self.tree.overlapping(start, end))
+        return {spot_id: number for spot_id, number in self.spots.items() if spot_id not in taken}
+
+
+class BookingIndex:
+    """Interval trees of every lot's reservations, loaded from the database.
+
+    ``rebuild`` loads every lot at startup; a lot is loaded again on first
+    use after BOOKING_INDEX_TTL seconds, since other processes book and
+    release too. This process's own bookings, parkings and releases are
+    applied as they commit. Reservations that already ended are left out.
+    """
+
+    def __init__(self):
+        self._lots  =  {}
+        self._lock  =  threading.Lock()
+
+    def _load(self, lot_ids = None):
+        spots  =  select(ParkingSpot.lot_id, ParkingSpot.id, ParkingSpot.spot_number).order_by(ParkingSpot.lot_id, ParkingSpot.spot_number)
+        reservations  =  (
+            select(ParkingSpot.lot_id, Reservation.id, Reservation.spot_id, Reservation.parking_timestamp, Reservation.booked_until)
+            .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+            .where(or_(Reservation.booked_until.is_(None), Reservation.booked_until > datetime.now()))
+        )
+        if lot_ids is not None:
+            spots  =  spots.where(ParkingSpot.lot_id.in_(lot_ids))
+            reservations  =  reservations.where(ParkingSpot.lot_id.in_(lot_ids))
+        lot_spots  =  {lot_id: {} for lot_id in lot_ids or ()}
+        for lot_id, spot_id, number in db.session.execute(spots):
+            lot_spots.setdefault(lot_id, {})[spot_id]  =  number
+        lot_reservations  =  {}
+        for lot_id, *reservation in db.session.execute(reservations):
+            lot_reservations.setdefault(lot_id, []).append(reservation)
+        return {lot_id: LotSchedule(spots, lot_reservations.get(lot_id, ())) for lot_id, spots in lot_spots.items()}
+
+    def rebuild(self):
+        """Load every lot; returns the number of lots loaded."""
+        schedules  =  self._load()
+        with self._lock:
+            self._lots  =  schedules
+        return len(schedules)
+
+    def _schedule(self, lot_id):
+        ttl  =  current_app.config.get('BOOKING_INDEX_TTL', BOOKING_INDEX_TTL)
+        with self._lock:
+            schedule  =  self._lots.get(lot_id)
+            if schedule is not None and time.monotonic() - schedule.loaded_at < ttl:
+                return schedule
+        schedule  =  self._load([lot_id])[lot_id]
+        with self._lock:
+            self._lots[lot_id]  =  schedule
+        return schedule
+
+    def free_spots(self, lot_id, start, end):
+        """Spots of ``lot_id`` free for all of [start, end), as spot id -> spot number."""
+        schedule  =  self._schedule(lot_id)
+        with self._lock:
+            return schedule.free_spots(start, end)
+
+    def add(self, lot_id, reservation_id, spot_id, start, end = None):
+        """Record a committed reservation (``end`` None: until released)."""
+        with self._lock:
+            schedule  =  self._lots.get(lot_id)
+            if schedule is not None:
+                schedule.tree.add(start, end or OPEN_END, reservation_id, spot_id)
+
+    def remove(self, lot_id, reservation_id):
+        """Forget a released or cancelled reservation (call after commit)."""
+        with self._lock:
+            schedule  =  self._lots.get(lot_id)
+            if schedule is not None:
+                schedule.tree.remove(reservation_id)
+
+    def reset(self, lot_id = None):
+        """Drop one lot's tree, or every lot's, to be loaded again on next use."""
+        with self._lock:
+            if lot_id is None:
+                self._lots.clear()
+            else:
+                self._lots.pop(lot_id, None)
+
+
+booking_index  =  BookingIndex()
+
+
+def booking_window(start, end, now = None):
+    """Check a requested booking window; returns it, or raises ValueError.
+
+    A window that has already begun starts now. It must end after it
+    starts, begin within BOOKING_HORIZON_DAYS and last at most
+    BOOKING_MAX_HOURS.
+    """
+    now  =  now or datetime.now()
+    horizon  =  current_app.config.get('BOOKING_HORIZON_DAYS', BOOKING_HORIZON_DAYS)
+    max_hours  =  current_app.config.get('BOOKING_MAX_HOURS', BOOKING_MAX_HOURS)
+    start  =  max(start, now)
+    if end <= start:
+        raise ValueError("The booking must end after it starts, and in the future")
+    if start > now + timedelta(days = horizon):
+        raise ValueError(f"Bookings can start at most {horizon} days ahead")
+    if end - start > timedelta(hours = max_hours):
+        raise ValueError(f"A booking can last at most {max_hours} hours")
+    return start, end
+
+
+def _overlapping(spot_id, start, end):
+    return (
+        select(Reservation.id)
+        .where(
+            Reservation.spot_id == spot_id,
+            Reservation.parking_timestamp < end,
+            or_(Reservation.booked_until.is_(None), Reservation.booked_until > start),
+        )
+        .limit(1)
+    )
+
+
+def spot_is_booked(spot_id, now):
+    """True if the spot has a reservation that has not ended by ``now``.
+
+    A parking with no end can only take a spot for which this is False.
+    Check it while holding the spot's row lock.
+    """
+    return db.session.scalar(_overlapping(spot_id, now, OPEN_END)) is not None
+
+
+def start_bookings(now = None):
+    """Mark the spots of bookings whose window has begun as reserved, and commit.
+
+    Moves each lot's counters by the number of spots marked. Returns that
+    number.
+    """
+    now  =  now or datetime.now()
+    started  =  (
+        select(Reservation.spot_id)
+        .where(Reservation.parking_timestamp <= now, Reservation.booked_until > now)
+    )
+    lot_ids  =  db.session.scalars(
+        update(ParkingSpot)
+        .where(ParkingSpot.id.in_(started), ParkingSpot.is_reserved == False)
+        .values(is_reserved = True)
+        .returning(ParkingSpot.lot_id)
+        .execution_options(synchronize_session = False)
+    ).all()
+    for lot_id, reserved in Counter(lot_ids).items():
+        adjust_occupancy(lot_id, reserved)
+    db.session.commit()
+    return len(lot_ids)
+
+
+def book_spot(lot_id, user_id, vehicle_number, start, end):
+    """Reserve a spot of ``lot_id`` for the window [start, end) and commit.
+
+    Candidates come from the lot's interval tree. The chosen spot's row is
+    locked first, then the database is checked for an overlapping
+    reservation, so two bookings of one spot can never both pass. The spot
+    is only marked reserved now if the window has already begun; otherwise
+    start_bookings marks it when it does. Returns the new Reservation, or
+    None when no spot of the lot is free for the whole window.
+    """
+    reloaded  =  False
+    for _ in range(MAX_BOOKING_ATTEMPTS):
+        candidates  =  booking_index.free_spots(lot_id, start, end)
+        if not candidates:
+            if reloaded:
+                return None
+            # Another process may have freed a spot since the tree was loaded
+            booking_index.reset(lot_id)
+            reloaded  =  True
+            continue
+        spot_id  =  random.choice(list(candidates))
+
+        try:
+            # A no-op UPDATE, only to take the spot's row lock
+            locked  =  db.session.execute(
+                update(ParkingSpot)
+                .where(ParkingSpot.id == spot_id, ParkingSpot.lot_id == lot_id)
+                .values(is_reserved = ParkingSpot.is_reserved)
+                .execution_options(synchronize_session = False)
+            ).rowcount
+            if not locked or db.session.scalar(_overlapping(spot_id, start, end)) is not None:
+                # Removed or booked by another process: the tree is stale
+                db.session.rollback()
+                booking_index.reset(lot_id)
+                reloaded  =  True
+                continue
+            if start <= datetime.now():
+                started  =  db.session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id == spot_id, ParkingSpot.is_reserved == False)
+                    .values(is_reserved = True)
+                    .execution_options(synchronize_session = False)
+                ).rowcount
+                if started:
+                    adjust_occupancy(lot_id, 1)
+
+            reservation  =  Reservation(
+                spot_id = spot_id,
+                user_id = user_id,
+                parking_timestamp = start,
+                booked_until = end,
+                vehicle_number = vehicle_number
+            )
+            db.session.add(reservation)
+            db.session.flush()
+            reservation_id  =  reservation.id
+            db.session.commit()
+        except (IntegrityError, OperationalError):
+            db.session.rollback()
+            continue
+        booking_index.add(lot_id, reservation_id, spot_id, start, end)
+        return reservation
+    return None
@@ -0,0 +1,190 @@
+# Small in-process caches and the pluggable response cache
+import os
+import pickle
+import random
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask import current_app, has_app_context
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize = 1024, ttl = 60):
+        self.maxsize  =  maxsize
+        self.ttl  =  ttl
+        self._data  =  OrderedDict()
+        self._lock  =  Lock()
+
+    def get(self, key, default = None):
+        with self._lock:
+            entry  =  self._data.get(key)
+            if entry is None:
+                return default
+            expires, value  =  entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl = None):
+        with self._lock:
+            self._data[key]  =  (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last = False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class MemoryBackend:
+    """Default backend: a per-process TTL/LRU store."""
+
+    def __init__(self, maxsize, ttl):
+        self._store  =  TTLCache(maxsize = maxsize, ttl = ttl)
+        self._generations  =  {}
+        self._lock  =  Lock()
+
+    def get(self, key):
+        return self._store.get(key)
+
+    def set(self, key, value, ttl):
+        self._store.set(key, value, ttl)
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._generations[namespace]  =  self._generations.get(namespace, 0) + 1
+
+
+class SQLiteBackend:
+    """Local-store backend shared by every worker process on the host.
+
+    Entries and namespace generations live in a small SQLite file, so an
+    invalidation in one worker is seen by all of them. Each process opens
+    its own connection on first use: a SQLite connection must not be
+    carried across fork(), and the gunicorn master loads the app before
+    forking the workers.
+    """
+
+    def __init__(self, path, ttl):
+        self.path  =  path
+        self.ttl  =  ttl
+        self._lock  =  Lock()
+        self._connection  =  None
+        self._pid  =  None
+
+    def _connect(self):
+        connection  =  sqlite3.connect(self.path, check_same_thread = False, isolation_level = None, timeout = 5)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS cache_generations (namespace TEXT PRIMARY KEY, value INTEGER)")
+        return connection
+
+    def _execute(self, sql, parameters = ()):
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                # The parent's connection is left alone, not closed
+                self._connection  =  self._connect()
+                self._pid  =  os.getpid()
+            return self._connection.execute(sql, parameters).fetchone()
+
+    def get(self, key):
+        row  =  self._execute("SELECT value, expires FROM cache_entries WHERE key = ?", (key,))
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        expires  =  time.time() + (self.ttl if ttl is None else ttl)
+        self._execute("INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)", (key, pickle.dumps(value), expires))
+        if random.random() < 0.01:
+            self._execute("DELETE FROM cache_entries WHERE expires < ?", (time.time(),))
+
+    def generation(self, namespace):
+        row  =  self._execute("SELECT value FROM cache_generations WHERE namespace = ?", (namespace,))
+        return row[0] if row else 0
+
+    def bump(self, namespace):
+        self._execute(
+            "INSERT INTO cache_generations (namespace, value) VALUES (?, 1) "
+            "ON CONFLICT (namespace) DO UPDATE SET value = value + 1", (namespace,)
+        )
+
+
+class Cache:
+    """Cache for query results and rendered fragments, grouped in namespaces.
+
+    Every key is stored under its namespace's current generation, so
+    ``invalidate(namespace)`` drops all of the namespace's entries at once
+    by moving to the next generation. The backend is chosen per app with
+    CACHE_BACKEND ('memory', 'sqlite' or 'none').
+    """
+
+    def init_app(self, app):
+        kind  =  app.config.get('CACHE_BACKEND', 'memory')
+        ttl  =  app.config.get('CACHE_DEFAULT_TTL', 30)
+        if kind == 'memory':
+            backend  =  MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 2048), ttl)
+        elif kind == 'sqlite':
+            path  =  os.path.join(app.instance_path, app.config.get('CACHE_SQLITE_PATH', 'cache.db'))
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            backend  =  SQLiteBackend(path, ttl)
+        else:
+            backend  =  None
+        app.extensions['cache_backend']  =  backend
+
+    @property
+    def backend(self):
+        return current_app.extensions.get('cache_backend') if has_app_context() else None
+
+    def get_or_set(self, namespace, key, compute, ttl = None):
+        backend  =  self.backend
+        if backend is None:
+            return compute()
+        full_key  =  f"{namespace}:{backend.generation(namespace)}:{key}"
+        value  =  backend.get(full_key)
+        if value is None:
+            value  =  compute()
+            backend.set(full_key, value, ttl)
+        return value
+
+    def get(self, namespace, key):
+        backend  =  self.backend
+        if backend is None:
+            return None
+        return backend.get(f"{namespace}:{backend.generation(namespace)}:{key}")
+
+    def set(self, namespace, key, value, ttl = None):
+        backend  =  self.backend
+        if backend is not None:
+            backend.set(f"{namespace}:{backend.generation(namespace)}:{key}", value, ttl)
+
+    def invalidate(self, *namespaces):
+        backend  =  self.backend
+        if backend is not None:
+            for namespace in namespaces:
+                backend.bump(namespace)
+
+
+# Namespaces: LOTS covers lot listings and free-spot availability,
+# RESERVATIONS covers occupancy totals and revenue, ADMIN covers admin
+# list counts and page positions, ANALYTICS covers the per-lot analytics
+# over complete past days (only lot and history edits change those).
+LOTS = 'lots'
+RESERVATIONS = 'reservations'
+ADMIN = 'admin'
+ANALYTICS = 'analytics'
+
+cache  =  Cache()
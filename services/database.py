@@ -0,0 +1,19 @@
+# Engine tuning applied when the app is created
+from sqlalchemy import event
+from models.models import db
+
+
+def configure_engine(app):
+    """Apply SQLITE_PRAGMAS to every new connection of the app's engine."""
+    pragmas  =  app.config.get('SQLITE_PRAGMAS')
+    with app.app_context():
+        engine  =  db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor  =  dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
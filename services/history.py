@@ -0,0 +1,102 @@
+# Past reservation history: keyset pages and streamed exports
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, select
+from models.models import db
+from services.archive import history_tables
+
+
+HISTORY_PAGE_SIZE = 20
+EXPORT_CHUNK_SIZE = 500
+EXPORT_COLUMNS = ['vehicle_number', 'lot_prime_location', 'address', 'pincode', 'parking_timestamp', 'leaving_timestamp', 'total_cost']
+
+
+def encode_cursor(record):
+    return f"{record.leaving_timestamp.isoformat()}_{record.id}"
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, record_id  =  cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _newest_first(table, user_email):
+    return select(table).where(table.c.user_email == user_email).order_by(
+        table.c.leaving_timestamp.desc(), table.c.id.desc()
+    )
+
+
+def history_page(user_email, cursor = None, page_size = HISTORY_PAGE_SIZE):
+    """Return one page of a user's past reservations, newest first.
+
+    ``cursor`` is the value returned for the previous page; the page picks
+    up strictly after that (leaving_timestamp, id) pair, so it reads only
+    ``page_size`` rows from the (user_email, leaving_timestamp) index no
+    matter how deep the user has paged. The page is filled from the hot
+    table first and only reaches into archived months (newest first) when
+    the hot table runs out. Returns ``(records, next_cursor)`` where
+    ``next_cursor`` is None on the last page.
+    """
+    position  =  decode_cursor(cursor) if cursor else None
+    records  =  []
+    for table in history_tables(before = position[0] if position else None):
+        query  =  _newest_first(table, user_email)
+        if position:
+            timestamp, record_id  =  position
+            query  =  query.where(or_(
+                table.c.leaving_timestamp < timestamp,
+                and_(table.c.leaving_timestamp == timestamp, table.c.id < record_id)
+            ))
+        records += db.session.execute(query.limit(page_size + 1 - len(records))).all()
+        if len(records) > page_size:
+            records  =  records[:page_size]
+            return records, encode_cursor(records[-1])
+    return records, None
+
+
+def _export_rows(user_email):
+    for table in history_tables():
+        query  =  _newest_first(table, user_email).execution_options(yield_per = EXPORT_CHUNK_SIZE)
+        for record in db.session.execute(query):
+            yield {
+                'vehicle_number': record.vehicle_number,
+                'lot_prime_location': record.lot_prime_location,
+                'address': record.address,
+                'pincode': record.pincode,
+                'parking_timestamp': record.parking_timestamp.isoformat() if record.parking_timestamp else None,
+                'leaving_timestamp': record.leaving_timestamp.isoformat() if record.leaving_timestamp else None,
+                'total_cost': record.total_cost,
+            }
+
+
+def stream_csv(user_email):
+    buffer  =  io.StringIO()
+    writer  =  csv.DictWriter(buffer, fieldnames = EXPORT_COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(_export_rows(user_email), 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_json(user_email):
+    chunk  =  []
+    separator  =  '['
+    for row in _export_rows(user_email):
+        chunk.append(separator + json.dumps(row))
+        separator  =  ','
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk  =  []
+    if separator == '[':
+        chunk.append(separator)
+    chunk.append(']')
+    yield ''.join(chunk)
@@ -0,0 +1,272 @@
+# Opt-in request instrumentation: timings, SQL stats, template renders,
+# Prometheus-style /metrics and a slow-request log with stack samples.
+#
+# Nothing here is imported into the request path unless
+# INSTRUMENTATION_ENABLED is set, so a disabled app pays no overhead.
+import hmac
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, abort, before_render_template, g, has_request_context, request, session, template_rendered
+from sqlalchemy import event
+from models.models import db
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+slow_request_log  =  logging.getLogger('slow_requests')
+
+
+class RequestStats:
+    def __init__(self):
+        self.start  =  time.perf_counter()
+        self.queries  =  0
+        self.db_seconds  =  0.0
+        self.slowest_seconds  =  0.0
+        self.slowest_statement  =  None
+        self.render_starts  =  []
+        self.samples  =  None
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets  =  [0] * len(DURATION_BUCKETS)
+        self.count  =  0
+        self.total  =  0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+
+class Metrics:
+    """In-process metric registry rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock  =  threading.Lock()
+        self.requests  =  defaultdict(int)
+        self.request_seconds  =  defaultdict(Histogram)
+        self.db_queries  =  defaultdict(int)
+        self.db_seconds  =  defaultdict(float)
+        self.render_seconds  =  defaultdict(Histogram)
+
+    def observe_request(self, endpoint, status, seconds, stats):
+        with self._lock:
+            self.requests[(endpoint, status)] += 1
+            self.request_seconds[endpoint].observe(seconds)
+            self.db_queries[endpoint] += stats.queries
+            self.db_seconds[endpoint] += stats.db_seconds
+
+    def observe_render(self, template, seconds):
+        with self._lock:
+            self.render_seconds[template].observe(seconds)
+
+    def _histogram_lines(self, name, label, histograms):
+        lines  =  [f"# TYPE {name} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in zip(DURATION_BUCKETS, histogram.buckets):
+                lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}="{key}"}} {histogram.total:.6f}')
+            lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+        return lines
+
+    def render(self):
+        with self._lock:
+            lines  =  ['# TYPE http_requests_total counter']
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            lines += self._histogram_lines('http_request_duration_seconds', 'endpoint', self.request_seconds)
+            lines.append('# TYPE db_queries_total counter')
+            for endpoint, count in sorted(self.db_queries.items()):
+                lines.append(f'db_queries_total{{endpoint="{endpoint}"}} {count}')
+            lines.append('# TYPE db_seconds_total counter')
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+            lines += self._histogram_lines('template_render_seconds', 'template', self.render_seconds)
+        return '\n'.join(lines) + '\n'
+
+
+class StackSampler:
+    """Samples the stacks of registered request threads every ``interval`` seconds.
+
+    A single daemon thread reads sys._current_frames(), so the cost does not
+    grow with the number of requests being profiled, and it sleeps while no
+    request is registered. Samples are kept as (code, line) tuples; only the
+    stacks of slow requests are folded into text (root;...;leaf -> count),
+    ready for flame graph tools.
+    """
+
+    def __init__(self, interval, max_depth = 40):
+        self.interval  =  interval
+        self.max_depth  =  max_depth
+        self._threads  =  {}
+        self._lock  =  threading.Condition()
+        self._runner  =  None
+
+    def start(self):
+        ident  =  threading.get_ident()
+        samples  =  Counter()
+        with self._lock:
+            self._threads[ident]  =  samples
+            if self._runner is None:
+                self._runner  =  threading.Thread(target = self._run, name = 'stack-sampler', daemon = True)
+                self._runner.start()
+            self._lock.notify()
+        return samples
+
+    def stop(self):
+        with self._lock:
+            return self._threads.pop(threading.get_ident(), Counter())
+
+    def _stack(self, frame):
+        stack  =  []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append((frame.f_code, frame.f_lineno))
+            frame  =  frame.f_back
+        return tuple(stack)
+
+    @staticmethod
+    def folded(stack):
+        return ';'.join(f"{code.co_name} ({code.co_filename}:{line})" for code, line in reversed(stack))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._threads:
+                    self._lock.wait()
+            time.sleep(self.interval)
+            frames  =  sys._current_frames()
+            with self._lock:
+                for ident, samples in self._threads.items():
+                    frame  =  frames.get(ident)
+                    if frame is not None:
+                        samples[self._stack(frame)] += 1
+            del frames
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _attach_sql_listeners(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed  =  time.perf_counter() - conn.info['query_start'].pop()
+        stats  =  _current_stats()
+        if stats is None:
+            return
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if elapsed > stats.slowest_seconds:
+            stats.slowest_seconds  =  elapsed
+            stats.slowest_statement  =  statement
+
+
+def _log_slow_request(endpoint, seconds, stats, top_stacks):
+    lines  =  [
+        f"Slow request {request.method} {request.path} ({endpoint}): {seconds * 1000:.1f} ms, "
+        f"{stats.queries} queries, {stats.db_seconds * 1000:.1f} ms in DB"
+    ]
+    if stats.slowest_statement:
+        lines.append(f"  slowest statement ({stats.slowest_seconds * 1000:.1f} ms): {' '.join(stats.slowest_statement.split())}")
+    if stats.samples:
+        lines.append(f"  stack samples (top {top_stacks} of {sum(stats.samples.values())}):")
+        for stack, count in stats.samples.most_common(top_stacks):
+            lines.append(f"    {count} {StackSampler.folded(stack)}")
+    slow_request_log.warning('\n'.join(lines))
+
+
+def init_instrumentation(app, blueprint):
+    """Instrument every view of ``blueprint`` and serve GET /metrics.
+
+    Metrics live in the process that recorded them: under gunicorn each
+    worker answers /metrics with its own counts, so scrape every worker
+    or sum what you get. /metrics is served to admin sessions, to requests
+    carrying METRICS_TOKEN and to METRICS_ALLOWED_IPS; loopback is not
+    trusted, since behind a reverse proxy every request comes from it.
+    """
+    metrics  =  Metrics()
+    slow_seconds  =  app.config.get('SLOW_REQUEST_MS', 500) / 1000
+    interval_ms  =  app.config.get('PROFILE_SAMPLE_INTERVAL_MS', 5)
+    sampler  =  StackSampler(interval_ms / 1000) if interval_ms else None
+    top_stacks  =  app.config.get('PROFILE_TOP_STACKS', 10)
+    app.extensions['metrics']  =  metrics
+
+    if app.config.get('SLOW_REQUEST_LOG'):
+        handler  =  logging.FileHandler(app.config['SLOW_REQUEST_LOG'])
+        handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+        slow_request_log.addHandler(handler)
+
+    with app.app_context():
+        _attach_sql_listeners(db.engine)
+
+    def _start_request_timer():
+        g.request_stats  =  RequestStats()
+        if sampler is not None:
+            g.request_stats.samples  =  sampler.start()
+
+    def _record_request(response):
+        stats  =  g.pop('request_stats', None)
+        if stats is None:
+            return response
+        if sampler is not None:
+            sampler.stop()
+        seconds  =  time.perf_counter() - stats.start
+        endpoint  =  request.endpoint or 'unknown'
+        metrics.observe_request(endpoint, response.status_code, seconds, stats)
+        if seconds >= slow_seconds:
+            _log_slow_request(endpoint, seconds, stats, top_stacks)
+        return response
+
+    def _drop_sampler(exception):
+        # after_request is skipped when the view raises
+        if sampler is not None and g.pop('request_stats', None) is not None:
+            sampler.stop()
+
+    # The blueprint is already registered, so hook its per-blueprint
+    # handler lists directly; the timer goes first so the user lookup and
+    # any other before_request work is included.
+    app.before_request_funcs.setdefault(blueprint.name, []).insert(0, _start_request_timer)
+    app.after_request_funcs.setdefault(blueprint.name, []).append(_record_request)
+    app.teardown_request_funcs.setdefault(blueprint.name, []).append(_drop_sampler)
+
+    def _render_started(sender, template, context, **extra):
+        stats  =  _current_stats()
+        if stats is not None:
+            stats.render_starts.append(time.perf_counter())
+
+    def _render_finished(sender, template, context, **extra):
+        stats  =  _current_stats()
+        if stats is not None and stats.render_starts:
+            metrics.observe_render(template.name, time.perf_counter() - stats.render_starts.pop())
+
+    before_render_template.connect(_render_started, app, weak = False)
+    template_rendered.connect(_render_finished, app, weak = False)
+
+    token  =  app.config.get('METRICS_TOKEN')
+    allowed_ips  =  set(app.config.get('METRICS_ALLOWED_IPS', ()))
+
+    def _may_scrape():
+        if session.get('is_admin', False) or request.remote_addr in allowed_ips:
+            return True
+        offered  =  request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(offered.encode(), f"Bearer {token}".encode())
+
+    def metrics_view():
+        if not _may_scrape():
+            abort(403)
+        return Response(metrics.render(), mimetype = 'text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
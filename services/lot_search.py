@@ -0,0 +1,135 @@
+# Lot search backed by an SQLite FTS5 index
+import re
+from sqlalchemy import column, or_, table, text
+from sqlalchemy.exc import OperationalError
+from models.models import db, ParkingLot
+
+
+SEARCH_RESULT_LIMIT = 50
+
+lot_fts  =  table('parking_lot_fts', column('rowid'), column('rank'))
+
+# Only edits to the indexed columns re-index a lot: every booking and
+# release updates parking_lot's counters too, and must not churn the index
+_FTS_UPDATE_TRIGGER  =  """CREATE TRIGGER IF NOT EXISTS parking_lot_fts_au
+    AFTER UPDATE OF prime_location_name, address, pincode ON parking_lot BEGIN
+        INSERT INTO parking_lot_fts(parking_lot_fts, rowid, prime_location_name, address, pincode)
+        VALUES ('delete', old.id, old.prime_location_name, old.address, old.pincode);
+        INSERT INTO parking_lot_fts(rowid, prime_location_name, address, pincode)
+        VALUES (new.id, new.prime_location_name, new.address, new.pincode);
+    END"""
+
+# External-content FTS5 table: the index stores only the tokens, the text
+# stays in parking_lot. The triggers keep it in step with every write to
+# those columns, including edits made from the admin panel.
+_FTS_SCHEMA  =  [
+    """CREATE VIRTUAL TABLE parking_lot_fts USING fts5(
+        prime_location_name, address, pincode,
+        content = 'parking_lot', content_rowid = 'id', prefix = '2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS parking_lot_fts_ai AFTER INSERT ON parking_lot BEGIN
+        INSERT INTO parking_lot_fts(rowid, prime_location_name, address, pincode)
+        VALUES (new.id, new.prime_location_name, new.address, new.pincode);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS parking_lot_fts_ad AFTER DELETE ON parking_lot BEGIN
+        INSERT INTO parking_lot_fts(parking_lot_fts, rowid, prime_location_name, address, pincode)
+        VALUES ('delete', old.id, old.prime_location_name, old.address, old.pincode);
+    END""",
+    _FTS_UPDATE_TRIGGER,
+]
+
+_fts_available  =  {}
+
+
+def _fts_exists(connection):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'parking_lot_fts'")
+    ).first() is not None
+
+
+def create_search_index():
+    """Create the FTS5 index and its sync triggers if they are missing.
+
+    Safe to call on every start; the index is only rebuilt from parking_lot
+    the first time it is created. Does nothing on databases other than
+    SQLite, where search falls back to pattern matching.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as connection:
+            if not _fts_exists(connection):
+                for statement in _FTS_SCHEMA:
+                    connection.execute(text(statement))
+                connection.execute(text("INSERT INTO parking_lot_fts(parking_lot_fts) VALUES ('rebuild')"))
+    except OperationalError:
+        # SQLite built without FTS5
+        return False
+    _fts_available[db.engine.url]  =  True
+    return True
+
+
+def replace_search_update_trigger():
+    """Swap an existing index's update trigger for the current one.
+
+    Indexes created before the trigger was limited to the indexed columns
+    re-indexed a lot on every counter update.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.begin() as connection:
+        if not _fts_exists(connection):
+            return False
+        connection.execute(text("DROP TRIGGER IF EXISTS parking_lot_fts_au"))
+        connection.execute(text(_FTS_UPDATE_TRIGGER))
+    return True
+
+
+def _use_fts():
+    url  =  db.engine.url
+    if url not in _fts_available:
+        _fts_available[url]  =  db.engine.dialect.name == 'sqlite' and _fts_exists(db.session.connection())
+    return _fts_available[url]
+
+
+def _match_expression(q):
+    # Every word must match, each as a prefix so "5600" finds pincode
+    # 560001 and "kora" finds Koramangala. Quoting keeps FTS5 operators
+    # typed by the user from being interpreted.
+    words  =  re.findall(r'\w+', q)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def free_spot_exists():
+    return ParkingLot.available_spots > 0
+
+
+def search_lots(q, limit = SEARCH_RESULT_LIMIT):
+    """Lots matching ``q`` that still have a free spot, best match first."""
+    if _use_fts():
+        match  =  _match_expression(q)
+        if not match:
+            return []
+        return (
+            ParkingLot.query
+            .join(lot_fts, lot_fts.c.rowid == ParkingLot.id)
+            .filter(text("parking_lot_fts MATCH :match").bindparams(match = match))
+            .filter(free_spot_exists())
+            .order_by(lot_fts.c.rank)
+            .limit(limit)
+            .all()
+        )
+
+    return (
+        ParkingLot.query
+        .filter(
+            or_(
+                ParkingLot.prime_location_name.ilike(f"%{q}%"),
+                ParkingLot.pincode.ilike(f"{q}%"),
+                ParkingLot.address.ilike(f"%{q}%")
+            ),
+            free_spot_exists()
+        )
+        .limit(limit)
+        .all()
+    )
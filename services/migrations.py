@@ -0,0 +1,233 @@
+# Idempotent startup migrations
+from datetime import datetime
+from sqlalchemy import Integer, cast, delete, exists, func, inspect, insert, or_, select, text, update
+from models.models import db, DailyTotal, DailyUsage, ParkingLot, ParkingSpot, PastReservations, Reservation
+from services.lot_search import create_search_index, replace_search_update_trigger
+from services.occupancy import repair_occupancy
+from services.rollups import backfill_rollups
+
+
+migrations_table  =  db.Table(
+    'schema_migrations', db.metadata,
+    db.Column('name', db.String(100), primary_key = True),
+    db.Column('applied_at', db.DateTime, nullable = False),
+)
+
+
+def _add_column(model, column_name):
+    """ALTER TABLE ... ADD COLUMN for a model column the table lacks."""
+    table  =  model.__table__
+    existing  =  {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    if column_name in existing:
+        return False
+    column  =  table.c[column_name]
+    ddl  =  f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+    if column.default is not None and column.default.is_scalar:
+        ddl += f" NOT NULL DEFAULT {column.default.arg!r}" if not column.nullable else f" DEFAULT {column.default.arg!r}"
+    with db.engine.begin() as connection:
+        connection.execute(text(ddl))
+    return True
+
+
+def _create_indexes(*names):
+    """Create the named model indexes that do not exist yet.
+
+    A step names its own indexes: indexes declared on a model later may
+    cover columns that only a later step adds.
+    """
+    indexes  =  {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(db.engine, checkfirst = True)
+
+
+def lot_occupancy_counters():
+    _add_column(ParkingLot, 'available_spots')
+    _add_column(ParkingLot, 'reserved_spots')
+    repair_occupancy()
+
+
+def past_reservation_lot_id():
+    _add_column(PastReservations, 'lot_id')
+
+
+def query_indexes():
+    # ParkingSpot's indexes come with integer_spot_keys, which rebuilds the table
+    _create_indexes('ix_user_email', 'ix_past_reservations_user_leaving', 'ix_daily_usage_user_day')
+
+
+def daily_usage_backfill():
+    backfill_rollups()
+
+
+def past_reservation_release_id():
+    _add_column(PastReservations, 'release_id')
+    _create_indexes('ix_past_reservations_release_id')
+
+
+def admin_list_indexes():
+    _create_indexes('ix_reservation_user_vehicle', 'ix_past_reservations_lot_leaving', 'ix_past_reservations_leaving')
+
+
+def _begin_ddl(connection):
+    # Table rebuilds run in one transaction; pysqlite would otherwise
+    # commit each DDL statement on its own
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN')
+
+
+def _set_aside(connection, table):
+    """Rename ``table`` to legacy_<table> so a new one can be created."""
+    # Index names are global, and the new table reuses them
+    for index in inspect(connection).get_indexes(table):
+        if 'duplicates_constraint' not in index:
+            connection.execute(text(f"DROP INDEX {index['name']}"))
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO legacy_{table}"))
+
+
+def _restart_id_sequence(connection, table):
+    # Rows were copied with their ids, which PostgreSQL's sequence never saw
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"))
+
+
+def _legacy_spot_number(spot_id):
+    # 'L3_S12' -> 12
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.split_part(spot_id, '_S', 2), Integer)
+    return cast(func.substr(spot_id, func.instr(spot_id, '_S') + 2), Integer)
+
+
+def integer_spot_keys():
+    """Rebuild parking_spot and reservation around integer spot ids.
+
+    Spots used to be keyed by strings like 'L3_S12'. Each spot gets an
+    integer id, numbered lot by lot, and keeps its number within the lot in
+    spot_number; every reservation is pointed at its spot's new id. Runs in
+    one transaction. Databases created with integer spot ids are skipped.
+    """
+    if 'spot_number' in {column['name'] for column in inspect(db.engine).get_columns('parking_spot')}:
+        return
+    with db.engine.begin() as connection:
+        _begin_ddl(connection)
+        for table in ('reservation', 'parking_spot'):
+            _set_aside(connection, table)
+        ParkingSpot.__table__.create(connection)
+        Reservation.__table__.create(connection)
+
+        legacy_spot  =  db.Table('legacy_parking_spot', db.MetaData(), autoload_with = connection)
+        legacy_reservation  =  db.Table('legacy_reservation', db.MetaData(), autoload_with = connection)
+        number  =  _legacy_spot_number(legacy_spot.c.id)
+        connection.execute(ParkingSpot.__table__.insert().from_select(
+            ['lot_id', 'spot_number', 'is_reserved'],
+            db.select(legacy_spot.c.lot_id, number, legacy_spot.c.is_reserved).order_by(legacy_spot.c.lot_id, number)
+        ))
+        # Reservation ids are kept: open release forms and fleet clients hold them
+        connection.execute(Reservation.__table__.insert().from_select(
+            ['id', 'spot_id', 'user_id', 'parking_timestamp', 'vehicle_number'],
+            db.select(
+                legacy_reservation.c.id, ParkingSpot.id, legacy_reservation.c.user_id,
+                legacy_reservation.c.parking_timestamp, legacy_reservation.c.vehicle_number
+            )
+            .join(legacy_spot, legacy_spot.c.id == legacy_reservation.c.spot_id)
+            .join(ParkingSpot, db.and_(ParkingSpot.lot_id == legacy_spot.c.lot_id, ParkingSpot.spot_number == number))
+        ))
+        _restart_id_sequence(connection, 'reservation')
+        legacy_reservation.drop(connection)
+        legacy_spot.drop(connection)
+
+
+def reservation_windows():
+    """Rebuild reservation for advance bookings.
+
+    Adds booked_until and replaces the one-reservation-per-spot UNIQUE
+    constraint, which SQLite cannot drop in place, with an index on
+    (spot_id, parking_timestamp) for the overlap checks. Runs in one
+    transaction. Databases that already have booked_until are skipped.
+    """
+    if 'booked_until' in {column['name'] for column in inspect(db.engine).get_columns('reservation')}:
+        return
+    columns  =  ['id', 'spot_id', 'user_id', 'parking_timestamp', 'vehicle_number']
+    with db.engine.begin() as connection:
+        _begin_ddl(connection)
+        _set_aside(connection, 'reservation')
+        Reservation.__table__.create(connection)
+        legacy_reservation  =  db.Table('legacy_reservation', db.MetaData(), autoload_with = connection)
+        connection.execute(Reservation.__table__.insert().from_select(
+            columns, db.select(*[legacy_reservation.c[name] for name in columns])
+        ))
+        _restart_id_sequence(connection, 'reservation')
+        legacy_reservation.drop(connection)
+
+
+def bookings_hold_spots_when_started():
+    """Free the spots held only by bookings whose window has not begun.
+
+    Bookings used to mark their spot reserved as soon as they were made;
+    the spot is now marked when the window begins. The lot counters are
+    then recomputed from the spots.
+    """
+    now  =  datetime.now()
+    held  =  exists().where(
+        Reservation.spot_id == ParkingSpot.id,
+        Reservation.parking_timestamp <= now,
+        or_(Reservation.booked_until.is_(None), Reservation.booked_until > now),
+    )
+    db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.is_reserved == True, ~held)
+        .values(is_reserved = False)
+        .execution_options(synchronize_session = False)
+    )
+    repair_occupancy()
+
+
+def daily_totals():
+    # Summed from the existing rollup rather than rebuilt from history
+    db.session.execute(delete(DailyTotal))
+    db.session.execute(insert(DailyTotal).from_select(
+        ['day', 'parkings', 'releases', 'revenue', 'parked_hours'],
+        select(
+            DailyUsage.day, func.sum(DailyUsage.parkings), func.sum(DailyUsage.releases),
+            func.sum(DailyUsage.revenue), func.sum(DailyUsage.parked_hours)
+        ).group_by(DailyUsage.day)
+    ))
+    db.session.commit()
+
+
+# Applied in order, each at most once per database. Append new steps at the end.
+MIGRATIONS  =  [
+    ('lot_occupancy_counters', lot_occupancy_counters),
+    ('past_reservation_lot_id', past_reservation_lot_id),
+    ('query_indexes', query_indexes),
+    ('lot_search_index', create_search_index),
+    ('daily_usage_backfill', daily_usage_backfill),
+    ('past_reservation_release_id', past_reservation_release_id),
+    ('admin_list_indexes', admin_list_indexes),
+    ('integer_spot_keys', integer_spot_keys),
+    ('reservation_windows', reservation_windows),
+    ('lot_search_update_trigger', replace_search_update_trigger),
+    ('bookings_hold_spots_when_started', bookings_hold_spots_when_started),
+    ('daily_totals', daily_totals),
+]
+
+
+def run_migrations():
+    """Create missing tables, then apply every migration not yet recorded.
+
+    Returns the names of the migrations applied by this call. Run it once
+    per deployment (the production server does so in its master process
+    before forking workers), not from each worker.
+    """
+    db.create_all()
+    with db.engine.connect() as connection:
+        applied  =  set(connection.execute(db.select(migrations_table.c.name)).scalars())
+
+    ran  =  []
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        migrate()
+        with db.engine.begin() as connection:
+            connection.execute(migrations_table.insert().values(name = name, applied_at = datetime.now()))
+        ran.append(name)
+    return ran
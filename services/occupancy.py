@@ -0,0 +1,92 @@
+# Denormalized per-lot occupancy counters
+from sqlalchemy import case, func, select, update
+from models.models import db, ParkingLot, ParkingSpot
+from services.availability import record_change
+
+
+def adjust_occupancy(lot_id, reserved):
+    """Move ``reserved`` spots of a lot from available to reserved.
+
+    Pass a negative number to free spots. Runs in the caller's transaction
+    so the counters commit (or roll back) together with the spot change.
+    """
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(
+            available_spots = ParkingLot.available_spots - reserved,
+            reserved_spots = ParkingLot.reserved_spots + reserved
+        )
+        .execution_options(synchronize_session = False)
+    )
+    record_change(lot_id, -reserved, reserved)
+
+
+def adjust_capacity(lot_id, added):
+    """Record ``added`` new free spots (negative when spots are removed)."""
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(available_spots = ParkingLot.available_spots + added)
+        .execution_options(synchronize_session = False)
+    )
+    record_change(lot_id, added, 0)
+
+
+def reset_occupancy(lot, reserved = 0):
+    lot.reserved_spots  =  reserved
+    lot.available_spots  =  lot.max_spots - reserved
+
+
+def lot_availability(pincode = None):
+    query  =  db.session.query(
+        ParkingLot.id, ParkingLot.prime_location_name, ParkingLot.pincode, ParkingLot.is_active,
+        ParkingLot.available_spots, ParkingLot.reserved_spots
+    ).order_by(ParkingLot.id)
+    if pincode:
+        query  =  query.filter(ParkingLot.pincode == pincode)
+    return [row._asdict() for row in query]
+
+
+def _derived_counts():
+    # Counters re-derived from the spot rows themselves
+    return select(
+        ParkingSpot.lot_id,
+        func.sum(case((ParkingSpot.is_reserved == False, 1), else_ = 0)).label('available'),
+        func.sum(case((ParkingSpot.is_reserved == True, 1), else_ = 0)).label('reserved')
+    ).group_by(ParkingSpot.lot_id).subquery()
+
+
+def occupancy_drift():
+    """List the lots whose stored counters disagree with their spot rows."""
+    derived  =  _derived_counts()
+    rows  =  db.session.execute(
+        select(
+            ParkingLot.id, ParkingLot.available_spots, ParkingLot.reserved_spots,
+            func.coalesce(derived.c.available, 0), func.coalesce(derived.c.reserved, 0)
+        )
+        .outerjoin(derived, derived.c.lot_id == ParkingLot.id)
+        .order_by(ParkingLot.id)
+    )
+    return [
+        {
+            'lot_id': lot_id,
+            'available_spots': available, 'reserved_spots': reserved,
+            'actual_available': actual_available, 'actual_reserved': actual_reserved,
+        }
+        for lot_id, available, reserved, actual_available, actual_reserved in rows
+        if (available, reserved) != (actual_available, actual_reserved)
+    ]
+
+
+def repair_occupancy():
+    """Overwrite drifted counters with the derived values and commit."""
+    drift  =  occupancy_drift()
+    for lot in drift:
+        db.session.execute(
+            update(ParkingLot)
+            .where(ParkingLot.id == lot['lot_id'])
+            .values(available_spots = lot['actual_available'], reserved_spots = lot['actual_reserved'])
+        )
+    db.session.commit()
+    return drift
@@ -0,0 +1,108 @@
+# Password hashing policy, run off the request threads
+#
+# Hashing is deliberately slow and holds the GIL, so a burst of logins in
+# the request threads stalls every other request of that worker. Hashes
+# are computed in a small process pool instead; the request thread only
+# waits on the result. The pool is bounded: once PASSWORD_HASH_QUEUE jobs
+# are waiting, further logins are turned away with HashingBusy rather than
+# queueing without limit.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has a full queue."""
+
+
+def _start_method():
+    # forkserver: children start from a clean process, not a copy of this
+    # multi-threaded worker. Windows has only spawn.
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with the app's PASSWORD_HASH_METHOD.
+
+    ``PASSWORD_HASH_METHOD`` is any method string Werkzeug accepts, such as
+    ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``. A stored hash made
+    with other parameters or another PASSWORD_SALT_LENGTH still verifies,
+    and ``needs_rehash`` reports it so the login that proves the password
+    can store a fresh hash.
+    With PASSWORD_HASH_WORKERS = 0 hashing runs inline.
+    """
+
+    def __init__(self):
+        self._pool  =  None
+        self._pid  =  None
+        self._slots  =  None
+        self._method  =  None
+        self._lock  =  threading.Lock()
+
+    def _config(self, name, default):
+        return current_app.config.get(name, default)
+
+    @property
+    def method(self):
+        # The canonical prefix Werkzeug writes for the configured method,
+        # e.g. 'pbkdf2:sha256' is stored as 'pbkdf2:sha256:1000000'
+        configured  =  self._config('PASSWORD_HASH_METHOD', 'scrypt')
+        if self._method is None or self._method[0] != configured:
+            self._method  =  (configured, generate_password_hash('', configured, 1).split('$', 1)[0])
+        return self._method[1]
+
+    def _run(self, function, *args):
+        workers  =  self._config('PASSWORD_HASH_WORKERS', 0)
+        if not workers:
+            return function(*args)
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                # A pool made before a fork (the gunicorn master hashing the
+                # admin password) is useless in the child; make a new one
+                if self._pool is None or self._pid != os.getpid():
+                    self._slots  =  threading.BoundedSemaphore(workers + self._config('PASSWORD_HASH_QUEUE', 32))
+                    self._pool  =  ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context(_start_method()))
+                    self._pid  =  os.getpid()
+        slots  =  self._slots
+        if not slots.acquire(blocking = False):
+            raise HashingBusy()
+        try:
+            future  =  self._pool.submit(function, *args)
+        except BrokenProcessPool:
+            # A pool process died; start a new pool with the next login
+            slots.release()
+            self._pool  =  None
+            raise
+        # The slot is held until the job itself finishes: a caller that gave
+        # up waiting leaves the job running in the pool
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout = self._config('PASSWORD_HASH_TIMEOUT', 10))
+        except TimeoutError:
+            # The pool is too far behind to answer in time
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._pool  =  None
+            raise
+
+    @property
+    def salt_length(self):
+        return self._config('PASSWORD_SALT_LENGTH', 16)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, stored, password):
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        # Werkzeug stores 'method$salt$hash'
+        parts  =  stored.split('$', 2)
+        return len(parts) != 3 or parts[0] != self.method or len(parts[1]) != self.salt_length
+
+
+hasher  =  PasswordHasher()
@@ -0,0 +1,100 @@
+# Bulk lot provisioning and resizing
+import csv
+from sqlalchemy import delete, exists, insert, select
+from models.models import db, ParkingLot, ParkingSpot, Reservation
+from services.occupancy import adjust_capacity
+
+
+LOT_CSV_COLUMNS = ['prime_location_name', 'address', 'pincode', 'contact_number', 'max_spots', 'price_per_hour', 'is_active']
+
+
+def provision_spots(lot_id, numbers):
+    """Insert spots for ``lot_id`` with one executemany round-trip."""
+    rows  =  [{'lot_id': lot_id, 'spot_number': number, 'is_reserved': False} for number in numbers]
+    if rows:
+        db.session.execute(insert(ParkingSpot), rows)
+    return len(rows)
+
+
+def resize_lot(lot, max_spots):
+    """Grow or shrink a lot to ``max_spots`` by touching only the difference.
+
+    Growing fills the lowest unused spot numbers. Shrinking removes free
+    spots, highest numbers first, and raises ValueError if there are not
+    enough free spots to remove; reserved spots, and spots booked ahead,
+    are never touched. The lot's availability counter moves by the same
+    amount.
+    """
+    reserved  =  ParkingSpot.is_reserved | exists().where(Reservation.spot_id == ParkingSpot.id)
+    spots  =  db.session.execute(
+        select(ParkingSpot.id, ParkingSpot.spot_number, reserved.label('is_reserved')).where(ParkingSpot.lot_id == lot.id)
+    ).all()
+    delta  =  max_spots - len(spots)
+
+    if delta > 0:
+        taken  =  {row.spot_number for row in spots}
+        numbers  =  []
+        candidate  =  1
+        while len(numbers) < delta:
+            if candidate not in taken:
+                numbers.append(candidate)
+            candidate += 1
+        provision_spots(lot.id, numbers)
+
+    elif delta < 0:
+        free  =  [row.id for row in sorted(spots, key = lambda row: row.spot_number, reverse = True) if not row.is_reserved]
+        if len(free) < -delta:
+            raise ValueError(f"Cannot change max spots: only {len(free)} spots are free to remove.")
+        removed  =  db.session.execute(
+            delete(ParkingSpot)
+            .where(ParkingSpot.id.in_(free[:-delta]), ~reserved)
+            .execution_options(synchronize_session = False)
+        ).rowcount
+        if removed != -delta:
+            # A spot was booked between reading and deleting it
+            raise ValueError("Cannot change max spots: some spots were reserved meanwhile, try again.")
+
+    if delta:
+        adjust_capacity(lot.id, delta)
+    return delta
+
+
+def import_lots_csv(stream):
+    """Create every lot in a CSV file, with its spots, in one transaction.
+
+    The header must name the LOT_CSV_COLUMNS (contact_number and is_active
+    are optional). Returns the ids of the new lots.
+    """
+    rows  =  []
+    for line, record in enumerate(csv.DictReader(stream), 2):
+        try:
+            max_spots  =  int(record['max_spots'])
+            if max_spots < 0:
+                raise ValueError("max_spots is negative")
+            rows.append({
+                'prime_location_name': record['prime_location_name'].strip(),
+                'address': record['address'].strip(),
+                'pincode': record['pincode'].strip(),
+                'contact_number': (record.get('contact_number') or '').strip() or None,
+                'max_spots': max_spots,
+                'price_per_hour': int(record['price_per_hour']),
+                'is_active': (record.get('is_active') or 'true').strip().lower() in ('1', 'true', 'yes', 'y'),
+                'available_spots': max_spots,
+                'reserved_spots': 0,
+            })
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f"Line {line}: invalid lot row ({error})")
+
+    if not rows:
+        return []
+    try:
+        lot_ids  =  db.session.scalars(
+            insert(ParkingLot).returning(ParkingLot.id, sort_by_parameter_order = True), rows
+        ).all()
+        for lot_id, row in zip(lot_ids, rows):
+            provision_spots(lot_id, range(1, row['max_spots'] + 1))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return lot_ids
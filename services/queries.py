@@ -0,0 +1,34 @@
+# Read-side query helpers shared by the routes
+from sqlalchemy.orm import joinedload
+from models.models import ParkingLot, ParkingSpot, Reservation
+
+
+def _with_spot_and_lot(query):
+    # Templates walk reservation.spot.lot for every row, so pull both
+    # in the same SELECT instead of lazy-loading them one row at a time.
+    return query.options(joinedload(Reservation.spot).joinedload(ParkingSpot.lot))
+
+
+def current_reservations(user_id):
+    return _with_spot_and_lot(
+        Reservation.query.filter(Reservation.user_id == user_id)
+    ).all()
+
+
+def reservation_with_lot(reservation_id):
+    return _with_spot_and_lot(
+        Reservation.query.filter(Reservation.id == reservation_id)
+    ).first()
+
+
+def fleet_lots(lot_id = None, pincode = None):
+    """Active lots with free spots for a fleet booking, roomiest first.
+
+    Narrowed to one lot by ``lot_id`` or to every lot in ``pincode``.
+    """
+    query  =  ParkingLot.query.filter(ParkingLot.is_active == True, ParkingLot.available_spots > 0)
+    if lot_id is not None:
+        query  =  query.filter(ParkingLot.id == lot_id)
+    else:
+        query  =  query.filter(ParkingLot.pincode == pincode)
+    return query.order_by(ParkingLot.available_spots.desc(), ParkingLot.id).all()
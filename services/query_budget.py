@@ -0,0 +1,42 @@
+# Per-request SQL statement counter and query budgets
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count  =  g.get('query_count', 0) + 1
+
+
+def query_count():
+    return g.get('query_count', 0)
+
+
+def query_budget(limit):
+    """Flag a view that runs more than ``limit`` SQL statements.
+
+    The count includes statements issued while rendering the template, so
+    a lazy load inside a loop shows up here. With ENFORCE_QUERY_BUDGETS set
+    (as in tests) going over budget raises; otherwise it is only logged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start  =  query_count()
+            response  =  view(*args, **kwargs)
+            used  =  query_count() - start
+            if used > limit:
+                message  =  f"{request.endpoint} ran {used} queries (budget {limit})"
+                if current_app.config.get('ENFORCE_QUERY_BUDGETS'):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+        return wrapper
+    return decorator
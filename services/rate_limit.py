@@ -0,0 +1,94 @@
+# In-process rate limits for the login and registration forms
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class RateLimiter:
+    """Fixed-window attempt counters per key, held in process memory.
+
+    At most ``limit`` hits per key in each ``period`` seconds. Only the
+    ``maxsize`` most recently used keys are tracked, so a flood of distinct
+    keys costs bounded memory.
+    """
+
+    def __init__(self, limit, period, maxsize = 100000):
+        self.limit  =  limit
+        self.period  =  period
+        self.maxsize  =  maxsize
+        self._windows  =  OrderedDict()
+        self._lock  =  threading.Lock()
+
+    def _window(self, key, now):
+        window  =  self._windows.get(key)
+        if window is None or window[0] + self.period <= now:
+            window  =  [now, 0]
+            self._windows[key]  =  window
+        self._windows.move_to_end(key)
+        while len(self._windows) > self.maxsize:
+            self._windows.popitem(last = False)
+        return window
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, 0 if it may now; does not count a hit."""
+        now  =  time.monotonic()
+        with self._lock:
+            started, count  =  self._window(key, now)
+            return max(1, int(started + self.period - now) + 1) if count >= self.limit else 0
+
+    def hit(self, key):
+        """Count an attempt by ``key``; returns retry_after() as it was before the hit."""
+        now  =  time.monotonic()
+        with self._lock:
+            window  =  self._window(key, now)
+            if window[1] >= self.limit:
+                return max(1, int(window[0] + self.period - now) + 1)
+            window[1] += 1
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+
+
+class AuthThrottle:
+    """The limiters guarding /login and /register, built from the app config.
+
+    Login attempts are counted per client IP and failed logins per email;
+    registrations per client IP. Each gunicorn worker keeps its own counts.
+    """
+
+    def __init__(self):
+        self._limiters  =  {}
+        self._lock  =  threading.Lock()
+
+    def _limiter(self, name):
+        limiter  =  self._limiters.get(name)
+        if limiter is None:
+            with self._lock:
+                limiter  =  self._limiters.get(name)
+                if limiter is None:
+                    limit, period  =  current_app.config[name]
+                    limiter  =  RateLimiter(limit, period)
+                    self._limiters[name]  =  limiter
+        return limiter
+
+    def login_attempt(self, ip, email):
+        """Seconds the caller must wait before this login is tried, or 0."""
+        return (
+            self._limiter('LOGIN_EMAIL_FAILURE_LIMIT').retry_after(email.strip().lower())
+            or self._limiter('LOGIN_IP_LIMIT').hit(ip)
+        )
+
+    def login_failed(self, email):
+        self._limiter('LOGIN_EMAIL_FAILURE_LIMIT').hit(email.strip().lower())
+
+    def login_succeeded(self, email):
+        self._limiter('LOGIN_EMAIL_FAILURE_LIMIT').reset(email.strip().lower())
+
+    def registration_attempt(self, ip):
+        return self._limiter('REGISTER_IP_LIMIT').hit(ip)
+
+
+auth_throttle  =  AuthThrottle()
@@ -0,0 +1,154 @@
+# Daily usage rollups behind the summary charts
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.models import db, DailyTotal, DailyUsage, ParkingLot
+from services.archive import history_tables
+
+
+SUMMARY_RANGES = (7, 30, 90, 365)
+UNKNOWN_LOT = 0
+
+
+def summary_range(days):
+    return days if days in SUMMARY_RANGES else SUMMARY_RANGES[0]
+
+
+def _upsert(model, keys, increments):
+    dialect_insert  =  pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement  =  dialect_insert(model).values(**keys, **increments)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements = list(keys),
+        set_ = {name: getattr(model, name) + value for name, value in increments.items()}
+    ))
+
+
+def _add_totals(into, totals):
+    for name, value in totals.items():
+        into[name] += value
+
+
+def record_releases(records, sign = 1):
+    """Fold a batch of PastReservations rows into the rollups.
+
+    Runs in the caller's transaction: one upsert per day, lot and user,
+    plus one per day for the daily totals. Parkings are counted on the day
+    they started and revenue/hours on the day they ended, matching what
+    the summary charts have always shown. ``sign = -1`` takes deleted rows
+    back out.
+    """
+    increments  =  defaultdict(lambda: defaultdict(float))
+    for record in records:
+        lot_id  =  record.lot_id or UNKNOWN_LOT
+        hours  =  (record.leaving_timestamp - record.parking_timestamp).total_seconds() / 3600
+        started  =  increments[(record.parking_timestamp.date(), lot_id, record.user_email)]
+        started['parkings'] += sign
+        ended  =  increments[(record.leaving_timestamp.date(), lot_id, record.user_email)]
+        ended['releases'] += sign
+        ended['revenue'] += sign * (record.total_cost or 0)
+        ended['parked_hours'] += sign * hours
+    daily  =  defaultdict(lambda: defaultdict(int))
+    for (day, lot_id, user_email), totals in increments.items():
+        totals  =  {name: int(value) if name in ('parkings', 'releases') else value for name, value in totals.items()}
+        _upsert(DailyUsage, {'day': day, 'lot_id': lot_id, 'user_email': user_email}, totals)
+        _add_totals(daily[day], totals)
+    for day, totals in daily.items():
+        _upsert(DailyTotal, {'day': day}, dict(totals))
+
+
+def hours_between(start, end):
+    """SQL expression for the hours from ``start`` to ``end``."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', end - start) / 3600
+    return (func.julianday(end) - func.julianday(start)) * 24
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def backfill_rollups():
+    """Rebuild the rollup tables from PastReservations and its archives, and commit.
+
+    History written before PastReservations carried a lot id is matched to
+    its lot by name, address and pincode; rows whose lot is gone are kept
+    under lot id 0.
+    """
+    rows  =  defaultdict(lambda: {'parkings': 0, 'releases': 0, 'revenue': 0.0, 'parked_hours': 0.0})
+    for table in history_tables():
+        history  =  table.c
+        matched_lot  =  (
+            select(ParkingLot.id)
+            .where(
+                ParkingLot.prime_location_name == history.lot_prime_location,
+                ParkingLot.address == history.address,
+                ParkingLot.pincode == history.pincode
+            )
+            .limit(1)
+            .scalar_subquery()
+        )
+        lot_id  =  func.coalesce(history.lot_id, matched_lot, UNKNOWN_LOT).label('lot_id')
+        hours  =  hours_between(history.parking_timestamp, history.leaving_timestamp)
+
+        # A parking and its release can sit in different monthly tables, so
+        # every table adds to the totals rather than setting them.
+        parking_day  =  func.date(history.parking_timestamp)
+        for day, lot, user_email, parkings in db.session.execute(
+            select(parking_day, lot_id, history.user_email, func.count())
+            .group_by(parking_day, lot_id, history.user_email)
+        ):
+            rows[(_as_date(day), lot, user_email)]['parkings'] += parkings
+
+        leaving_day  =  func.date(history.leaving_timestamp)
+        for day, lot, user_email, releases, revenue, parked_hours in db.session.execute(
+            select(leaving_day, lot_id, history.user_email, func.count(),
+                   func.coalesce(func.sum(history.total_cost), 0), func.coalesce(func.sum(hours), 0))
+            .group_by(leaving_day, lot_id, history.user_email)
+        ):
+            totals  =  rows[(_as_date(day), lot, user_email)]
+            totals['releases'] += releases
+            totals['revenue'] += revenue
+            totals['parked_hours'] += parked_hours
+
+    daily  =  defaultdict(lambda: {'parkings': 0, 'releases': 0, 'revenue': 0.0, 'parked_hours': 0.0})
+    for (day, _, _), totals in rows.items():
+        _add_totals(daily[day], totals)
+
+    db.session.execute(delete(DailyUsage))
+    db.session.execute(delete(DailyTotal))
+    if rows:
+        db.session.execute(insert(DailyUsage), [
+            {'day': day, 'lot_id': lot, 'user_email': user_email, **totals}
+            for (day, lot, user_email), totals in rows.items()
+        ])
+        db.session.execute(insert(DailyTotal), [{'day': day, **totals} for day, totals in daily.items()])
+    db.session.commit()
+    return len(rows)
+
+
+def daily_series(days, user_email = None):
+    """Per-day totals for the last ``days`` days (today included), oldest first.
+
+    Returns ``(dates, parkings, revenue)`` with zeros for days without
+    activity. The site-wide series reads one DailyTotal row per day; a
+    user's series sums that user's rows per day and lot.
+    """
+    today  =  date.today()
+    dates  =  [today - timedelta(days = offset) for offset in range(days - 1, -1, -1)]
+    if user_email is None:
+        query  =  (
+            db.session.query(DailyTotal.day, DailyTotal.parkings, DailyTotal.revenue)
+            .filter(DailyTotal.day >= dates[0])
+        )
+    else:
+        query  =  (
+            db.session.query(DailyUsage.day, func.sum(DailyUsage.parkings), func.sum(DailyUsage.revenue))
+            .filter(DailyUsage.user_email == user_email, DailyUsage.day >= dates[0])
+            .group_by(DailyUsage.day)
+        )
+    totals  =  {day: (parkings, revenue) for day, parkings, revenue in query}
+    parkings  =  [totals.get(day, (0, 0))[0] for day in dates]
+    revenue  =  [totals.get(day, (0, 0))[1] for day in dates]
+    return dates, parkings, revenue
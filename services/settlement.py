@@ -0,0 +1,373 @@
+# Release settlement: cost, history and rollups off the request path
+import logging
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, case, delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models.models import db, ParkingLot, ParkingSpot, PastReservations, PendingRelease, Reservation, User
+from services.bookings import booking_index, start_bookings
+from services.cache import LOTS, RESERVATIONS, cache
+from services.occupancy import adjust_occupancy
+from services.rollups import hours_between, record_releases
+
+
+SETTLEMENT_BATCH_SIZE = 200
+SETTLEMENT_POLL_SECONDS = 2
+SETTLEMENT_LEASE_SECONDS = 60
+
+settlement_log  =  logging.getLogger('settlement')
+
+
+def _free_spots(spot_ids, now):
+    # Mark the spots free and move their lots' counters, except spots that
+    # another reservation whose window has begun still holds
+    freed  =  db.session.scalars(
+        update(ParkingSpot)
+        .where(
+            ParkingSpot.id.in_(spot_ids),
+            ParkingSpot.is_reserved == True,
+            ~exists().where(
+                Reservation.spot_id == ParkingSpot.id,
+                Reservation.parking_timestamp <= now,
+                or_(Reservation.booked_until.is_(None), Reservation.booked_until > now),
+            ),
+        )
+        .values(is_reserved = False)
+        .returning(ParkingSpot.lot_id)
+        .execution_options(synchronize_session = False)
+    ).all()
+    for lot_id, released in Counter(freed).items():
+        adjust_occupancy(lot_id, -released)
+
+
+def release_reservation(reservation, user_email, leaving_timestamp = None):
+    """Free a reservation's spot and queue the release for settlement, in one commit.
+
+    Only the state change a new booking depends on happens here: the
+    reservation row is deleted, the spot marked free and the lot counter
+    moved. The lot's price and address are copied into the queue row so
+    the bill does not change if the lot is edited before settlement. A
+    booking cancelled before its window begins is not billed, so nothing
+    is queued for it. Returns False if the reservation was already
+    released by another request.
+    """
+    lot  =  reservation.spot.lot
+    leaving_timestamp  =  leaving_timestamp or datetime.now()
+    deleted  =  db.session.execute(
+        delete(Reservation)
+        .where(Reservation.id == reservation.id)
+        .execution_options(synchronize_session = False)
+    ).rowcount
+    if not deleted:
+        db.session.rollback()
+        return False
+    _free_spots([reservation.spot_id], leaving_timestamp)
+    if leaving_timestamp > reservation.parking_timestamp:
+        db.session.add(PendingRelease(
+            user_email = user_email,
+            lot_id = lot.id,
+            lot_prime_location = lot.prime_location_name,
+            address = lot.address,
+            pincode = lot.pincode,
+            price_per_hour = lot.price_per_hour,
+            parking_timestamp = reservation.parking_timestamp,
+            leaving_timestamp = leaving_timestamp,
+            vehicle_number = reservation.vehicle_number
+        ))
+    db.session.commit()
+    return True
+
+
+def release_reservations(user, reservation_ids = (), vehicle_numbers = (), leaving_timestamp = None):
+    """Release many of ``user``'s reservations at once, picked by id or vehicle number.
+
+    One SELECT snapshots the lots and works out every cost in the
+    database, then the reservations are deleted, their spots freed and the
+    lot counters moved with one statement each (one counter update per
+    lot), and the queue rows are written with a single multi-row INSERT,
+    all in one commit. Bookings whose window has not begun are cancelled
+    at no cost and not queued. Returns the released reservations with
+    their cost.
+    """
+    leaving_timestamp  =  leaving_timestamp or datetime.now()
+    if not reservation_ids and not vehicle_numbers:
+        return []
+    leaving  =  literal(leaving_timestamp, DateTime)
+    # Bookings cancelled before their window begins cost nothing
+    cost  =  case(
+        (Reservation.parking_timestamp < leaving, ParkingLot.price_per_hour * hours_between(Reservation.parking_timestamp, leaving)),
+        else_ = 0.0
+    )
+    rows  =  db.session.execute(
+        select(
+            Reservation.id, Reservation.spot_id, ParkingSpot.spot_number, Reservation.vehicle_number, Reservation.parking_timestamp,
+            ParkingLot.id.label('lot_id'), ParkingLot.prime_location_name, ParkingLot.address, ParkingLot.pincode,
+            ParkingLot.price_per_hour, cost.label('cost')
+        )
+        .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+        .join(ParkingLot, ParkingLot.id == ParkingSpot.lot_id)
+        .where(
+            Reservation.user_id == user.id,
+            or_(Reservation.id.in_(reservation_ids), Reservation.vehicle_number.in_(vehicle_numbers))
+        )
+    ).all()
+    if not rows:
+        return []
+    try:
+        # Only what this request actually deleted is released; a reservation
+        # released concurrently by another request drops out here.
+        deleted  =  set(db.session.scalars(
+            delete(Reservation)
+            .where(Reservation.id.in_([row.id for row in rows]), Reservation.user_id == user.id)
+            .returning(Reservation.id)
+            .execution_options(synchronize_session = False)
+        ))
+        rows  =  [row for row in rows if row.id in deleted]
+        if rows:
+            _free_spots([row.spot_id for row in rows], leaving_timestamp)
+        billed  =  [row for row in rows if row.parking_timestamp < leaving_timestamp]
+        if billed:
+            db.session.execute(insert(PendingRelease), [{
+                'user_email': user.email,
+                'lot_id': row.lot_id,
+                'lot_prime_location': row.prime_location_name,
+                'address': row.address,
+                'pincode': row.pincode,
+                'price_per_hour': row.price_per_hour,
+                'parking_timestamp': row.parking_timestamp,
+                'leaving_timestamp': leaving_timestamp,
+                'vehicle_number': row.vehicle_number,
+            } for row in billed])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+def expire_bookings(now = None):
+    """Release every booking whose window ended by ``now``, in one commit.
+
+    A booking nobody released is billed up to the end of its window and
+    its spot freed, as if it had been released then. Expired bookings are
+    also dropped from this process's interval trees. Returns the number
+    expired.
+    """
+    now  =  now or datetime.now()
+    rows  =  db.session.execute(
+        select(
+            Reservation.id, Reservation.spot_id, Reservation.vehicle_number, Reservation.parking_timestamp,
+            Reservation.booked_until, User.email, ParkingLot.id.label('lot_id'), ParkingLot.prime_location_name,
+            ParkingLot.address, ParkingLot.pincode, ParkingLot.price_per_hour
+        )
+        .join(User, User.id == Reservation.user_id)
+        .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+        .join(ParkingLot, ParkingLot.id == ParkingSpot.lot_id)
+        .where(Reservation.booked_until <= now)
+    ).all()
+    if not rows:
+        return 0
+    try:
+        # Workers of several processes may expire the same booking; only
+        # the one that deletes it bills it
+        deleted  =  set(db.session.scalars(
+            delete(Reservation)
+            .where(Reservation.id.in_([row.id for row in rows]), Reservation.booked_until <= now)
+            .returning(Reservation.id)
+            .execution_options(synchronize_session = False)
+        ))
+        rows  =  [row for row in rows if row.id in deleted]
+        if rows:
+            _free_spots([row.spot_id for row in rows], now)
+            db.session.execute(insert(PendingRelease), [{
+                'user_email': row.email,
+                'lot_id': row.lot_id,
+                'lot_prime_location': row.prime_location_name,
+                'address': row.address,
+                'pincode': row.pincode,
+                'price_per_hour': row.price_per_hour,
+                'parking_timestamp': row.parking_timestamp,
+                'leaving_timestamp': row.booked_until,
+                'vehicle_number': row.vehicle_number,
+            } for row in rows])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    for row in rows:
+        booking_index.remove(row.lot_id, row.id)
+    return len(rows)
+
+
+def _claim(batch_size, lease_seconds):
+    # Take unclaimed rows, and rows whose worker let its lease run out
+    # (it crashed or hung); the token identifies this claim only.
+    now  =  datetime.now()
+    token  =  uuid.uuid4().hex
+    claimable  =  (
+        select(PendingRelease.id)
+        .where(or_(PendingRelease.claimed_at.is_(None), PendingRelease.claimed_at < now - timedelta(seconds = lease_seconds)))
+        .order_by(PendingRelease.id)
+        .limit(batch_size)
+    )
+    claimed  =  db.session.execute(
+        update(PendingRelease)
+        .where(PendingRelease.id.in_(claimable))
+        .values(claimed_by = token, claimed_at = now)
+        .execution_options(synchronize_session = False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return []
+    return db.session.scalars(
+        select(PendingRelease).where(PendingRelease.claimed_by == token).order_by(PendingRelease.id)
+    ).all()
+
+
+def settle_batch(batch_size = SETTLEMENT_BATCH_SIZE, lease_seconds = SETTLEMENT_LEASE_SECONDS):
+    """Settle up to ``batch_size`` queued releases in one transaction.
+
+    The history rows, the rollup increments and the removal of the queue
+    rows commit together, so a worker that dies mid-batch leaves the whole
+    batch queued for the next one. A release that already has a history
+    row (a slow worker finishing after its lease was taken over) is only
+    dequeued, and the unique release_id index rejects a duplicate that
+    slips past that check. Returns the number of queue rows completed.
+    """
+    pending  =  _claim(batch_size, lease_seconds)
+    if not pending:
+        return 0
+    ids  =  [item.id for item in pending]
+    try:
+        settled  =  set(db.session.scalars(
+            select(PastReservations.release_id).where(PastReservations.release_id.in_(ids))
+        ))
+        records  =  []
+        for item in pending:
+            if item.id in settled:
+                continue
+            hours_parked  =  (item.leaving_timestamp - item.parking_timestamp).total_seconds() / 3600
+            records.append(PastReservations(
+                release_id = item.id,
+                user_email = item.user_email,
+                lot_id = item.lot_id,
+                lot_prime_location = item.lot_prime_location,
+                address = item.address,
+                pincode = item.pincode,
+                parking_timestamp = item.parking_timestamp,
+                leaving_timestamp = item.leaving_timestamp,
+                vehicle_number = item.vehicle_number,
+                total_cost = item.price_per_hour * hours_parked
+            ))
+        db.session.add_all(records)
+        record_releases(records)
+        db.session.execute(
+            delete(PendingRelease)
+            .where(PendingRelease.id.in_(ids))
+            .execution_options(synchronize_session = False)
+        )
+        db.session.commit()
+    except (IntegrityError, OperationalError):
+        # Lost a race with another worker or the database was busy; the
+        # rows stay claimed and are retried once the lease runs out.
+        db.session.rollback()
+        return 0
+    if records:
+        cache.invalidate(RESERVATIONS)
+    return len(ids)
+
+
+def settle_pending(batch_size = SETTLEMENT_BATCH_SIZE, lease_seconds = SETTLEMENT_LEASE_SECONDS):
+    """Settle batches until the queue has nothing left to claim."""
+    total  =  0
+    while True:
+        settled  =  settle_batch(batch_size, lease_seconds)
+        if not settled:
+            return total
+        total += settled
+
+
+def settle_due(batch_size = SETTLEMENT_BATCH_SIZE, lease_seconds = SETTLEMENT_LEASE_SECONDS):
+    """Expire ended bookings, mark begun ones, then settle the whole queue.
+
+    Returns the number of queue rows settled.
+    """
+    now  =  datetime.now()
+    if expire_bookings(now) + start_bookings(now):
+        cache.invalidate(LOTS)
+    return settle_pending(batch_size, lease_seconds)
+
+
+def queue_status():
+    """Number of queued releases and the time the oldest one was released."""
+    return db.session.execute(
+        select(func.count(), func.min(PendingRelease.leaving_timestamp)).select_from(PendingRelease)
+    ).one()
+
+
+class SettlementWorker:
+    """Drains the release queue of one app in a background thread.
+
+    Each process runs its own worker, started by the first request; the
+    claim leases let workers in several processes share one queue. A
+    release in this process wakes the worker at once, rows queued by other
+    processes are picked up every ``poll_seconds``. Every round also
+    expires and starts advance bookings (``settle_due``).
+    """
+
+    def __init__(self, app):
+        self.app  =  app
+        self.batch_size  =  app.config.get('SETTLEMENT_BATCH_SIZE', SETTLEMENT_BATCH_SIZE)
+        self.poll_seconds  =  app.config.get('SETTLEMENT_POLL_SECONDS', SETTLEMENT_POLL_SECONDS)
+        self.lease_seconds  =  app.config.get('SETTLEMENT_LEASE_SECONDS', SETTLEMENT_LEASE_SECONDS)
+        self._wake  =  threading.Event()
+        self._lock  =  threading.Lock()
+        self._thread  =  None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread  =  threading.Thread(target = self.run_forever, name = 'settlement', daemon = True)
+                self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                return settle_due(self.batch_size, self.lease_seconds)
+            except Exception:
+                settlement_log.exception('Settlement batch failed')
+                db.session.rollback()
+                return 0
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+def init_settlement(app):
+    """Start a settlement worker thread with the app's first request.
+
+    With SETTLEMENT_WORKER off no thread is started and queued releases
+    wait for a separate ``flask settlement run --follow`` process.
+    """
+    if not app.config.get('SETTLEMENT_WORKER', True):
+        return
+    worker  =  SettlementWorker(app)
+    app.extensions['settlement']  =  worker
+    app.before_request(worker.start)
+
+
+def notify_settlement(app):
+    """Wake this process's worker for a release that was just queued."""
+    worker  =  app.extensions.get('settlement')
+    if worker is not None:
+        worker.notify()
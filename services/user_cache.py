@@ -0,0 +1,81 @@
+# Authenticated-user cache and the g.current_user loader
+from flask import current_app, session
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from models.models import db, User
+from services.cache import TTLCache
+
+
+class UserCache:
+    """Process-wide cache of User rows keyed by id.
+
+    Entries are detached snapshots; ``get`` merges one into the current
+    session without a SELECT, so the returned user can be read, edited and
+    committed like a freshly queried one. Writers call ``invalidate``;
+    other worker processes see a change once their entry's TTL runs out.
+    """
+
+    def __init__(self):
+        self._cache  =  None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache  =  TTLCache(
+                maxsize = current_app.config.get('USER_CACHE_SIZE', 1024),
+                ttl = current_app.config.get('USER_CACHE_TTL', 60)
+            )
+        return self._cache
+
+    def _snapshot(self, user):
+        snapshot  =  User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        make_transient_to_detached(snapshot)
+        return snapshot
+
+    def put(self, user):
+        self.cache.set(user.id, self._snapshot(user))
+
+    def get(self, user_id):
+        snapshot  =  self.cache.get(user_id)
+        if snapshot is not None:
+            return db.session.merge(snapshot, load = False)
+        user  =  db.session.get(User, user_id)
+        if user is not None:
+            self.put(user)
+        return user
+
+    def invalidate(self, user_id):
+        self.cache.delete(user_id)
+
+
+user_cache  =  UserCache()
+
+
+def login_user(user):
+    session['user_id']  =  user.id
+    session['email']  =  user.email
+    session['is_admin']  =  user.is_admin
+    user_cache.put(user)
+
+
+def load_current_user():
+    user_id  =  session.get('user_id')
+    if user_id is None and 'email' in session:
+        # Sessions issued before the id was stored only carry the email
+        user  =  User.query.filter_by(email = session['email']).first()
+        if user is not None:
+            login_user(user)
+        return user
+    if user_id is None:
+        return None
+    user  =  user_cache.get(user_id)
+    if user is None:
+        # The account was deleted; drop the stale login
+        logout_user()
+    return user
+
+
+def logout_user():
+    session.pop('user_id', None)
+    session.pop('email', None)
+    session.pop('is_admin', None)
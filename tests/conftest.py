@@ -0,0 +1,77 @@
+# Shared fixtures: a fresh app and SQLite database per test
+import pytest
+from app import create_app, init_database
+from models.models import db, ParkingLot, User
+from services.allocation import allocator
+from services.bookings import booking_index
+from services.provisioning import provision_spots
+from services.rate_limit import auth_throttle
+from services.user_cache import user_cache
+
+
+PASSWORD = 'test-password'
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'test',
+    'SETTLEMENT_WORKER': False,
+    'AVAILABILITY_PUSH': False,
+    'CACHE_BACKEND': 'memory',
+    # Cheap hashes, computed inline
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'PASSWORD_HASH_WORKERS': 0,
+    'LOGIN_IP_LIMIT': (100000, 60),
+    'REGISTER_IP_LIMIT': (100000, 60),
+    'SQLITE_PRAGMAS': {'journal_mode': 'WAL', 'busy_timeout': 5000},
+}
+
+
+def make_app(database, **overrides):
+    """An app on the SQLite file ``database``, with no per-process state left from other tests."""
+    app  =  create_app(**{**TEST_CONFIG, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database}", **overrides})
+    allocator.reset()
+    booking_index.reset()
+    auth_throttle._limiters.clear()
+    with app.app_context():
+        user_cache.cache.clear()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app  =  make_app(tmp_path / 'test.db')
+    init_database(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_user(email, password = PASSWORD, is_admin = False):
+    user  =  User(email = email, name = email.split('@')[0], is_admin = is_admin)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_lot(spots, name = 'Central Lot', pincode = '560001', price_per_hour = 20):
+    lot  =  ParkingLot(
+        prime_location_name = name, address = f"1 Main Road, {name}", pincode = pincode,
+        max_spots = spots, price_per_hour = price_per_hour, available_spots = spots, reserved_spots = 0
+    )
+    db.session.add(lot)
+    db.session.flush()
+    provision_spots(lot.id, range(1, spots + 1))
+    db.session.commit()
+    return lot
+
+
+def login(client, email, password = PASSWORD):
+    response  =  client.post('/login', data = {'email': email, 'password': password})
+    assert response.status_code == 302
+    return response
@@ -0,0 +1,70 @@
+import threading
+from sqlalchemy import func, select, update
+from conftest import add_lot, add_user, login
+from models.models import db, ParkingLot, ParkingSpot, Reservation
+from services.allocation import SpotAllocator
+
+
+DRIVERS = 24
+SPOTS = 10
+
+
+def test_concurrent_bookings_never_share_a_spot(app):
+    lot_id  =  add_lot(SPOTS).id
+    clients  =  []
+    for driver in range(DRIVERS):
+        add_user(f"driver{driver}@example.com")
+        client  =  app.test_client()
+        login(client, f"driver{driver}@example.com")
+        clients.append(client)
+
+    start  =  threading.Barrier(DRIVERS)
+    statuses  =  [None] * DRIVERS
+
+    def book(driver):
+        start.wait()
+        response  =  clients[driver].post('/bookspot', data = {'lot_id': lot_id, 'vehicle_number': f"KA{driver:04d}"})
+        statuses[driver]  =  response.status_code
+
+    threads  =  [threading.Thread(target = book, args = (driver,)) for driver in range(DRIVERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # A booking either redirects to the dashboard or re-renders the form as full
+    assert all(status in (200, 302) for status in statuses), statuses
+    assert statuses.count(302) == SPOTS
+    db.session.expire_all()
+    reservations  =  db.session.scalars(select(Reservation)).all()
+    assert len(reservations) == SPOTS
+    assert len({reservation.spot_id for reservation in reservations}) == SPOTS
+    assert db.session.scalar(select(func.count()).where(ParkingSpot.lot_id == lot_id, ParkingSpot.is_reserved == True)) == SPOTS
+
+    lot  =  db.session.get(ParkingLot, lot_id)
+    assert lot.available_spots + lot.reserved_spots == lot.max_spots
+    assert lot.reserved_spots == SPOTS
+
+
+def test_a_stale_pool_is_refilled_instead_of_reporting_the_lot_full(app):
+    lot_id  =  add_lot(100).id
+    user  =  add_user('driver@example.com')
+    first, second  =  SpotAllocator(), SpotAllocator()
+
+    assert first.claim(lot_id, user.id, 'KA0000') is not None
+    # The other worker's pool starts from the same free ids, so it takes
+    # every spot the first worker still holds as a candidate
+    pooled  =  set(first._pools[lot_id])
+    taken  =  set()
+    while not pooled <= taken:
+        taken.add(second.claim(lot_id, user.id, f"KB{len(taken):04d}").spot_id)
+    assert len(taken) < 99
+
+    reservation  =  first.claim(lot_id, user.id, 'KA0001')
+    assert reservation is not None
+    assert reservation.spot_id not in taken
+
+    # With the lot really full, a fresh refill comes back empty
+    db.session.execute(update(ParkingSpot).where(ParkingSpot.lot_id == lot_id).values(is_reserved = True))
+    db.session.commit()
+    assert first.claim(lot_id, user.id, 'KA0002') is None
@@ -0,0 +1,37 @@
+from datetime import date, datetime, timedelta
+import pytest
+from conftest import add_lot, login
+from models.models import db, PastReservations
+from services.analytics import analytics_available
+
+
+pytestmark  =  pytest.mark.skipif(not analytics_available(), reason = "needs NumPy")
+
+
+def test_analytics_with_no_history(client):
+    lot  =  add_lot(4)
+    login(client, 'admin@gmail.com', 'admin123')
+
+    response  =  client.get('/admin/summary/analytics', query_string = {'days': 30})
+    assert response.status_code == 200
+    [entry]  =  response.get_json()['lots']
+    assert entry['lot_id'] == lot.id
+    assert entry['releases'] == 0
+    assert entry['revenue'] == 0
+
+
+def test_analytics_counts_history(client):
+    lot  =  add_lot(4)
+    left  =  datetime.combine(date.today() - timedelta(days = 2), datetime.min.time()) + timedelta(hours = 12)
+    db.session.add(PastReservations(
+        user_email = 'driver@example.com', lot_id = lot.id, lot_prime_location = lot.prime_location_name,
+        address = lot.address, pincode = lot.pincode, parking_timestamp = left - timedelta(hours = 2),
+        leaving_timestamp = left, vehicle_number = 'KA01AB1234', total_cost = 40.0
+    ))
+    db.session.commit()
+    login(client, 'admin@gmail.com', 'admin123')
+
+    [entry]  =  client.get('/admin/summary/analytics', query_string = {'days': 30}).get_json()['lots']
+    assert entry['releases'] == 1
+    assert entry['revenue'] == 40.0
+    assert entry['average_dwell_hours'] == 2.0
@@ -0,0 +1,31 @@
+import socket
+from services.availability import AvailabilityHub
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _response_head(port, origin):
+    with socket.create_connection(('127.0.0.1', port), timeout = 5) as connection:
+        connection.sendall(f"GET /events?lots=1 HTTP/1.1\r\nHost: localhost\r\nOrigin: {origin}\r\n\r\n".encode())
+        head  =  b''
+        while b'\r\n\r\n' not in head:
+            head += connection.recv(1024)
+    return head.split(b'\r\n\r\n')[0].decode()
+
+
+def test_hub_only_allows_configured_origins():
+    port  =  _free_port()
+    hub  =  AvailabilityHub('127.0.0.1', port, cors_origins = ['http://localhost:5000'])
+    assert hub.start()
+
+    allowed  =  _response_head(port, 'http://localhost:5000')
+    assert allowed.startswith('HTTP/1.1 200')
+    assert 'Access-Control-Allow-Origin: http://localhost:5000' in allowed
+
+    other  =  _response_head(port, 'http://elsewhere.example')
+    assert other.startswith('HTTP/1.1 200')
+    assert 'Access-Control-Allow-Origin' not in other
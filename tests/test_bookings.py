@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from conftest import add_lot, add_user, login
+from models.models import db, ParkingLot, ParkingSpot, PastReservations, PendingRelease, Reservation
+from services.allocation import allocator
+from services.bookings import book_spot, booking_index, start_bookings
+from services.settlement import expire_bookings, settle_due
+
+
+def _counters(lot_id):
+    db.session.expire_all()
+    lot  =  db.session.get(ParkingLot, lot_id)
+    return lot.available_spots, lot.reserved_spots
+
+
+def test_booking_ahead_leaves_the_spot_free_until_it_begins(app):
+    lot_id  =  add_lot(2).id
+    user  =  add_user('driver@example.com')
+    start  =  datetime.now() + timedelta(days = 2)
+    booking  =  book_spot(lot_id, user.id, 'KA01', start, start + timedelta(hours = 3))
+
+    assert booking is not None
+    assert db.session.get(ParkingSpot, booking.spot_id).is_reserved is False
+    assert _counters(lot_id) == (2, 0)
+
+    # A drive-in takes the other spot, never the one booked ahead
+    parked  =  allocator.claim(lot_id, user.id, 'KA02')
+    assert parked.spot_id != booking.spot_id
+    assert allocator.claim(lot_id, user.id, 'KA03') is None
+    assert _counters(lot_id) == (1, 1)
+
+    # Nothing changes before the window, then the spot is marked
+    assert start_bookings(start - timedelta(minutes = 1)) == 0
+    assert start_bookings(start) == 1
+    assert db.session.get(ParkingSpot, booking.spot_id).is_reserved is True
+    assert _counters(lot_id) == (0, 2)
+
+
+def test_bookings_of_one_spot_never_overlap(app):
+    lot_id  =  add_lot(1).id
+    user  =  add_user('driver@example.com')
+    start  =  datetime.now() + timedelta(days = 1)
+    assert book_spot(lot_id, user.id, 'KA01', start, start + timedelta(hours = 4)) is not None
+    assert book_spot(lot_id, user.id, 'KA02', start + timedelta(hours = 3), start + timedelta(hours = 5)) is None
+    assert book_spot(lot_id, user.id, 'KA03', start + timedelta(hours = 4), start + timedelta(hours = 6)) is not None
+    assert _counters(lot_id) == (1, 0)
+
+
+def test_booking_that_has_begun_holds_its_spot_at_once(app):
+    lot_id  =  add_lot(1).id
+    user  =  add_user('driver@example.com')
+    booking  =  book_spot(lot_id, user.id, 'KA01', datetime.now(), datetime.now() + timedelta(hours = 2))
+    assert db.session.get(ParkingSpot, booking.spot_id).is_reserved is True
+    assert _counters(lot_id) == (0, 1)
+
+
+def test_unreleased_booking_expires_and_is_billed_for_its_window(app):
+    lot_id  =  add_lot(1, price_per_hour = 10).id
+    user  =  add_user('driver@example.com')
+    start  =  datetime.now() + timedelta(minutes = 10)
+    end  =  start + timedelta(hours = 2)
+    booking  =  book_spot(lot_id, user.id, 'KA01', start, end)
+    booking_id  =  booking.id
+    start_bookings(start)
+    assert _counters(lot_id) == (0, 1)
+
+    assert expire_bookings(end - timedelta(minutes = 1)) == 0
+    assert expire_bookings(end) == 1
+    assert db.session.get(Reservation, booking_id) is None
+    assert _counters(lot_id) == (1, 0)
+    assert booking_index.free_spots(lot_id, start, end)
+    assert db.session.scalar(select(PendingRelease.leaving_timestamp)) == end
+
+    settle_due()
+    assert db.session.scalar(select(PastReservations.total_cost)) == 20.0
+
+
+def test_expiry_keeps_a_spot_held_by_the_next_booking(app):
+    lot_id  =  add_lot(1).id
+    user  =  add_user('driver@example.com')
+    start  =  datetime.now() + timedelta(hours = 1)
+    book_spot(lot_id, user.id, 'KA01', start, start + timedelta(hours = 2))
+    book_spot(lot_id, user.id, 'KA02', start + timedelta(hours = 2), start + timedelta(hours = 4))
+    start_bookings(start)
+
+    handover  =  start + timedelta(hours = 2)
+    assert expire_bookings(handover) == 1
+    assert start_bookings(handover) == 0
+    assert _counters(lot_id) == (0, 1)
+
+
+def test_admin_delete_releases_the_reservation(app, client):
+    lot_id  =  add_lot(1).id
+    user  =  add_user('driver@example.com')
+    parked  =  allocator.claim(lot_id, user.id, 'KA01', datetime.now() - timedelta(hours = 1))
+    reservation_id, spot_id  =  parked.id, parked.spot_id
+    assert _counters(lot_id) == (0, 1)
+
+    login(client, 'admin@gmail.com', 'admin123')
+    assert client.post('/admin/reservation/delete/', data = {'id': reservation_id}).status_code == 302
+    assert db.session.get(Reservation, reservation_id) is None
+    assert db.session.get(ParkingSpot, spot_id).is_reserved is False
+    assert _counters(lot_id) == (1, 0)
+    assert db.session.scalar(select(PendingRelease.vehicle_number)) == 'KA01'
+    assert allocator.claim(lot_id, user.id, 'KA02').spot_id == spot_id
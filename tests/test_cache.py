@@ -0,0 +1,32 @@
+import os
+import pytest
+from services.cache import SQLiteBackend
+
+
+def test_sqlite_backend_connects_on_first_use(tmp_path):
+    backend  =  SQLiteBackend(tmp_path / 'cache.db', 30)
+    assert backend._connection is None
+    backend.set('lots:0:list', [1, 2], None)
+    assert backend.get('lots:0:list') == [1, 2]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason = 'needs fork()')
+def test_sqlite_backend_reconnects_after_fork(tmp_path):
+    backend  =  SQLiteBackend(tmp_path / 'cache.db', 30)
+    backend.bump('lots')
+    inherited  =  backend._connection
+
+    pid  =  os.fork()
+    if pid == 0:
+        try:
+            backend.bump('lots')
+            backend.set('lots:2:list', 'from the worker', None)
+            os._exit(0 if backend._connection is not inherited else 1)
+        except BaseException:
+            os._exit(2)
+    _, status  =  os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    assert backend._connection is inherited
+    assert backend.generation('lots') == 2
+    assert backend.get('lots:2:list') == 'from the worker'
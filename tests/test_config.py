@@ -0,0 +1,14 @@
+import pytest
+from app import create_app
+from config import ProductionConfig
+from conftest import TEST_CONFIG
+
+
+def test_production_refuses_to_start_without_a_secret_key(monkeypatch, tmp_path):
+    monkeypatch.setattr(ProductionConfig, 'SECRET_KEY', None)
+    settings  =  {**TEST_CONFIG, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}"}
+    del settings['SECRET_KEY']
+    with pytest.raises(RuntimeError, match = 'SECRET_KEY'):
+        create_app('production', **settings)
+    app  =  create_app('production', **settings, SECRET_KEY = 'from-the-environment')
+    assert app.secret_key == 'from-the-environment'
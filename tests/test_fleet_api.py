@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, select
+from conftest import add_lot, add_user, login
+from models.models import db, PendingRelease, Reservation
+from services.allocation import allocator
+
+
+@pytest.fixture
+def fleet(app, client):
+    user  =  add_user('fleet@example.com')
+    login(client, 'fleet@example.com')
+    return user
+
+
+@pytest.mark.parametrize('path', ['/api/reservations/bulk', '/api/reservations/bulk-release'])
+def test_a_body_that_is_not_an_object_is_rejected(client, fleet, path):
+    assert client.post(path, json = [1, 2]).status_code == 400
+    assert client.post(path, data = 'not json', content_type = 'application/json').status_code == 400
+
+
+def test_booleans_are_not_ids(client, fleet):
+    add_lot(2)
+    response  =  client.post('/api/reservations/bulk', json = {'lot_id': True, 'vehicle_numbers': ['KA01']})
+    assert response.status_code == 400
+    response  =  client.post('/api/reservations/bulk-release', json = {'reservation_ids': [True]})
+    assert response.status_code == 400
+    assert db.session.scalar(select(func.count()).select_from(Reservation)) == 0
+
+
+def test_every_vehicle_placed(client, fleet):
+    add_lot(2, name = 'First', pincode = '560002')
+    add_lot(2, name = 'Second', pincode = '560002')
+    response  =  client.post('/api/reservations/bulk', json = {'pincode': '560002', 'vehicle_numbers': ['KA01', 'KA02', 'KA03']})
+    assert response.status_code == 201
+    body  =  response.get_json()
+    assert [row['vehicle_number'] for row in body['reserved']] == ['KA01', 'KA02', 'KA03']
+    assert body['unplaced'] == []
+
+
+def test_partial_placement(client, fleet):
+    lot_id  =  add_lot(2).id
+    response  =  client.post('/api/reservations/bulk', json = {'lot_id': lot_id, 'vehicle_numbers': ['KA01', 'KA02', 'KA03', 'KA01']})
+    assert response.status_code == 200
+    body  =  response.get_json()
+    assert body['requested'] == 3
+    assert len({row['spot_id'] for row in body['reserved']}) == 2
+    assert body['unplaced'] == ['KA03']
+
+
+def test_nothing_fits(client, fleet):
+    lot_id  =  add_lot(1).id
+    assert allocator.claim(lot_id, fleet.id, 'KA00') is not None
+    response  =  client.post('/api/reservations/bulk', json = {'lot_id': lot_id, 'vehicle_numbers': ['KA01', 'KA02']})
+    assert response.status_code == 409
+    assert response.get_json()['unplaced'] == ['KA01', 'KA02']
+
+
+def test_release_costs_each_vehicle_and_reports_unknown_ones(client, fleet):
+    lot_id  =  add_lot(3, price_per_hour = 10).id
+    now  =  datetime.now()
+    two_hours  =  allocator.claim(lot_id, fleet.id, 'KA01', now - timedelta(hours = 2))
+    assert allocator.claim(lot_id, fleet.id, 'KA02', now - timedelta(hours = 3)) is not None
+    two_hours_id  =  two_hours.id
+
+    response  =  client.post('/api/reservations/bulk-release', json = {
+        'reservation_ids': [two_hours_id, 9999], 'vehicle_numbers': ['KA02', 'XX99']
+    })
+    assert response.status_code == 200
+    body  =  response.get_json()
+    costs  =  {row['vehicle_number']: row['cost'] for row in body['released']}
+    assert costs == {'KA01': pytest.approx(20, abs = 0.05), 'KA02': pytest.approx(30, abs = 0.05)}
+    assert body['total_cost'] == pytest.approx(50, abs = 0.1)
+    assert body['not_found'] == [9999, 'XX99']
+    assert db.session.scalar(select(func.count()).select_from(Reservation)) == 0
+    assert db.session.scalar(select(func.count()).select_from(PendingRelease)) == 2
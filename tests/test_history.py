@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select
+from models.models import db, HistoryArchive, PastReservations
+from services import history
+from services.archive import archive_history, history_tables, month_start
+from services.history import history_page, stream_csv, stream_json
+
+
+def _left(days_ago, hour = 10):
+    return datetime.combine(date.today() - timedelta(days = days_ago), time(hour))
+
+
+def _seed():
+    """Eight rows for one user (five old enough to archive, two sharing a
+    timestamp) and two for another; returns the user's leaving times, newest first."""
+    leaving  =  [_left(1), _left(2), _left(3), _left(300), _left(300), _left(301), _left(400), _left(401)]
+    for index, left in enumerate(leaving):
+        db.session.add(PastReservations(
+            user_email = 'a@example.com', lot_id = 1, lot_prime_location = 'Central Lot', address = '1 Main Road',
+            pincode = '560001', parking_timestamp = left - timedelta(hours = 2), leaving_timestamp = left,
+            vehicle_number = f"KA{index:02d}", total_cost = 40.0
+        ))
+    for days_ago in (2, 400):
+        db.session.add(PastReservations(
+            user_email = 'b@example.com', lot_id = 1, lot_prime_location = 'Central Lot', address = '1 Main Road',
+            pincode = '560001', parking_timestamp = _left(days_ago, 8), leaving_timestamp = _left(days_ago),
+            vehicle_number = 'KB00', total_cost = 40.0
+        ))
+    db.session.commit()
+    return leaving
+
+
+def _hot_rows():
+    return db.session.scalar(select(func.count()).select_from(PastReservations))
+
+
+def test_archive_moves_old_months_once(app):
+    leaving  =  _seed()
+    moved  =  archive_history(180)
+
+    # The other user's row from 400 days ago goes with them
+    old  =  [left for left in leaving if left < _left(180)] + [_left(400)]
+    expected  =  dict(Counter(month_start(left.date()) for left in old))
+    assert moved == expected
+    assert _hot_rows() == 4
+    assert {entry.month: entry.rows for entry in db.session.scalars(select(HistoryArchive))} == expected
+    archived  =  sum(db.session.scalar(select(func.count()).select_from(table)) for table in list(history_tables())[1:])
+    assert archived == 6
+
+    assert archive_history(180) == {}
+    assert _hot_rows() == 4
+
+
+def test_pages_walk_the_live_table_then_the_archive(app):
+    leaving  =  _seed()
+    archive_history(180)
+
+    seen, cursor  =  [], None
+    while True:
+        records, cursor  =  history_page('a@example.com', cursor, page_size = 3)
+        seen += records
+        if cursor is None:
+            break
+    assert [record.leaving_timestamp for record in seen] == leaving
+    assert len({record.vehicle_number for record in seen}) == 8
+    assert history_page('a@example.com', page_size = 8)[1] is None
+
+
+def test_exports_cover_live_and_archived_rows(app, monkeypatch):
+    leaving  =  _seed()
+    archive_history(180)
+    monkeypatch.setattr(history, 'EXPORT_CHUNK_SIZE', 3)
+
+    rows  =  list(csv.DictReader(io.StringIO(''.join(stream_csv('a@example.com')))))
+    assert [row['leaving_timestamp'] for row in rows] == [left.isoformat() for left in leaving]
+
+    exported  =  json.loads(''.join(stream_json('a@example.com')))
+    assert [row['leaving_timestamp'] for row in exported] == [left.isoformat() for left in leaving]
+    assert {row['vehicle_number'] for row in exported} == {f"KA{index:02d}" for index in range(8)}
+
+    assert json.loads(''.join(stream_json('nobody@example.com'))) == []
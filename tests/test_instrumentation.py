@@ -0,0 +1,45 @@
+import time
+import pytest
+from app import init_database
+from conftest import login, make_app
+from models.models import db
+from services.instrumentation import StackSampler
+
+
+@pytest.fixture
+def client(tmp_path):
+    app  =  make_app(tmp_path / 'test.db', INSTRUMENTATION_ENABLED = True, METRICS_TOKEN = 'scrape-me',
+                     METRICS_ALLOWED_IPS = ('10.0.0.5',))
+    init_database(app)
+    with app.app_context():
+        yield app.test_client()
+        db.session.remove()
+
+
+def test_metrics_need_an_admin_a_token_or_an_allowed_ip(client):
+    remote  =  {'REMOTE_ADDR': '203.0.113.9'}
+    assert client.get('/login', environ_base = remote).status_code == 200
+    assert client.get('/metrics', environ_base = remote).status_code == 403
+    # Behind a reverse proxy every request comes from loopback
+    assert client.get('/metrics', environ_base = {'REMOTE_ADDR': '127.0.0.1'}).status_code == 403
+    assert client.get('/metrics', environ_base = remote, headers = {'Authorization': 'Bearer wrong'}).status_code == 403
+
+    scraped  =  client.get('/metrics', environ_base = remote, headers = {'Authorization': 'Bearer scrape-me'})
+    assert scraped.status_code == 200
+    assert 'http_requests_total{endpoint="routes_bp.login",status="200"} 1' in scraped.get_data(as_text = True)
+    assert client.get('/metrics', environ_base = {'REMOTE_ADDR': '10.0.0.5'}).status_code == 200
+
+    login(client, 'admin@gmail.com', 'admin123')
+    assert client.get('/metrics', environ_base = remote).status_code == 200
+
+
+def test_sampler_keeps_raw_stacks_and_folds_on_demand():
+    sampler  =  StackSampler(0.001)
+    samples  =  sampler.start()
+    deadline  =  time.monotonic() + 5
+    while not samples and time.monotonic() < deadline:
+        sum(range(1000))
+    assert sampler.stop() is samples
+    stack, _  =  samples.most_common(1)[0]
+    assert isinstance(stack, tuple)
+    assert 'test_sampler_keeps_raw_stacks_and_folds_on_demand' in StackSampler.folded(stack)
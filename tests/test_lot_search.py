@@ -0,0 +1,47 @@
+from sqlalchemy import text
+from conftest import add_lot
+from models.models import db
+from services.lot_search import search_lots
+from services.migrations import migrations_table, run_migrations
+from services.occupancy import adjust_occupancy
+
+
+def _index_blocks():
+    return db.session.scalar(text("SELECT count(*) FROM parking_lot_fts_data"))
+
+
+def test_counter_updates_leave_the_index_alone(app):
+    lot  =  add_lot(10, name = 'Koramangala Central')
+    blocks  =  _index_blocks()
+    for _ in range(200):
+        adjust_occupancy(lot.id, 1)
+        db.session.commit()
+        adjust_occupancy(lot.id, -1)
+        db.session.commit()
+    assert _index_blocks() == blocks
+
+
+def test_renamed_lot_is_reindexed(app):
+    lot  =  add_lot(10, name = 'Koramangala Central')
+    lot.prime_location_name  =  'Indiranagar North'
+    lot.address  =  '2 Main Road, Indiranagar'
+    db.session.commit()
+    assert search_lots('kora') == []
+    assert [found.id for found in search_lots('indira')] == [lot.id]
+
+
+def test_migration_replaces_the_old_update_trigger(app):
+    db.session.execute(text("DROP TRIGGER parking_lot_fts_au"))
+    db.session.execute(text(
+        "CREATE TRIGGER parking_lot_fts_au AFTER UPDATE ON parking_lot BEGIN "
+        "INSERT INTO parking_lot_fts(parking_lot_fts, rowid, prime_location_name, address, pincode) "
+        "VALUES ('delete', old.id, old.prime_location_name, old.address, old.pincode); "
+        "INSERT INTO parking_lot_fts(rowid, prime_location_name, address, pincode) "
+        "VALUES (new.id, new.prime_location_name, new.address, new.pincode); END"
+    ))
+    db.session.execute(migrations_table.delete().where(migrations_table.c.name == 'lot_search_update_trigger'))
+    db.session.commit()
+
+    assert run_migrations() == ['lot_search_update_trigger']
+    trigger  =  db.session.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'parking_lot_fts_au'"))
+    assert 'UPDATE OF prime_location_name, address, pincode' in trigger
@@ -0,0 +1,95 @@
+import sqlite3
+from sqlalchemy import inspect, select
+from app import init_database
+from conftest import make_app
+from models.models import db, ParkingLot, ParkingSpot, PastReservations, Reservation
+from services.migrations import MIGRATIONS, migrations_table
+
+
+# The schema the first release of the app created with db.create_all()
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER NOT NULL, email VARCHAR(255) NOT NULL, password VARCHAR(150) NOT NULL,
+    name VARCHAR(100), phone VARCHAR(10), address VARCHAR(255), pincode VARCHAR(10), is_admin BOOLEAN,
+    PRIMARY KEY (id)
+);
+CREATE TABLE parking_lot (
+    id INTEGER NOT NULL, prime_location_name VARCHAR(100) NOT NULL, address VARCHAR(255) NOT NULL,
+    pincode VARCHAR(10) NOT NULL, contact_number VARCHAR(15), max_spots INTEGER,
+    price_per_hour INTEGER NOT NULL, is_active BOOLEAN,
+    PRIMARY KEY (id)
+);
+CREATE TABLE past_reservations (
+    id INTEGER NOT NULL, user_email VARCHAR(255), lot_prime_location VARCHAR(100),
+    address VARCHAR(255) NOT NULL, pincode VARCHAR(10) NOT NULL, parking_timestamp DATETIME,
+    leaving_timestamp DATETIME, vehicle_number VARCHAR(20), total_cost FLOAT,
+    PRIMARY KEY (id)
+);
+CREATE TABLE parking_spot (
+    id VARCHAR(10) NOT NULL, lot_id INTEGER NOT NULL, is_reserved BOOLEAN,
+    PRIMARY KEY (id),
+    FOREIGN KEY(lot_id) REFERENCES parking_lot (id)
+);
+CREATE TABLE reservation (
+    id INTEGER NOT NULL, spot_id VARCHAR(10) NOT NULL, user_id INTEGER NOT NULL,
+    parking_timestamp DATETIME NOT NULL, vehicle_number VARCHAR(20),
+    PRIMARY KEY (id),
+    UNIQUE (spot_id),
+    FOREIGN KEY(spot_id) REFERENCES parking_spot (id),
+    FOREIGN KEY(user_id) REFERENCES user (id)
+);
+"""
+
+
+def seed_baseline(path):
+    connection  =  sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.execute("INSERT INTO user VALUES (1, 'driver@example.com', 'x', 'Driver', NULL, NULL, NULL, 0)")
+    connection.execute("INSERT INTO parking_lot VALUES (1, 'Central', 'Main Road', '560001', NULL, 3, 20, 1)")
+    for number in (1, 2, 3):
+        connection.execute("INSERT INTO parking_spot VALUES (?, 1, ?)", (f"L1_S{number}", number == 2))
+    connection.execute("INSERT INTO reservation VALUES (7, 'L1_S2', 1, '2026-10-01 10:00:00', 'KA01AB1234')")
+    connection.execute(
+        "INSERT INTO past_reservations VALUES (1, 'driver@example.com', 'Central', 'Main Road', '560001', "
+        "'2026-10-10 10:00:00', '2026-10-10 12:00:00', 'KA01AB9999', 40.0)"
+    )
+    connection.commit()
+    connection.close()
+
+
+def test_upgrade_from_baseline_schema(tmp_path):
+    path  =  tmp_path / 'baseline.db'
+    seed_baseline(path)
+    app  =  make_app(path)
+    init_database(app)
+
+    with app.app_context():
+        applied  =  set(db.session.scalars(select(migrations_table.c.name)))
+        assert applied == {name for name, _ in MIGRATIONS}
+
+        inspector  =  inspect(db.engine)
+        for model in (ParkingSpot, Reservation, PastReservations):
+            existing  =  {index['name'] for index in inspector.get_indexes(model.__tablename__)}
+            assert {index.name for index in model.__table__.indexes} <= existing
+
+        reservation  =  db.session.get(Reservation, 7)
+        assert reservation.spot.spot_number == 2
+        assert reservation.spot.lot_id == 1
+        assert reservation.booked_until is None
+        assert [(spot.spot_number, spot.is_reserved) for spot in db.session.scalars(select(ParkingSpot).order_by(ParkingSpot.spot_number))] \
+            == [(1, False), (2, True), (3, False)]
+
+        lot  =  db.session.get(ParkingLot, 1)
+        assert (lot.available_spots, lot.reserved_spots) == (2, 1)
+        assert db.session.scalar(select(PastReservations.total_cost)) == 40.0
+
+
+def test_upgrade_is_run_once(tmp_path):
+    path  =  tmp_path / 'baseline.db'
+    seed_baseline(path)
+    init_database(make_app(path))
+
+    app  =  make_app(path)
+    init_database(app)
+    with app.app_context():
+        assert db.session.scalar(select(db.func.count()).select_from(Reservation)) == 1
@@ -0,0 +1,57 @@
+import multiprocessing
+import time
+import pytest
+from config import get_config
+from conftest import make_app
+from services.passwords import HashingBusy, _start_method, hasher
+
+
+@pytest.fixture
+def pooled(tmp_path):
+    app  =  make_app(tmp_path / 'test.db', PASSWORD_HASH_WORKERS = 1, PASSWORD_HASH_QUEUE = 0, PASSWORD_HASH_TIMEOUT = 0.2)
+    with app.app_context():
+        yield
+    if hasher._pool is not None:
+        hasher._pool.shutdown(cancel_futures = True)
+        hasher._pool  =  None
+
+
+def test_a_timed_out_job_keeps_its_slot_until_it_finishes(pooled):
+    with pytest.raises(HashingBusy):
+        hasher._run(time.sleep, 2)
+    # The sleep is still running in the pool, so the only slot is taken
+    assert not hasher._slots.acquire(blocking = False)
+
+    deadline  =  time.monotonic() + 30
+    while True:
+        try:
+            assert hasher._run(abs, -1) == 1
+            break
+        except HashingBusy:
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+
+
+def test_needs_rehash_compares_method_and_salt_length(app):
+    stored  =  hasher.hash('secret')
+    assert not hasher.needs_rehash(stored)
+    assert hasher.verify(stored, 'secret')
+
+    app.config['PASSWORD_SALT_LENGTH']  =  24
+    assert hasher.needs_rehash(stored)
+    assert hasher.verify(stored, 'secret')
+    fresh  =  hasher.hash('secret')
+    assert not hasher.needs_rehash(fresh)
+
+    app.config['PASSWORD_HASH_METHOD']  =  'pbkdf2:sha256:2000'
+    assert hasher.needs_rehash(fresh)
+
+
+def test_pool_falls_back_to_spawn_without_forkserver(monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert _start_method() == 'spawn'
+
+
+def test_development_hashes_inline():
+    assert get_config('development').PASSWORD_HASH_WORKERS == 0
+    assert get_config('production').PASSWORD_HASH_WORKERS > 0
@@ -0,0 +1,70 @@
+# Every budgeted view, run with ENFORCE_QUERY_BUDGETS so going over budget fails
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from app import init_database
+from conftest import add_lot, add_user, login, make_app
+from models.models import db, PastReservations, Reservation
+from services.allocation import allocator
+
+
+@pytest.fixture
+def app(tmp_path):
+    app  =  make_app(tmp_path / 'test.db', ENFORCE_QUERY_BUDGETS = True)
+    init_database(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def driver(app, client):
+    # Several reservations spread over several lots, and some history, so a
+    # per-row lazy load would show up as extra queries
+    user  =  add_user('fleet@example.com')
+    lots  =  [add_lot(5, name = f"Central Lot {n}", pincode = f"56000{n}") for n in range(3)]
+    for n in range(6):
+        allocator.claim(lots[n % 3].id, user.id, f"KA{n:04d}")
+    now  =  datetime.now()
+    for n in range(12):
+        lot  =  lots[n % 3]
+        db.session.add(PastReservations(
+            user_email = user.email, lot_id = lot.id, lot_prime_location = lot.prime_location_name,
+            address = lot.address, pincode = lot.pincode, parking_timestamp = now - timedelta(hours = n + 2),
+            leaving_timestamp = now - timedelta(hours = n + 1), vehicle_number = f"KB{n:04d}", total_cost = 20.0
+        ))
+    db.session.commit()
+    login(client, user.email)
+    return user
+
+
+def _reservation_id(user):
+    return db.session.scalar(select(Reservation.id).where(Reservation.user_id == user.id).limit(1))
+
+
+def test_dashboard(client, driver):
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_search(client, driver):
+    assert client.get('/search', query_string = {'query': 'central'}).status_code == 200
+    # Served from the cached fragment the second time
+    assert client.get('/search', query_string = {'query': 'central'}).status_code == 200
+
+
+def test_releasing_confirmation(client, driver):
+    response  =  client.post('/releasing-confirmation', data = {'reservation_id': _reservation_id(driver)})
+    assert response.status_code == 200
+
+
+def test_releasespot(client, driver):
+    reservation_id  =  _reservation_id(driver)
+    assert client.post('/release', data = {'reservation_id': reservation_id}).status_code == 302
+    assert db.session.get(Reservation, reservation_id) is None
+
+
+def test_lots_availability(client, driver):
+    response  =  client.get('/api/lots/availability')
+    assert response.status_code == 200
+    assert len(response.get_json()['lots']) == 3
+    assert client.get('/api/lots/availability', query_string = {'pincode': '560001'}).status_code == 200
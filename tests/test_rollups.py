@@ -0,0 +1,76 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select
+from conftest import add_lot, login
+from models.models import db, DailyTotal, PastReservations
+from services.migrations import daily_totals
+from services.rollups import backfill_rollups, daily_series, record_releases
+
+
+def _history(lot_id, user_email, started, hours, cost):
+    record  =  PastReservations(
+        user_email = user_email, lot_id = lot_id, lot_prime_location = 'Central Lot', address = '1 Main Road',
+        pincode = '560001', parking_timestamp = started, leaving_timestamp = started + timedelta(hours = hours),
+        vehicle_number = 'KA01', total_cost = cost
+    )
+    db.session.add(record)
+    return record
+
+
+def _seed():
+    morning  =  datetime.combine(date.today(), time(8))
+    first, second  =  add_lot(3, name = 'First').id, add_lot(3, name = 'Second').id
+    records  =  [
+        _history(first, 'a@example.com', morning - timedelta(days = 2), 2, 40),
+        _history(second, 'a@example.com', morning - timedelta(days = 2), 1, 20),
+        _history(first, 'b@example.com', morning - timedelta(days = 1), 3, 60),
+        _history(second, 'c@example.com', morning, 1, 15),
+    ]
+    db.session.flush()
+    record_releases(records)
+    db.session.commit()
+    return records
+
+
+def test_site_series_reads_one_row_per_day(app):
+    _seed()
+    assert db.session.scalar(select(db.func.count()).select_from(DailyTotal)) == 3
+
+    dates, parkings, revenue  =  daily_series(7)
+    assert parkings[-3:] == [2, 1, 1]
+    assert revenue[-3:] == [60, 60, 15]
+    assert sum(parkings) == 4
+
+    _, user_parkings, user_revenue  =  daily_series(7, user_email = 'a@example.com')
+    assert user_parkings[-3:] == [2, 0, 0]
+    assert user_revenue[-3:] == [60, 0, 0]
+
+
+def test_backfill_and_migration_agree_with_the_live_totals(app):
+    _seed()
+    live  =  daily_series(30)
+    backfill_rollups()
+    assert daily_series(30) == live
+    daily_totals()
+    assert daily_series(30) == live
+
+
+def test_removed_rows_are_taken_back_out(app):
+    records  =  _seed()
+    record_releases(records[:2], sign = -1)
+    db.session.commit()
+    _, parkings, revenue  =  daily_series(7)
+    assert parkings[-3:] == [0, 1, 1]
+    assert revenue[-3:] == [0, 60, 15]
+
+
+def test_admin_history_delete_updates_the_rollups(app, client):
+    records  =  _seed()
+    login(client, 'admin@gmail.com', 'admin123')
+    response  =  client.post('/admin/pastreservations/delete/', data = {'id': records[2].id})
+    assert response.status_code == 302
+    assert db.session.get(PastReservations, records[2].id) is None
+    _, parkings, revenue  =  daily_series(7)
+    assert parkings[-3:] == [2, 0, 1]
+    assert revenue[-3:] == [60, 0, 15]
+    _, parkings, _  =  daily_series(7, user_email = 'b@example.com')
+    assert sum(parkings) == 0